@@ -0,0 +1,224 @@
+"""
+Статистика использования бота с фиксированным объемом памяти
+
+Для каждого действия (кнопки и команды) ведутся счетчики по дням, а число уникальных
+пользователей за день и за месяц оценивается HyperLogLog: 4 КиБ регистров на период
+с погрешностью около 1.6% при любом числе пользователей. Хранятся только последние
+ANALYTICS_DAYS дней и ANALYTICS_MONTHS месяцев.
+
+Запись события - несколько операций со словарями в памяти. На диск накопленное
+сбрасывается пачкой раз в ANALYTICS_FLUSH_INTERVAL секунд: файл читается под
+блокировкой, счетчики складываются, регистры HyperLogLog объединяются максимумом,
+поэтому несколько воркеров могут писать в один файл.
+"""
+
+import os
+import json
+import math
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_FILE = os.getenv('ANALYTICS_FILE', 'bot_analytics.json')
+# Как часто сбрасывать статистику на диск, в секундах
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv('ANALYTICS_FLUSH_INTERVAL', '60'))
+# Сколько последних дней и месяцев хранить
+ANALYTICS_DAYS = 31
+ANALYTICS_MONTHS = 12
+# Точность HyperLogLog: 2^12 регистров
+HLL_PRECISION = 12
+
+MOSCOW_TZ = ZoneInfo("Europe/Moscow")
+
+class HyperLogLog:
+    """Оценка числа уникальных значений в фиксированном объеме памяти"""
+
+    __slots__ = ('precision', 'registers')
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(1 << precision)
+
+    def add(self, value):
+        digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+        hashed = int.from_bytes(digest, 'big')
+        index = hashed >> (64 - self.precision)
+        remainder_bits = 64 - self.precision
+        remainder = hashed & ((1 << remainder_bits) - 1)
+        rank = remainder_bits - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """Объединяет с другим счетчиком (максимум по регистрам)"""
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        """Оценка числа уникальных значений"""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        # Для малых значений точнее линейный подсчет по пустым регистрам
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def to_text(self):
+        return base64.b64encode(bytes(self.registers)).decode('ascii')
+
+    @classmethod
+    def from_text(cls, text):
+        registers = base64.b64decode(text)
+        return cls(int(math.log2(len(registers))), registers)
+
+def _trim(periods, keep):
+    """Оставляет keep последних периодов (ключи - строки дат, сортируются по времени)"""
+    for key in sorted(periods)[:-keep]:
+        del periods[key]
+
+class UsageAnalytics:
+    """Счетчики действий и оценки уникальных пользователей с пакетной записью на диск"""
+
+    def __init__(self, path=ANALYTICS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._flushed = {}
+        self._daily = {}
+        self._monthly = {}
+        self.last_flush = None
+
+    def record(self, action, user_id, now=None):
+        """Учитывает действие пользователя"""
+        now = datetime.now(MOSCOW_TZ) if now is None else now
+        day = now.strftime('%Y-%m-%d')
+        month = day[:7]
+        with self._lock:
+            self._pending.setdefault(day, Counter())[action] += 1
+            if day not in self._daily:
+                self._daily[day] = HyperLogLog()
+                _trim(self._daily, ANALYTICS_DAYS)
+            if month not in self._monthly:
+                self._monthly[month] = HyperLogLog()
+                _trim(self._monthly, ANALYTICS_MONTHS)
+            self._daily[day].add(user_id)
+            self._monthly[month].add(user_id)
+
+    def _read_file(self, f):
+        f.seek(0)
+        content = f.read()
+        if not content:
+            return {'counts': {}, 'daily': {}, 'monthly': {}}
+        return json.loads(content)
+
+    def flush(self):
+        """Сбрасывает накопленное в файл; возвращает число записанных событий"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                daily = {day: HyperLogLog(registers=hll.registers) for day, hll in self._daily.items()}
+                monthly = {month: HyperLogLog(registers=hll.registers) for month, hll in self._monthly.items()}
+
+            try:
+                with open(self.path, 'a+', encoding='utf-8') as f:
+                    # Блокировка файла нужна, когда в него пишут несколько воркеров
+                    if fcntl:
+                        fcntl.flock(f, fcntl.LOCK_EX)
+                    stored = self._read_file(f)
+
+                    counts = {day: Counter(actions) for day, actions in stored['counts'].items()}
+                    for day, actions in pending.items():
+                        counts.setdefault(day, Counter()).update(actions)
+                    for local, stored_periods in ((daily, stored['daily']), (monthly, stored['monthly'])):
+                        for period, text in stored_periods.items():
+                            if period in local:
+                                local[period].merge(HyperLogLog.from_text(text))
+                            else:
+                                local[period] = HyperLogLog.from_text(text)
+                    _trim(counts, ANALYTICS_DAYS)
+                    _trim(daily, ANALYTICS_DAYS)
+                    _trim(monthly, ANALYTICS_MONTHS)
+
+                    f.seek(0)
+                    f.truncate()
+                    json.dump({
+                        'counts': counts,
+                        'daily': {day: hll.to_text() for day, hll in daily.items()},
+                        'monthly': {month: hll.to_text() for month, hll in monthly.items()}
+                    }, f)
+                    f.flush()
+            except Exception as e:
+                # Несохраненные счетчики возвращаются и попадут в следующий сброс
+                with self._lock:
+                    for day, actions in pending.items():
+                        self._pending.setdefault(day, Counter()).update(actions)
+                logger.warning(f"⚠️ Не удалось сохранить статистику в {self.path}: {e}")
+                return 0
+
+            with self._lock:
+                # Оценки уникальных теперь включают данные других воркеров
+                for day, hll in daily.items():
+                    if day in self._daily:
+                        self._daily[day].merge(hll)
+                    else:
+                        self._daily[day] = hll
+                for month, hll in monthly.items():
+                    if month in self._monthly:
+                        self._monthly[month].merge(hll)
+                    else:
+                        self._monthly[month] = hll
+                _trim(self._daily, ANALYTICS_DAYS)
+                _trim(self._monthly, ANALYTICS_MONTHS)
+                self._flushed = counts
+            self.last_flush = time.time()
+            return sum(sum(actions.values()) for actions in pending.values())
+
+    def stats(self, days=7):
+        """Статистика за последние days дней и по месяцам для /stats"""
+        with self._lock:
+            counts = {day: Counter(actions) for day, actions in self._flushed.items()}
+            for day, actions in self._pending.items():
+                counts.setdefault(day, Counter()).update(actions)
+            daily_uniques = {day: hll.count() for day, hll in self._daily.items()}
+            monthly_uniques = {month: hll.count() for month, hll in self._monthly.items()}
+
+        recent_days = sorted(set(counts) | set(daily_uniques))[-days:]
+        return {
+            'days': {
+                day: {'actions': dict(counts.get(day, {})), 'unique_users': daily_uniques.get(day, 0)}
+                for day in recent_days
+            },
+            'months': {month: {'unique_users': uniques} for month, uniques in sorted(monthly_uniques.items())},
+            'last_flush': self.last_flush
+        }
+
+    async def run_flusher(self):
+        """Периодический сброс на диск; файловый ввод-вывод выполняется вне event loop"""
+        try:
+            # Первый сброс подгружает сохраненную статистику других запусков и воркеров
+            await asyncio.to_thread(self.flush)
+            while True:
+                await asyncio.sleep(ANALYTICS_FLUSH_INTERVAL)
+                await asyncio.to_thread(self.flush)
+        except asyncio.CancelledError:
+            # При остановке процессора накопленное не теряется
+            self.flush()
+            raise
+
+# Общий для процесса сборщик статистики
+usage_analytics = UsageAnalytics()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарки горячих путей бота
+Импортирует main напрямую и замеряет функции расписания, календаря и хранилища пользователей.
+Результаты сохраняются в JSON, чтобы сравнивать регрессии между коммитами.
+
+Примеры:
+    python benchmark_bot.py
+    python benchmark_bot.py --quick --output bench_new.json --compare bench_old.json
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+from zoneinfo import ZoneInfo
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import main
+from schedule_model import compile_schedule, dump_snapshot, load_snapshot
+from state_backend import MemoryBackend, SQLiteBackend, get_backend, set_backend
+
+WEEKDAYS = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
+
+# Размеры расписания: количество пар в учебный день
+SCHEDULE_SIZES = {
+    'small': 2,
+    'medium': 4,
+    'large': 8
+}
+
+# Количество пользователей для замеров add_user
+USER_COUNTS = [1_000, 10_000, 100_000, 1_000_000]
+
+def build_synthetic_schedule(classes_per_day):
+    """Строит расписание в формате SCHEDULE_JSON с заданным количеством пар в день"""
+    weeks = []
+    for week_type in (1, 2):
+        days = []
+        for day_index, day_name in enumerate(WEEKDAYS):
+            if day_index == 6:
+                days.append({'day': day_name, 'classes': [], 'note': 'Выходной'})
+                continue
+
+            classes = []
+            start = 8 * 60 + 20
+            for class_index in range(classes_per_day):
+                if class_index == 2 and classes_per_day > 3:
+                    classes.append({'window': class_index + 1, 'duration': '1ч 30м'})
+                else:
+                    end = start + 90
+                    classes.append({
+                        'subject': f"Дисциплина {week_type}-{day_index}-{class_index}",
+                        'time': f"{start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d}",
+                        'room': str(1400 + class_index),
+                        'address': "Кронверкский пр., д.49, лит.А"
+                    })
+                start += 100
+            days.append({'day': day_name, 'classes': classes})
+        weeks.append({'week': week_type, 'days': days})
+    return {'schedule': weeks}
+
+def measure(func, repeat=5, min_time=0.2):
+    """Замеряет время одного вызова функции в микросекундах"""
+    # Подбираем число вызовов так, чтобы один прогон занимал не меньше min_time
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - started) / number)
+
+    return {
+        'number': number,
+        'repeat': repeat,
+        'min_us': round(min(samples) * 1e6, 3),
+        'median_us': round(statistics.median(samples) * 1e6, 3),
+        'max_us': round(max(samples) * 1e6, 3)
+    }
+
+def bench_schedule(size_name, classes_per_day, repeat, min_time):
+    """Замеры функций расписания и календаря для одного размера расписания"""
+    schedule = build_synthetic_schedule(classes_per_day)
+    schedule_json = json.dumps(schedule, ensure_ascii=False)
+    snapshot = dump_snapshot(compile_schedule(schedule))
+    main.set_schedule(schedule)
+
+    moscow_tz = ZoneInfo("Europe/Moscow")
+    target_date = datetime(2025, 10, 15, 12, 0, tzinfo=moscow_tz)
+    sample_class = main.SCHEDULE_DATA['schedule'][0]['days'][0]['classes'][0]
+
+    cases = {
+        'get_schedule_for_date(today)': lambda: main.get_schedule_for_date(),
+        'get_schedule_for_date(date_str)': lambda: main.get_schedule_for_date("15.10"),
+        'get_week_schedule': main.get_week_schedule,
+        'get_current_week_type(now)': main.get_current_week_type,
+        'get_current_week_type(date)': lambda: main.get_current_week_type(target_date),
+        'format_class_info': lambda: main.format_class_info(sample_class),
+        'load(json+compile)': lambda: compile_schedule(json.loads(schedule_json)),
+        'load(snapshot)': lambda: load_snapshot(snapshot)
+    }
+
+    results = {}
+    for name, func in cases.items():
+        results[name] = measure(func, repeat, min_time)
+        print(f"   {size_name:>6} | {name:<34} {results[name]['median_us']:>12.3f} мкс")
+    return results
+
+def bench_users(user_count, repeat, min_time):
+    """Замеры add_user при заданном количестве уже сохраненных пользователей"""
+    original_backend = get_backend()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backends = {
+            'memory': lambda: MemoryBackend(os.path.join(tmp_dir, "bot_users.pkl")),
+            'sqlite': lambda: SQLiteBackend(os.path.join(tmp_dir, "bot_state.db"))
+        }
+        try:
+            for backend_name, create in backends.items():
+                set_backend(create())
+                main.save_users(set(range(1, user_count + 1)))
+
+                # Новый пользователь добавляется каждый вызов, существующий - повторно
+                new_ids = iter(range(user_count + 1, user_count + 10_000_000))
+                results[f'add_user(new)[{backend_name}]'] = measure(lambda: main.add_user(next(new_ids)), repeat, min_time)
+                results[f'add_user(existing)[{backend_name}]'] = measure(lambda: main.add_user(1), repeat, min_time)
+        finally:
+            set_backend(original_backend)
+
+    for name, result in results.items():
+        print(f"   {user_count:>9} | {name:<32} {result['median_us']:>14.3f} мкс")
+    return results
+
+def get_git_revision():
+    """Возвращает хеш текущего коммита, если доступен git"""
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        if result.returncode == 0:
+            return result.stdout.strip()
+    except Exception:
+        pass
+    return None
+
+def compare_results(current, baseline_path, threshold):
+    """Сравнивает результаты с сохраненным файлом и печатает регрессии"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    print(f"\n📊 Сравнение с {baseline_path} (коммит {baseline.get('meta', {}).get('git_revision')})")
+    regressions = 0
+    for group, cases in current['results'].items():
+        for size, metrics in cases.items():
+            for name, result in metrics.items():
+                old = baseline.get('results', {}).get(group, {}).get(size, {}).get(name)
+                if not old:
+                    continue
+                ratio = result['median_us'] / old['median_us'] if old['median_us'] else 1.0
+                status = "❌" if ratio > 1 + threshold else "✅"
+                if ratio > 1 + threshold:
+                    regressions += 1
+                print(f"   {status} {group}/{size}/{name}: {old['median_us']:.3f} → {result['median_us']:.3f} мкс (x{ratio:.2f})")
+
+    return regressions
+
+def main_cli():
+    """Точка входа бенчмарков"""
+    parser = argparse.ArgumentParser(description="Микробенчмарки бота расписания ИТМО")
+    parser.add_argument('--output', default='bench_results.json', help="Файл для сохранения результатов")
+    parser.add_argument('--compare', help="JSON с предыдущими результатами для сравнения")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Допустимое замедление при сравнении (0.2 = 20%%)")
+    parser.add_argument('--max-users', type=int, default=max(USER_COUNTS), help="Максимальное количество пользователей")
+    parser.add_argument('--quick', action='store_true', help="Быстрый прогон с меньшим числом повторов")
+    args = parser.parse_args()
+
+    # Логи сохранения пользователей искажают замеры
+    logging.disable(logging.INFO)
+
+    repeat = 3 if args.quick else 5
+    min_time = 0.05 if args.quick else 0.2
+
+    print("⏱️ МИКРОБЕНЧМАРКИ БОТА РАСПИСАНИЯ")
+    print("=" * 60)
+
+    results = {'schedule': {}, 'users': {}}
+    original_schedule = (main.SCHEDULE_DATA, main.COMPILED_SCHEDULE)
+    try:
+        print("\n📅 Расписание и календарь:")
+        for size_name, classes_per_day in SCHEDULE_SIZES.items():
+            results['schedule'][size_name] = bench_schedule(size_name, classes_per_day, repeat, min_time)
+    finally:
+        main.SCHEDULE_DATA, main.COMPILED_SCHEDULE = original_schedule
+
+    print("\n👥 Хранилище пользователей:")
+    for user_count in USER_COUNTS:
+        if user_count > args.max_users:
+            continue
+        results['users'][str(user_count)] = bench_users(user_count, repeat, min_time)
+
+    report = {
+        'meta': {
+            'git_revision': get_git_revision(),
+            'created_at': datetime.now(ZoneInfo("UTC")).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'quick': args.quick
+        },
+        'results': results
+    }
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Результаты сохранены в {args.output}")
+
+    if args.compare:
+        regressions = compare_results(report, args.compare, args.threshold)
+        if regressions:
+            print(f"\n❌ Найдено регрессий: {regressions}")
+            return False
+        print("\n✅ Регрессий не найдено")
+
+    return True
+
+if __name__ == "__main__":
+    success = main_cli()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,210 @@
+"""
+Рассылки администратора с сохранением прогресса
+
+Задание рассылки хранится в хранилище состояния: текст, курсор по отсортированным
+id пользователей, счетчики и статус (running, paused, cancelled, done). Пользователи
+обходятся пачками; после каждой пачки курсор сохраняется, поэтому после перезапуска
+процесса рассылка продолжается с места остановки (повторно может уйти не больше
+одной пачки). Прогресс показывается в одном сообщении администратору, которое
+редактируется не чаще BROADCAST_STATUS_INTERVAL секунд.
+"""
+
+import os
+import time
+import uuid
+import bisect
+import asyncio
+import logging
+import contextvars
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from delivery import RateLimitedSender, SENT
+from state_backend import get_backend
+
+logger = logging.getLogger(__name__)
+
+# Telegram id администраторов через запятую
+ADMIN_IDS = {int(admin_id) for admin_id in os.getenv('ADMIN_IDS', '').replace(' ', '').split(',') if admin_id}
+# Сколько пользователей обрабатывается между сохранениями курсора
+BROADCAST_CHUNK = int(os.getenv('BROADCAST_CHUNK', '100'))
+# Как часто обновлять сообщение с прогрессом, в секундах
+BROADCAST_STATUS_INTERVAL = 3
+# Задание, владелец которого не отмечался дольше стольких секунд, считается брошенным
+BROADCAST_LEASE = 60
+
+# Задание хранится в хранилище состояния под этим ключом
+BROADCAST_STATE_KEY = 'broadcast'
+
+RUNNING = 'running'
+PAUSED = 'paused'
+CANCELLED = 'cancelled'
+DONE = 'done'
+
+STATUS_LABELS = {
+    RUNNING: '▶️ идет',
+    PAUSED: '⏸ на паузе',
+    CANCELLED: '✖️ отменена',
+    DONE: '✅ завершена'
+}
+
+def is_admin(user_id):
+    return user_id in ADMIN_IDS
+
+def load_job():
+    """Текущее задание рассылки или None"""
+    return get_backend().get_state(BROADCAST_STATE_KEY, 'job')
+
+def save_job(job):
+    get_backend().set_state(BROADCAST_STATE_KEY, 'job', dict(job))
+
+def format_job_status(job):
+    """Текст сообщения с прогрессом рассылки"""
+    processed = job['sent'] + job['failed']
+    percent = processed * 100 // job['total'] if job['total'] else 100
+    return (
+        f"📣 Рассылка {STATUS_LABELS[job['status']]}\n\n"
+        f"Обработано: {processed} из {job['total']} ({percent}%)\n"
+        f"✅ Доставлено: {job['sent']}\n"
+        f"❌ Ошибок: {job['failed']}\n\n"
+        f"Текст:\n{job['text']}"
+    )
+
+def job_keyboard(job):
+    """Кнопки управления рассылкой для ее текущего статуса"""
+    job_id = job['id']
+    if job['status'] == RUNNING:
+        buttons = [InlineKeyboardButton("⏸ Пауза", callback_data=f"bc:pause:{job_id}")]
+    elif job['status'] == PAUSED:
+        buttons = [InlineKeyboardButton("▶️ Продолжить", callback_data=f"bc:resume:{job_id}")]
+    else:
+        return None
+    buttons.append(InlineKeyboardButton("✖️ Отменить", callback_data=f"bc:cancel:{job_id}"))
+    return InlineKeyboardMarkup([buttons])
+
+class BroadcastManager:
+    """Создает, выполняет и возобновляет задание рассылки"""
+
+    def __init__(self, worker_id, chunk_size=BROADCAST_CHUNK):
+        self.worker_id = worker_id
+        self.chunk_size = chunk_size
+        self._task = None
+
+    def create_job(self, text, admin_chat_id):
+        """Создает задание, если нет незавершенного; возвращает (задание, создано ли)"""
+        job = load_job()
+        if job and job['status'] in (RUNNING, PAUSED):
+            return job, False
+
+        job = {
+            'id': uuid.uuid4().hex[:8],
+            'text': text,
+            'admin_chat_id': admin_chat_id,
+            'status_message_id': None,
+            'status': RUNNING,
+            'cursor': None,
+            'total': len(get_backend().get_active_users()),
+            'sent': 0,
+            'failed': 0,
+            'created_at': time.time(),
+            'owner': self.worker_id,
+            'heartbeat': time.time()
+        }
+        save_job(job)
+        return job, True
+
+    def set_status(self, job_id, status):
+        """Пауза, продолжение или отмена; возвращает обновленное задание или None"""
+        job = load_job()
+        if not job or job['id'] != job_id or job['status'] in (CANCELLED, DONE):
+            return None
+        if status == RUNNING and job['status'] != PAUSED:
+            return job
+        job['status'] = status
+        save_job(job)
+        return job
+
+    def start(self, bot, job):
+        """Запускает выполнение задания в текущем event loop"""
+        if self._task and not self._task.done():
+            return
+        job['owner'] = self.worker_id
+        job['heartbeat'] = time.time()
+        save_job(job)
+        self._spawn(bot, job['id'])
+
+    def _spawn(self, bot, job_id):
+        # Задача запускается из обработчика команды и иначе унаследовала бы его трассу:
+        # все вызовы Bot API рассылки засчитывались бы одному обновлению
+        self._task = asyncio.create_task(self.run(bot, job_id), context=contextvars.Context())
+
+    async def _update_status_message(self, bot, job):
+        try:
+            await bot.edit_message_text(
+                chat_id=job['admin_chat_id'],
+                message_id=job['status_message_id'],
+                text=format_job_status(job),
+                reply_markup=job_keyboard(job)
+            )
+        except Exception as e:
+            # "message is not modified" и подобные ошибки не должны останавливать рассылку
+            logger.debug(f"Не удалось обновить статус рассылки: {e}")
+
+    async def run(self, bot, job_id):
+        """Обходит пользователей пачками от сохраненного курсора"""
+        sender = RateLimitedSender(bot)
+        # Список загружается один раз; курсор - последний обработанный id
+        users = sorted(get_backend().get_active_users())
+        last_status_edit = 0.0
+        logger.info(f"📣 Рассылка {job_id} запущена, пользователей: {len(users)}")
+
+        while True:
+            # Статус перечитывается каждую пачку: пауза и отмена могут прийти из другого воркера
+            job = load_job()
+            if not job or job['id'] != job_id:
+                return
+            if job['status'] != RUNNING:
+                await self._update_status_message(bot, job)
+                logger.info(f"📣 Рассылка {job_id} остановлена: {job['status']}")
+                return
+
+            start = 0 if job['cursor'] is None else bisect.bisect_right(users, job['cursor'])
+            chunk = users[start:start + self.chunk_size]
+            if not chunk:
+                job['status'] = DONE
+                job['total'] = job['sent'] + job['failed']
+                save_job(job)
+                await self._update_status_message(bot, job)
+                logger.info(f"📣 Рассылка {job_id} завершена: доставлено {job['sent']}, ошибок {job['failed']}")
+                return
+
+            results = await sender.send_many(chunk, job['text'])
+
+            # Статус могли изменить во время отправки пачки, поэтому сохраняется только прогресс
+            latest = load_job() or job
+            latest.update(
+                cursor=chunk[-1],
+                sent=job['sent'] + results[SENT],
+                failed=job['failed'] + sum(results.values()) - results[SENT],
+                total=job['sent'] + job['failed'] + len(users) - start,
+                owner=self.worker_id,
+                heartbeat=time.time()
+            )
+            save_job(latest)
+
+            if time.monotonic() - last_status_edit >= BROADCAST_STATUS_INTERVAL:
+                last_status_edit = time.monotonic()
+                await self._update_status_message(bot, latest)
+
+    async def resume(self, bot):
+        """Подхватывает брошенную рассылку (после перезапуска или падения воркера); фоновая задача"""
+        while True:
+            job = load_job()
+            idle = not self._task or self._task.done()
+            stale = time.time() - job.get('heartbeat', 0) >= BROADCAST_LEASE if job else False
+            if job and job['status'] == RUNNING and idle and stale:
+                # Из нескольких воркеров рассылку забирает один
+                if get_backend().claim_job(f"broadcast:{job['id']}:{int(job['heartbeat'])}", ttl=BROADCAST_LEASE):
+                    logger.info(f"📣 Продолжаем рассылку {job['id']} с курсора {job['cursor']}")
+                    self._spawn(bot, job['id'])
+            await asyncio.sleep(BROADCAST_LEASE / 2)
@@ -0,0 +1,139 @@
+"""
+Расписание в формате iCalendar (.ics) для календарных приложений
+
+Лента строится из скомпилированной модели расписания и календаря четности недель
+на текущий семестр (границы берутся по текущей дате или из SEMESTER_START/SEMESTER_END).
+Тело ленты, его gzip-версия и ETag вычисляются один раз на версию расписания
+и семестр, поэтому частые опросы календарных приложений обходятся в проверку
+заголовка If-None-Match.
+"""
+
+import os
+import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from schedule_model import current_semester, parse_time_range, week_type_for_date
+
+# Название группы в URL /calendar/<group>.ics; по умолчанию берется из поля "group" расписания
+SCHEDULE_GROUP = os.getenv('SCHEDULE_GROUP')
+DEFAULT_GROUP = 'itmo'
+
+MOSCOW_TZ = ZoneInfo("Europe/Moscow")
+# Длина строки iCalendar в октетах, после которой строка переносится (RFC 5545, 3.1)
+ICS_LINE_LIMIT = 75
+
+_feed_cache = {'model': None, 'group': None, 'semester': None, 'feed': None}
+_feed_lock = threading.Lock()
+
+def get_schedule_group(model):
+    """Название группы, для которой отдается лента"""
+    data = (model or {}).get('data') or {}
+    return SCHEDULE_GROUP or data.get('group') or DEFAULT_GROUP
+
+def escape_ics_text(value):
+    """Экранирует текстовое значение свойства iCalendar"""
+    return (
+        str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+    )
+
+def fold_ics_line(line):
+    """Переносит строку длиннее 75 октетов, не разрывая символы UTF-8"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= ICS_LINE_LIMIT:
+        return line
+
+    parts = []
+    current = ''
+    current_size = 0
+    limit = ICS_LINE_LIMIT
+    for char in line:
+        size = len(char.encode('utf-8'))
+        if current_size + size > limit:
+            parts.append(current)
+            # Строки продолжения начинаются с пробела, он тоже занимает октет
+            current = ''
+            current_size = 0
+            limit = ICS_LINE_LIMIT - 1
+        current += char
+        current_size += size
+    parts.append(current)
+    return '\r\n '.join(parts)
+
+def _format_utc(target_date, minutes):
+    """Момент времени по Москве в формате UTC iCalendar"""
+    local = datetime(target_date.year, target_date.month, target_date.day,
+                     minutes // 60, minutes % 60, tzinfo=MOSCOW_TZ)
+    return local.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+def build_ics(model, group, semester=None):
+    """Строит тело ленты iCalendar по всем дням семестра (по умолчанию текущего)"""
+    start_date, end_date = semester or current_semester()
+    calendar = model['calendar']
+    days = model['days']
+    source_id = (model.get('source_hash') or 'local')[:12]
+    # DTSTAMP фиксирован для версии расписания и семестра, чтобы тело и ETag не менялись между запусками
+    dtstamp = start_date.strftime('%Y%m%dT000000Z')
+
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//telegram-itmo-bot//Schedule//RU',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape_ics_text("Расписание " + group)}',
+        'X-WR-TIMEZONE:Europe/Moscow',
+    ]
+
+    for offset in range((end_date - start_date).days + 1):
+        target_date = start_date + timedelta(days=offset)
+        # Календарь модели покрывает семестр на момент компиляции, остальные дни считаются на месте
+        week_type = calendar.get(target_date.toordinal()) or week_type_for_date(target_date)
+        day = days.get((week_type, target_date.weekday()))
+        if not day:
+            continue
+
+        for position, class_item in enumerate(day['classes']):
+            if 'window' in class_item:
+                continue
+            time_range = parse_time_range(str(class_item.get('time', '')))
+            if time_range is None:
+                continue
+
+            start, end = time_range
+            location = f"Ауд. {class_item['room']}, {class_item['address']}"
+            lines.extend((
+                'BEGIN:VEVENT',
+                f'UID:{target_date:%Y%m%d}-{start:04d}-{position}-{source_id}@telegram-itmo-bot',
+                f'DTSTAMP:{dtstamp}',
+                f'DTSTART:{_format_utc(target_date, start)}',
+                f'DTEND:{_format_utc(target_date, end)}',
+                f"SUMMARY:{escape_ics_text(class_item['subject'])}",
+                f'LOCATION:{escape_ics_text(location)}',
+                'END:VEVENT',
+            ))
+
+    lines.append('END:VCALENDAR')
+    return ('\r\n'.join(fold_ics_line(line) for line in lines) + '\r\n').encode('utf-8')
+
+def get_calendar_feed(model, group, semester=None):
+    """Тело ленты, его gzip-версия и сильные ETag; пересчитываются только при смене расписания или семестра"""
+    semester = semester or current_semester()
+    with _feed_lock:
+        if _feed_cache['model'] is model and _feed_cache['group'] == group and _feed_cache['semester'] == semester:
+            return _feed_cache['feed']
+
+        # gzip нужен только при первом запросе ленты или прогреве
+        import gzip
+        body = build_ics(model, group, semester)
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        feed = {
+            'body': body,
+            # mtime=0 делает сжатое тело одинаковым во всех воркерах
+            'gzip_body': gzip.compress(body, compresslevel=9, mtime=0),
+            'etag': digest,
+            'gzip_etag': f'{digest}-gzip'
+        }
+        _feed_cache.update(model=model, group=group, semester=semester, feed=feed)
+        return feed
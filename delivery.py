@@ -0,0 +1,155 @@
+"""
+Рассылка сообщений пользователям с ограничением скорости
+Результат каждой доставки классифицируется (Forbidden, ChatNotFound, RetryAfter,
+временная ошибка), недоступные навсегда чаты помечаются в хранилище как неактивные
+и исключаются из следующих рассылок, а по каждому пользователю ведется статистика доставки.
+"""
+
+import os
+import asyncio
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from state_backend import get_backend
+
+logger = logging.getLogger(__name__)
+
+# Сообщений в секунду для всего бота (лимит Telegram - около 30)
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '25'))
+# Сколько отправок выполняется одновременно
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '10'))
+# Сколько раз повторять отправку после RetryAfter или временной ошибки
+MAX_DELIVERY_ATTEMPTS = 3
+
+SENT = 'sent'
+FORBIDDEN = 'forbidden'
+CHAT_NOT_FOUND = 'chat_not_found'
+RETRY_AFTER = 'retry_after'
+TRANSIENT = 'transient'
+ERROR = 'error'
+
+# Чаты, в которые доставить сообщение больше не получится
+PERMANENT_FAILURES = {FORBIDDEN, CHAT_NOT_FOUND}
+
+def classify_delivery_error(error):
+    """Определяет тип ошибки доставки"""
+    from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+    if isinstance(error, Forbidden):
+        # Бот заблокирован или аккаунт пользователя удален
+        return FORBIDDEN
+    if isinstance(error, RetryAfter):
+        return RETRY_AFTER
+    # BadRequest наследуется от NetworkError, поэтому проверяется раньше
+    if isinstance(error, BadRequest):
+        message = str(error).lower()
+        if 'chat not found' in message or 'user not found' in message:
+            return CHAT_NOT_FOUND
+        return ERROR
+    if isinstance(error, NetworkError):
+        # Сюда же относится TimedOut
+        return TRANSIENT
+    return ERROR
+
+def _retry_after_seconds(error):
+    """Сколько секунд ждать после RetryAfter"""
+    retry_after = getattr(error, 'retry_after', 1)
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+class RateLimitedSender:
+    """Отправитель сообщений с общим темпом и паузой после RetryAfter"""
+
+    def __init__(self, bot, rate=BROADCAST_RATE, concurrency=BROADCAST_CONCURRENCY, backend=None):
+        self.bot = bot
+        self.interval = 1 / rate if rate > 0 else 0
+        self.concurrency = concurrency
+        self.backend = backend
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+
+    async def _wait_for_slot(self):
+        """Выдает моменты отправки не чаще rate в секунду"""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next_slot, self._paused_until)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def _record(self, chat_id, outcome):
+        """Сохраняет результат доставки и помечает недоступные чаты"""
+        backend = self.backend or get_backend()
+        try:
+            backend.record_delivery(chat_id, outcome)
+            if outcome in PERMANENT_FAILURES:
+                backend.mark_user_inactive(chat_id, outcome)
+                logger.info(f"🚫 Пользователь {chat_id} помечен неактивным: {outcome}")
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить результат доставки для {chat_id}: {e}")
+
+    async def send(self, chat_id, text, **kwargs):
+        """Отправляет одно сообщение, возвращает результат доставки"""
+        outcome = ERROR
+        for attempt in range(1, MAX_DELIVERY_ATTEMPTS + 1):
+            await self._wait_for_slot()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                outcome = SENT
+                break
+            except Exception as e:
+                outcome = classify_delivery_error(e)
+                if outcome == RETRY_AFTER and attempt < MAX_DELIVERY_ATTEMPTS:
+                    # Ограничение Telegram касается всего бота: приостанавливаем все отправки
+                    delay = _retry_after_seconds(e)
+                    self._paused_until = max(self._paused_until, asyncio.get_running_loop().time() + delay)
+                    logger.warning(f"⏳ RetryAfter {delay:.0f} с при отправке пользователю {chat_id}")
+                    continue
+                if outcome == TRANSIENT and attempt < MAX_DELIVERY_ATTEMPTS:
+                    await asyncio.sleep(attempt)
+                    continue
+                logger.warning(f"Не удалось отправить сообщение пользователю {chat_id}: {e}")
+                break
+
+        self._record(chat_id, outcome)
+        return outcome
+
+    async def send_many(self, chat_ids, text, on_result=None, **kwargs):
+        """Отправляет сообщение списку чатов, возвращает счетчик результатов по типам"""
+        results = Counter()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send_one(chat_id):
+            try:
+                outcome = await self.send(chat_id, text, **kwargs)
+                results[outcome] += 1
+                if on_result:
+                    await on_result(chat_id, outcome)
+            finally:
+                semaphore.release()
+
+        tasks = []
+        errors = []
+        for chat_id in chat_ids:
+            # Задачи создаются по мере освобождения слотов, а не для всех чатов сразу
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(send_one(chat_id)))
+            if len(tasks) >= self.concurrency * 10:
+                # У завершенных задач забирается исключение, иначе оно теряется
+                # с предупреждением "Task exception was never retrieved"
+                pending = []
+                for task in tasks:
+                    if not task.done():
+                        pending.append(task)
+                    elif not task.cancelled() and task.exception() is not None:
+                        errors.append(task.exception())
+                tasks = pending
+
+        if tasks:
+            await asyncio.gather(*tasks)
+        # Как и gather, пробрасывается первое исключение
+        if errors:
+            raise errors[0]
+        return results
@@ -0,0 +1,123 @@
+"""
+Ограничение частоты обновлений от одного пользователя (flood control)
+
+Токен-бакет на пользователя хранится в ограниченном OrderedDict: простаивающие
+пользователи вытесняются (их бакет и так полон), поэтому память не растет.
+Нажатия кнопок сверх лимита не теряются целиком: сохраняется только последнее
+нажатие, и оно отправляется в обработку, когда у пользователя появится токен.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# Скорость пополнения (токенов в секунду) и размер бакета; FLOOD_RATE=0 выключает ограничение
+FLOOD_RATE = float(os.getenv('FLOOD_RATE', '1'))
+FLOOD_BURST = float(os.getenv('FLOOD_BURST', '5'))
+# Максимум одновременно отслеживаемых пользователей
+FLOOD_MAX_USERS = int(os.getenv('FLOOD_MAX_USERS', '10000'))
+
+class FloodLimiter:
+    """Токен-бакет на пользователя с вытеснением простаивающих и отложенными нажатиями"""
+
+    def __init__(self, rate=FLOOD_RATE, burst=FLOOD_BURST, max_users=FLOOD_MAX_USERS):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self._buckets = OrderedDict()
+        self._deferred = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'allowed': 0, 'dropped': 0, 'coalesced': 0}
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def _refill_time(self):
+        """Через сколько секунд простоя бакет гарантированно полон"""
+        return self.burst / self.rate
+
+    def _take(self, user_id, now):
+        """Пытается забрать токен; вызывается под блокировкой"""
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            tokens = self.burst
+        else:
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+
+        self._buckets[user_id] = [tokens, now]
+        self._buckets.move_to_end(user_id)
+        return allowed
+
+    def _evict(self, now):
+        """Вытесняет пользователей с полным бакетом и лишних сверх лимита; под блокировкой"""
+        idle_after = self._refill_time()
+        while self._buckets:
+            user_id, (_, last_seen) = next(iter(self._buckets.items()))
+            if now - last_seen < idle_after and len(self._buckets) <= self.max_users:
+                break
+            if user_id in self._deferred:
+                # Бакет пользователя с отложенным нажатием нужен для его выпуска
+                if len(self._buckets) <= self.max_users:
+                    break
+                self._deferred.pop(user_id)
+                self.stats['dropped'] += 1
+            del self._buckets[user_id]
+
+    def allow(self, user_id, now=None):
+        """Проверяет, можно ли обработать обновление пользователя прямо сейчас"""
+        if not self.enabled or user_id is None:
+            return True
+
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            allowed = self._take(user_id, now)
+            self._evict(now)
+            if allowed:
+                self.stats['allowed'] += 1
+            return allowed
+
+    def defer(self, user_id, update_data):
+        """Откладывает нажатие сверх лимита; предыдущее отложенное нажатие заменяется"""
+        with self._lock:
+            if user_id in self._deferred:
+                self.stats['coalesced'] += 1
+            self._deferred[user_id] = update_data
+            self._deferred.move_to_end(user_id)
+            while len(self._deferred) > self.max_users:
+                self._deferred.popitem(last=False)
+                self.stats['dropped'] += 1
+
+    def drop(self):
+        """Учитывает отброшенное обновление"""
+        with self._lock:
+            self.stats['dropped'] += 1
+
+    def release_ready(self, now=None):
+        """Возвращает отложенные нажатия пользователей, у которых появился токен"""
+        if not self._deferred:
+            return []
+
+        now = time.monotonic() if now is None else now
+        released = []
+        with self._lock:
+            for user_id in list(self._deferred):
+                if self._take(user_id, now):
+                    released.append(self._deferred.pop(user_id))
+                    self.stats['allowed'] += 1
+        return released
+
+    def snapshot(self):
+        """Состояние ограничителя для /status"""
+        return dict(
+            self.stats,
+            tracked_users=len(self._buckets),
+            deferred=len(self._deferred),
+            rate=self.rate,
+            burst=self.burst
+        )
@@ -1,40 +1,120 @@
 #!/usr/bin/env python3
 """
-Скрипт для получения SCHEDULE_JSON для Render
-Запустите этот скрипт, чтобы получить значение переменной SCHEDULE_JSON для вставки в Render
+Компилятор расписания для Render
+Берет SCHEDULE_JSON из переменной окружения или из env_example.txt, проверяет его,
+собирает индексированную модель с календарем и готовыми текстами и записывает
+версионированный бинарный снимок, который main.py загружает при старте.
+
+Запуск в Build Command на Render:
+    pip install -r requirements.txt && python get_schedule_for_render.py
 """
 
+import os
+import sys
 import json
+import argparse
+
+from schedule_model import ScheduleError, compile_schedule, hash_source, validate_schedule, write_snapshot
+
+# Ограничение размера значения переменной окружения на хостинге (в байтах)
+ENV_VALUE_LIMIT = int(os.getenv('ENV_VALUE_LIMIT', 32 * 1024))
+# Доля лимита, после которой выводится предупреждение
+ENV_VALUE_WARN_RATIO = 0.8
+
+def read_schedule_json(env_file):
+    """Возвращает SCHEDULE_JSON из окружения или из файла с примером переменных"""
+    schedule_json = os.getenv('SCHEDULE_JSON')
+    if schedule_json:
+        return schedule_json, "переменной окружения SCHEDULE_JSON"
+
+    if not os.path.exists(env_file):
+        return None, env_file
+
+    # Читаем содержимое env_example.txt
+    with open(env_file, 'r', encoding='utf-8') as file:
+        content = file.read()
+
+    # Находим значение SCHEDULE_JSON
+    for line in content.split('\n'):
+        if line.startswith('SCHEDULE_JSON='):
+            # Убираем SCHEDULE_JSON= и берем значение
+            return line[len('SCHEDULE_JSON='):], env_file
+
+    return None, env_file
+
+def check_size_limit(schedule_json, limit):
+    """Предупреждает, если значение переменной приближается к лимиту хостинга"""
+    size = len(schedule_json.encode('utf-8'))
+    usage = size / limit
+    if size > limit:
+        print(f"❌ Размер SCHEDULE_JSON {size} байт превышает лимит {limit} байт")
+        return False
+    if usage >= ENV_VALUE_WARN_RATIO:
+        print(f"⚠️ Размер SCHEDULE_JSON {size} байт - {usage:.0%} от лимита {limit} байт")
+    else:
+        print(f"✅ Размер SCHEDULE_JSON: {size} байт ({usage:.0%} от лимита {limit} байт)")
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Компилятор расписания ИТМО в бинарный снимок")
+    parser.add_argument('--env-file', default='env_example.txt', help="Файл с SCHEDULE_JSON=...")
+    parser.add_argument('--output', default=os.getenv('SCHEDULE_SNAPSHOT', 'schedule.snapshot'),
+                        help="Путь к файлу снимка")
+    parser.add_argument('--limit', type=int, default=ENV_VALUE_LIMIT, help="Лимит размера переменной окружения в байтах")
+    parser.add_argument('--print', dest='print_value', action='store_true',
+                        help="Вывести значение SCHEDULE_JSON для вставки в Render")
+    args = parser.parse_args()
 
-# Читаем содержимое env_example.txt
-with open('env_example.txt', 'r', encoding='utf-8') as file:
-    content = file.read()
-
-# Находим значение SCHEDULE_JSON
-lines = content.split('\n')
-schedule_json = None
-
-for line in lines:
-    if line.startswith('SCHEDULE_JSON='):
-        # Убираем SCHEDULE_JSON= и берем значение
-        schedule_json = line[14:]  # len('SCHEDULE_JSON=') = 14
-        break
-
-if schedule_json:
-    print("✅ Найдено значение SCHEDULE_JSON:")
-    print("=" * 80)
-    print(schedule_json)
-    print("=" * 80)
-    print("\n📋 Инструкции:")
-    print("1. Скопируйте текст выше (между знаками =)")
-    print("2. Вставьте его в переменную окружения SCHEDULE_JSON на Render")
-    print("3. Убедитесь, что весь текст вставлен в одну строку")
+    schedule_json, source = read_schedule_json(args.env_file)
+    if not schedule_json:
+        print(f"❌ Не найдено значение SCHEDULE_JSON ({source})")
+        return False
+
+    print(f"✅ Найдено значение SCHEDULE_JSON в {source}")
+
+    # Значение из переменной окружения не печатаем, чтобы расписание не попадало в логи сборки
+    if args.print_value or source == args.env_file:
+        print("=" * 80)
+        print(schedule_json)
+        print("=" * 80)
+        print("\n📋 Инструкции:")
+        print("1. Скопируйте текст выше (между знаками =)")
+        print("2. Вставьте его в переменную окружения SCHEDULE_JSON на Render")
+        print("3. Убедитесь, что весь текст вставлен в одну строку")
+
+    size_ok = check_size_limit(schedule_json, args.limit)
 
     # Проверяем, что JSON валидный
     try:
         parsed = json.loads(schedule_json)
-        print(f"\n✅ JSON валидный! Найдено {len(parsed['schedule'])} типа недель")
     except json.JSONDecodeError as e:
         print(f"\n❌ Ошибка в JSON: {e}")
-else:
-    print("❌ Не найдено значение SCHEDULE_JSON в файле env_example.txt")
+        return False
+
+    errors, warnings = validate_schedule(parsed)
+    for warning in warnings:
+        print(f"⚠️ {warning}")
+    if errors:
+        print(f"\n❌ Найдено ошибок в расписании: {len(errors)}")
+        for error in errors:
+            print(f"   {error}")
+        return False
+
+    print(f"✅ JSON валидный! Найдено {len(parsed['schedule'])} типа недель")
+
+    try:
+        model = compile_schedule(parsed, hash_source(schedule_json))
+    except ScheduleError as e:
+        print(f"❌ {e}")
+        return False
+
+    write_snapshot(model, args.output)
+    print(f"💾 Снимок расписания записан в {args.output} "
+          f"({os.path.getsize(args.output)} байт, {len(model['days'])} дней, "
+          f"{len(model['calendar'])} дней календаря)")
+
+    return size_ok
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
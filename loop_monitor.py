@@ -0,0 +1,106 @@
+"""
+Мониторинг задержки event loop процессора обновлений
+
+В цикле процессора периодически выполняется тик: разница между запланированным
+и фактическим временем его запуска - это задержка (lag) цикла. Если обработчик
+блокирует цикл синхронным вызовом (файловый ввод-вывод, тяжелые вычисления),
+тики опаздывают. Отдельный поток-сторож замечает тик, который не наступил
+дольше порога, и пишет в лог стек потока процессора - то есть место блокировки.
+"""
+
+import os
+import sys
+import time
+import logging
+import asyncio
+import threading
+import traceback
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Период тика в секундах
+LOOP_TICK_INTERVAL = float(os.getenv('LOOP_TICK_INTERVAL', '0.5'))
+# Допустимая задержка цикла в миллисекундах: выше нее /health сообщает о деградации
+LOOP_LAG_SLO_MS = float(os.getenv('LOOP_LAG_SLO_MS', '500'))
+# Через сколько миллисекунд блокировки сторож пишет в лог стек процессора
+LOOP_STALL_MS = float(os.getenv('LOOP_STALL_MS', '1000'))
+# Сколько последних тиков учитывается в максимуме задержки
+LAG_WINDOW = 120
+
+class LoopMonitor:
+    """Измеряет задержку event loop и ловит блокирующие его вызовы"""
+
+    def __init__(self, interval=LOOP_TICK_INTERVAL, slo_ms=LOOP_LAG_SLO_MS, stall_ms=LOOP_STALL_MS):
+        self.interval = interval
+        self.slo_ms = slo_ms
+        self.stall_ms = stall_ms
+        self._lags = deque(maxlen=LAG_WINDOW)
+        self._next_tick_due = None
+        self._reported_due = None
+        self._loop_thread_id = None
+        self._watchdog = None
+        self.stalls = 0
+        self.last_stall = None
+
+    async def run(self, stop_event):
+        """Тики в цикле процессора; запускается как задача в этом цикле"""
+        self._loop_thread_id = threading.get_ident()
+        while not stop_event.is_set():
+            self._next_tick_due = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - self._next_tick_due)
+            self._lags.append(lag)
+            if lag * 1000 > self.slo_ms:
+                logger.warning(f"🐌 Event loop процессора опоздал на {lag * 1000:.0f} мс")
+        self._next_tick_due = None
+
+    def start_watchdog(self, stop_event):
+        """Запускает поток-сторож, который пишет стек процессора при долгой блокировке"""
+        def watch():
+            while not stop_event.wait(self.interval):
+                self.check_stall()
+
+        self._watchdog = threading.Thread(target=watch, name='loop-watchdog', daemon=True)
+        self._watchdog.start()
+
+    def current_lag(self):
+        """Насколько текущий тик просрочен прямо сейчас, в секундах"""
+        due = self._next_tick_due
+        if due is None:
+            return 0.0
+        return max(0.0, time.monotonic() - due)
+
+    def check_stall(self):
+        """Пишет стек потока процессора, если тик просрочен дольше порога (один раз на блокировку)"""
+        due = self._next_tick_due
+        overdue = self.current_lag()
+        if overdue * 1000 < self.stall_ms or due == self._reported_due:
+            return None
+
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+
+        self._reported_due = due
+        self.stalls += 1
+        stack = ''.join(traceback.format_stack(frame))
+        self.last_stall = {'at': time.time(), 'blocked_ms': round(overdue * 1000, 1), 'stack': stack}
+        logger.warning(f"🧱 Event loop процессора заблокирован {overdue * 1000:.0f} мс, стек:\n{stack}")
+        return stack
+
+    def is_healthy(self):
+        """Задержка цикла в пределах SLO"""
+        last = self._lags[-1] if self._lags else 0.0
+        return max(last, self.current_lag()) * 1000 <= self.slo_ms
+
+    def snapshot(self):
+        """Состояние монитора для /health и /status"""
+        last = self._lags[-1] if self._lags else 0.0
+        return {
+            'lag_ms': round(max(last, self.current_lag()) * 1000, 1),
+            'max_lag_ms': round(max(self._lags, default=0.0) * 1000, 1),
+            'slo_ms': self.slo_ms,
+            'stalls': self.stalls,
+            'last_stall_at': self.last_stall['at'] if self.last_stall else None
+        }
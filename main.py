@@ -1,23 +1,73 @@
+import time
+
+# Отметка старта процесса для временной шкалы холодного старта
+_PROCESS_STARTED = time.perf_counter()
+
 import os
+import re
 import json
 import logging
-import time
-import pickle
+import asyncio
+import calendar
+import functools
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
+from telegram.ext import (
+    Application, CommandHandler, CallbackQueryHandler, MessageHandler, TypeHandler, filters, ContextTypes
+)
+from state_backend import get_backend
+from delivery import RateLimitedSender, SENT
+from tracing import TracingRequest, traced_handler
+from analytics import usage_analytics
+from state_retention import StateRetention
+from calendar_feed import get_calendar_feed, get_schedule_group
+from broadcast import (
+    PAUSED, RUNNING, CANCELLED, BroadcastManager, format_job_status, is_admin, job_keyboard, load_job, save_job
+)
+from reminders import DEFAULT_REMINDER_MINUTES, REMINDER_OFFSETS, ReminderScheduler
+from schedule_model import (
+    NEXT_CLASS_LOOKAHEAD_DAYS, SEARCH_LOOKAHEAD_DAYS, ScheduleError, compile_schedule, diff_schedules,
+    find_next_class, format_class_change, format_class_info, format_week_page, hash_source, next_class_dates,
+    read_snapshot, search_classes, upcoming_changes
+)
 
 # Импортируем веб-сервер
 try:
-    from web_server import initialize_telegram_app, run_server, update_bot_status
+    from web_server import (
+        initialize_telegram_app, run_server, prepare_server, update_bot_status,
+        set_webhook_async, record_startup_phase, register_warmup_hook,
+        register_schedule_provider, register_schedule_reloader, register_background_task,
+        register_status_provider, submit_to_processor, get_worker_id, BOT_MODE
+    )
 except ImportError:
     def initialize_telegram_app(app):
         pass
     def run_server():
         pass
+    def prepare_server():
+        pass
     def update_bot_status(**kwargs):
         pass
+    async def set_webhook_async(bot=None):
+        return False
+    def record_startup_phase(name, started, finished=None):
+        pass
+    def register_warmup_hook(hook):
+        pass
+    def register_schedule_provider(provider):
+        pass
+    def register_schedule_reloader(reloader):
+        pass
+    def register_background_task(factory):
+        pass
+    def register_status_provider(name, provider):
+        pass
+    def submit_to_processor(coro):
+        coro.close()
+    def get_worker_id():
+        return f"local:{os.getpid()}"
+    BOT_MODE = 'webhook'
 
 # Настройка логирования
 logging.basicConfig(
@@ -26,67 +76,204 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+record_startup_phase('imports', _PROCESS_STARTED)
+
 # Глобальные переменные
 SCHEDULE_DATA = None
-USERS_FILE = "bot_users.pkl"
+COMPILED_SCHEDULE = None
+SCHEDULE_SNAPSHOT = os.getenv('SCHEDULE_SNAPSHOT', 'schedule.snapshot')
+# На сколько дней вперед сообщать пользователям об изменениях расписания
+CHANGE_NOTIFY_DAYS = int(os.getenv('CHANGE_NOTIFY_DAYS', '7'))
+# На сколько недель от текущей можно листать расписание за пределами семестра
+WEEK_NAVIGATION_LIMIT = 26
+# Функции listener(старая модель, новая модель), вызываемые после перезагрузки расписания,
+# и признак "только в воркере, получившем /admin/schedule": пары (listener, origin_only)
+schedule_listeners = []
+# Ключ хранилища состояния для расписания, перезагруженного через /admin/schedule
+SCHEDULE_STATE_KEY = 'schedule'
+# Как часто воркер проверяет, не перезагрузил ли расписание другой воркер, в секундах
+SCHEDULE_SYNC_INTERVAL = float(os.getenv('SCHEDULE_SYNC_INTERVAL', '30'))
 
 def load_users():
-    """Загружает список пользователей из файла"""
+    """Загружает список пользователей из хранилища состояния"""
     try:
-        if os.path.exists(USERS_FILE):
-            with open(USERS_FILE, 'rb') as f:
-                return pickle.load(f)
-        return set()
+        return get_backend().get_users()
     except Exception as e:
         logger.error(f"Ошибка загрузки пользователей: {e}")
         return set()
 
 def save_users(users):
-    """Сохраняет список пользователей в файл"""
+    """Сохраняет список пользователей в хранилище состояния"""
     try:
-        with open(USERS_FILE, 'wb') as f:
-            pickle.dump(users, f)
+        get_backend().set_users(users)
         logger.info(f"Сохранено {len(users)} пользователей")
     except Exception as e:
         logger.error(f"Ошибка сохранения пользователей: {e}")
 
 def add_user(user_id):
     """Добавляет пользователя в список"""
-    users = load_users()
-    users.add(user_id)
-    save_users(users)
+    try:
+        if get_backend().add_user(user_id):
+            logger.info(f"Добавлен пользователь {user_id}")
+    except Exception as e:
+        logger.error(f"Ошибка сохранения пользователя {user_id}: {e}")
 
 async def notify_all_users(bot, message):
-    """Отправляет уведомление всем пользователям"""
-    users = load_users()
-    success_count = 0
-    error_count = 0
+    """Отправляет уведомление всем доступным пользователям"""
+    # Заблокировавшие бота и удаленные аккаунты исключены из рассылки
+    users = get_backend().get_active_users()
+    results = await RateLimitedSender(bot).send_many(sorted(users), message)
+
+    success_count = results[SENT]
+    error_count = sum(results.values()) - success_count
+    logger.info(
+        f"Уведомления отправлены: {success_count} успешно, {error_count} ошибок "
+        f"({', '.join(f'{outcome}: {count}' for outcome, count in results.items())})"
+    )
+    return success_count, error_count
 
-    for user_id in users:
-        try:
-            await bot.send_message(chat_id=user_id, text=message)
-            success_count += 1
-        except Exception as e:
-            logger.warning(f"Не удалось отправить сообщение пользователю {user_id}: {e}")
-            error_count += 1
+def set_schedule(data, source_hash=None):
+    """Компилирует и устанавливает расписание, возвращает True при успехе"""
+    global SCHEDULE_DATA, COMPILED_SCHEDULE
+    try:
+        COMPILED_SCHEDULE = compile_schedule(data, source_hash)
+        SCHEDULE_DATA = data
+        return True
+    except ScheduleError as e:
+        logger.error(f"Ошибка компиляции расписания: {e}")
+        SCHEDULE_DATA = None
+        COMPILED_SCHEDULE = None
+        return False
 
-    logger.info(f"Уведомления отправлены: {success_count} успешно, {error_count} ошибок")
-    return success_count, error_count
+def load_schedule_snapshot(source_hash=None):
+    """Загружает скомпилированное расписание из снимка, собранного get_schedule_for_render.py"""
+    global SCHEDULE_DATA, COMPILED_SCHEDULE
+    if not os.path.exists(SCHEDULE_SNAPSHOT):
+        return False
+
+    try:
+        model = read_snapshot(SCHEDULE_SNAPSHOT, source_hash)
+    except (OSError, ValueError, EOFError, TypeError) as e:
+        logger.warning(f"⚠️ Снимок расписания {SCHEDULE_SNAPSHOT} не подходит, компилируем из JSON: {e}")
+        return False
+
+    COMPILED_SCHEDULE = model
+    SCHEDULE_DATA = model['data']
+    logger.info(f"Расписание загружено из снимка {SCHEDULE_SNAPSHOT}")
+    return True
 
 def load_schedule():
-    """Загружает расписание из переменной окружения"""
-    global SCHEDULE_DATA
+    """Загружает расписание из снимка или переменной окружения"""
+    global SCHEDULE_DATA, COMPILED_SCHEDULE
     schedule_json = os.getenv('SCHEDULE_JSON')
+
+    # Снимок используется, только если собран из текущего значения SCHEDULE_JSON
+    source_hash = hash_source(schedule_json) if schedule_json else None
+    if load_schedule_snapshot(source_hash):
+        return
+
     if schedule_json:
         try:
-            SCHEDULE_DATA = json.loads(schedule_json)
-            logger.info("Расписание успешно загружено")
+            if set_schedule(json.loads(schedule_json), source_hash):
+                logger.info("Расписание успешно загружено")
         except json.JSONDecodeError as e:
             logger.error(f"Ошибка парсинга JSON расписания: {e}")
             SCHEDULE_DATA = None
+            COMPILED_SCHEDULE = None
     else:
         logger.error("Переменная окружения SCHEDULE_JSON не найдена")
         SCHEDULE_DATA = None
+        COMPILED_SCHEDULE = None
+
+def add_schedule_listener(listener, origin_only=False):
+    """Подписывает функцию на перезагрузку расписания
+
+    origin_only - вызывать только в воркере, который получил новое расписание через
+    /admin/schedule (например, уведомления пользователям), а не при синхронизации.
+    """
+    schedule_listeners.append((listener, origin_only))
+
+def get_env_schedule_hash():
+    """Хеш SCHEDULE_JSON из окружения или None"""
+    schedule_json = os.getenv('SCHEDULE_JSON')
+    return hash_source(schedule_json) if schedule_json else None
+
+def reload_schedule(data, source_hash=None, origin=True):
+    """Заменяет расписание без перезапуска; при ошибке остается прежнее. Возвращает (успех, сообщение)
+
+    origin - расписание пришло через /admin/schedule в этот воркер: оно публикуется
+    в общем хранилище, откуда его подхватывают остальные воркеры (см. sync_schedule).
+    """
+    global SCHEDULE_DATA, COMPILED_SCHEDULE
+    try:
+        new_model = compile_schedule(data, source_hash)
+    except ScheduleError as e:
+        return False, str(e)
+
+    old_model = COMPILED_SCHEDULE
+    COMPILED_SCHEDULE = new_model
+    SCHEDULE_DATA = data
+
+    if origin:
+        # base_hash привязывает перезагрузку к SCHEDULE_JSON: после смены переменной она не применяется
+        get_backend().set_state(SCHEDULE_STATE_KEY, 'reloaded', {
+            'source_hash': source_hash,
+            'base_hash': get_env_schedule_hash(),
+            'data': data
+        })
+
+    for listener, origin_only in schedule_listeners:
+        if origin_only and not origin:
+            continue
+        try:
+            listener(old_model, new_model)
+        except Exception as e:
+            logger.error(f"Ошибка обработчика перезагрузки расписания {getattr(listener, '__name__', listener)}: {e}")
+    return True, "Расписание перезагружено"
+
+def sync_schedule():
+    """Применяет расписание, перезагруженное другим воркером; возвращает True, если модель заменена"""
+    reloaded = get_backend().get_state(SCHEDULE_STATE_KEY, 'reloaded')
+    if not reloaded or reloaded['base_hash'] != get_env_schedule_hash():
+        return False
+    current_hash = COMPILED_SCHEDULE.get('source_hash') if COMPILED_SCHEDULE else None
+    if reloaded['source_hash'] == current_hash:
+        return False
+
+    ok, message = reload_schedule(reloaded['data'], reloaded['source_hash'], origin=False)
+    logger.info(f"🔄 Синхронизация расписания с другим воркером: {message}")
+    return ok
+
+async def run_schedule_sync():
+    """Периодически подхватывает перезагрузки расписания из других воркеров"""
+    while True:
+        sync_schedule()
+        await asyncio.sleep(SCHEDULE_SYNC_INTERVAL)
+
+def format_schedule_changes(old_model, new_model, start_date, days=CHANGE_NOTIFY_DAYS):
+    """Текст уведомления об изменениях на ближайшие дни или None, если их не затронуло"""
+    affected = upcoming_changes(diff_schedules(old_model, new_model), new_model, start_date, days)
+    if not affected:
+        return None
+
+    text = "📢 Изменения в расписании:\n\n"
+    for changed_date, changes in affected:
+        text += f"📅 {get_weekday_name(changed_date)} ({changed_date.strftime('%d.%m')}):\n"
+        for change in changes:
+            text += f"   {format_class_change(*change)}\n"
+        text += "\n"
+    return text.rstrip()
+
+async def notify_schedule_changes(bot, old_model, new_model):
+    """Сообщает активным пользователям об изменениях расписания в ближайшие дни"""
+    text = format_schedule_changes(old_model, new_model, get_moscow_time().date())
+    if text is None:
+        logger.info("📢 Изменения расписания не затрагивают ближайшие дни, уведомления не нужны")
+        return None
+
+    results = await RateLimitedSender(bot).send_many(get_backend().get_active_users(), text)
+    logger.info(f"📢 Уведомления об изменениях расписания: {results[SENT]} отправлено")
+    return results
 
 def get_current_week_type(target_date=None):
     """Определяет тип текущей недели (четная/нечетная)"""
@@ -95,6 +282,12 @@ def get_current_week_type(target_date=None):
         moscow_tz = ZoneInfo("Europe/Moscow")
         target_date = datetime.now(moscow_tz)
 
+    # Для дней семестра тип недели берется из предрасчитанного календаря
+    if COMPILED_SCHEDULE and target_date.tzinfo is not None:
+        week_type = COMPILED_SCHEDULE['calendar'].get(target_date.toordinal())
+        if week_type:
+            return week_type
+
     # Находим ближайший понедельник в прошлом (день отсчета)
     days_since_monday = (target_date.weekday() - 0) % 7  # 0 = понедельник
     if days_since_monday == 0:  # Если сегодня понедельник
@@ -131,20 +324,9 @@ def get_weekday_name(date):
     }
     return weekdays[date.weekday()]
 
-def format_class_info(class_item):
-    """Форматирует информацию о занятии в минималистичном стиле"""
-    if 'window' in class_item:
-        return f"🪟 Окно {class_item['window']} ({class_item['duration']})"
-    else:
-        return (
-            f"📚 {class_item['subject']}\n"
-            f"⏰ {class_item['time']} • Ауд. {class_item['room']}\n"
-            f"📍 {class_item['address']}\n"
-        )
-
 def get_schedule_for_date(date_str=None):
     """Получает расписание для указанной даты"""
-    if not SCHEDULE_DATA:
+    if not COMPILED_SCHEDULE:
         return "❌ Расписание не загружено"
 
     try:
@@ -157,68 +339,112 @@ def get_schedule_for_date(date_str=None):
             # Используем московское время
             target_date = get_moscow_time()
 
-        current_week_type = get_current_week_type(target_date)
-        weekday_name = get_weekday_name(target_date)
-
-        # Находим нужную неделю в расписании
-        for week in SCHEDULE_DATA['schedule']:
-            if week['week'] == current_week_type:
-                # Находим нужный день
-                for day in week['days']:
-                    if day['day'] == weekday_name:
-                        classes = day['classes']
-
-                        if not classes:
-                            note = day.get('note', 'Нет занятий')
-                            return f"📅 {weekday_name} ({target_date.strftime('%d.%m.%Y')})\n\n{note}"
-
-                        response = f"📅 {weekday_name} ({target_date.strftime('%d.%m.%Y')})\n\n"
-
-                        for class_item in classes:
-                            response += format_class_info(class_item) + "\n"
-
-                        return response
-
-        return f"❌ Расписание для {weekday_name} не найдено"
+        return render_day_schedule(target_date)
     except ValueError:
         return "❌ Неверный формат даты. Используйте формат ДД.ММ"
     except Exception as e:
         logger.error(f"Ошибка получения расписания: {e}")
         return "❌ Ошибка при получении расписания"
 
-def get_week_schedule():
-    """Получает расписание на текущую неделю"""
-    if not SCHEDULE_DATA:
-        return "❌ Расписание не загружено"
+def render_day_schedule(target_date):
+    """Текст расписания на дату (datetime с часовым поясом Москвы)"""
+    current_week_type = get_current_week_type(target_date)
+    weekday_name = get_weekday_name(target_date)
 
-    current_week_type = get_current_week_type()
+    # Текст дня заранее отрендерен при компиляции расписания
+    body = COMPILED_SCHEDULE['rendered_days'].get((current_week_type, target_date.weekday()))
+    if body is None:
+        return f"❌ Расписание для {weekday_name} не найдено"
 
-    # Находим нужную неделю в расписании
-    for week in SCHEDULE_DATA['schedule']:
-        if week['week'] == current_week_type:
-            current_time = get_moscow_time()
-            week_start = current_time - timedelta(days=current_time.weekday())
-            week_end = week_start + timedelta(days=6)
+    return f"📅 {weekday_name} ({target_date.strftime('%d.%m.%Y')})\n\n{body}"
 
-            response = f"📅 Расписание на неделю ({week_start.strftime('%d.%m')} - {week_end.strftime('%d.%m.%Y')})\n\n"
+def get_week_monday(offset=0):
+    """Понедельник недели со сдвигом offset недель от текущей"""
+    today = get_moscow_time().date()
+    return today - timedelta(days=today.weekday()) + timedelta(weeks=offset)
 
-            for day in week['days']:
-                day_name = day['day']
-                classes = day['classes']
+def get_week_schedule(offset=0):
+    """Получает расписание на неделю со сдвигом offset от текущей"""
+    if not COMPILED_SCHEDULE:
+        return "❌ Расписание не загружено"
+
+    monday = get_week_monday(offset)
+
+    # Страницы недель семестра заранее отрендерены при компиляции расписания
+    page = COMPILED_SCHEDULE['week_pages'].get(monday.toordinal())
+    if page is not None:
+        return page
+
+    # Вне семестра неделя собирается из текста ее типа
+    week_type = get_current_week_type(datetime(monday.year, monday.month, monday.day, tzinfo=ZoneInfo("Europe/Moscow")))
+    body = COMPILED_SCHEDULE['rendered_weeks'].get(week_type)
+    if body is None:
+        return "❌ Расписание не найдено"
+    return format_week_page(monday, body)
+
+def format_minutes(minutes):
+    """Минуты от начала дня в формате ЧЧ:ММ"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def format_class_day(class_date, today):
+    """Подпись дня пары относительно сегодняшнего"""
+    days_ahead = (class_date - today).days
+    if days_ahead == 0:
+        return "сегодня"
+    if days_ahead == 1:
+        return "завтра"
+    return f"{get_weekday_name(class_date).lower()}, {class_date.strftime('%d.%m')}"
+
+def get_next_class(current_time=None):
+    """Текущая и следующая пара по предрасчитанным интервалам, без разбора строк времени"""
+    if not COMPILED_SCHEDULE:
+        return "❌ Расписание не загружено"
 
-                response += f"📅 {day_name}:\n"
+    if current_time is None:
+        current_time = get_moscow_time()
+    today = current_time.date()
+    minute = current_time.hour * 60 + current_time.minute
+
+    found = find_next_class(COMPILED_SCHEDULE, today, minute)
+    if found is None:
+        return f"🎉 В ближайшие {NEXT_CLASS_LOOKAHEAD_DAYS} дней пар нет"
+
+    class_date, class_item, start, end, is_current = found
+    text = ""
+    if is_current:
+        text += f"🟢 Сейчас идет пара (до {format_minutes(end)}, осталось {end - minute} мин):\n{format_class_info(class_item)}\n"
+        # Следующая пара ищется с момента окончания текущей
+        found = find_next_class(COMPILED_SCHEDULE, class_date, end)
+        if found is None:
+            return text
+        class_date, class_item, start, end, _ = found
+
+    when = f"{format_class_day(class_date, today)} в {format_minutes(start)}"
+    if class_date == today:
+        when += f" (через {start - minute} мин)"
+    text += f"⏭ Следующая пара {when}:\n{format_class_info(class_item)}"
+    return text
+
+def find_classes(query, current_time=None):
+    """Ближайшие даты занятий по предмету, аудитории или адресу (поддерживает начало слова)"""
+    if not COMPILED_SCHEDULE:
+        return "❌ Расписание не загружено"
 
-                if not classes:
-                    note = day.get('note', 'Нет занятий')
-                    response += f"   {note}\n\n"
-                else:
-                    for class_item in classes:
-                        response += f"   {format_class_info(class_item)}\n"
-                response += "\n"
+    matches = search_classes(COMPILED_SCHEDULE, query)
+    if not matches:
+        return f"🔍 По запросу «{query}» ничего не найдено"
 
-            return response
+    if current_time is None:
+        current_time = get_moscow_time()
+    today = current_time.date()
+    found = next_class_dates(COMPILED_SCHEDULE, matches, today, current_time.hour * 60 + current_time.minute)
+    if not found:
+        return f"🔍 По запросу «{query}» в ближайшие {SEARCH_LOOKAHEAD_DAYS} дней пар нет"
 
-    return "❌ Расписание не найдено"
+    text = f"🔍 Ближайшие пары по запросу «{query}»:\n\n"
+    for class_date, class_item, start, end in found:
+        text += f"📅 {format_class_day(class_date, today)}\n{format_class_info(class_item)}\n"
+    return text.rstrip()
 
 def get_moscow_time():
     """Получает текущее время в Москве"""
@@ -261,19 +487,121 @@ def get_days_since_date(target_date_str, current_time=None):
     except ValueError:
         return None
 
+def get_compiled_schedule():
+    """Текущая скомпилированная модель расписания (для ленты iCalendar)"""
+    return COMPILED_SCHEDULE
+
+def warm_up_schedule():
+    """Прогревает часовой пояс и функции расписания перед первым запросом"""
+    get_schedule_for_date()
+    get_week_schedule()
+    get_next_class()
+    if COMPILED_SCHEDULE:
+        get_calendar_feed(COMPILED_SCHEDULE, get_schedule_group(COMPILED_SCHEDULE))
+
+# Единый планировщик напоминаний для всех подписчиков
+reminder_scheduler = ReminderScheduler(get_compiled_schedule)
+add_schedule_listener(reminder_scheduler.on_schedule_reload)
+
+# Рассылки администратора с сохранением прогресса
+broadcast_manager = BroadcastManager(get_worker_id())
+BROADCAST_ACTIONS = {'pause': PAUSED, 'resume': RUNNING, 'cancel': CANCELLED}
+
+# Индекс активности для вытеснения состояния неактивных пользователей
+state_retention = StateRetention()
+
 def get_main_menu():
     """Возвращает главное меню с командами"""
     keyboard = [
         [InlineKeyboardButton("📅 Сегодня", callback_data='today')],
+        [InlineKeyboardButton("⏭ Следующая пара", callback_data='next')],
         [InlineKeyboardButton("📆 Конкретная дата", callback_data='date')],
         [InlineKeyboardButton("📅 На неделю", callback_data='week')]
     ]
     return InlineKeyboardMarkup(keyboard)
 
+def get_week_navigation(offset):
+    """Кнопки ◀/▶ для недели со сдвигом offset
+
+    Листать можно по всему семестру и на WEEK_NAVIGATION_LIMIT недель от текущей:
+    недели вне предрасчитанных страниц собираются get_week_schedule из текста типа недели.
+    """
+    week_pages = COMPILED_SCHEDULE['week_pages'] if COMPILED_SCHEDULE else {}
+    monday = get_week_monday(offset).toordinal()
+    has_prev = offset > -WEEK_NAVIGATION_LIMIT or monday - 7 in week_pages
+    has_next = offset < WEEK_NAVIGATION_LIMIT or monday + 7 in week_pages
+    return build_week_keyboard(offset, has_prev, has_next)
+
+@functools.lru_cache(maxsize=128)
+def build_week_keyboard(offset, has_prev, has_next):
+    """Клавиатура страницы недели; одинаковые клавиатуры собираются один раз"""
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton("◀ Пред. неделя", callback_data=f'week:{offset - 1}'))
+    if has_next:
+        navigation.append(InlineKeyboardButton("След. неделя ▶", callback_data=f'week:{offset + 1}'))
+
+    keyboard = [navigation] if navigation else []
+    # Рядом с текущей неделей к ней ведет кнопка ◀ или ▶
+    if abs(offset) > 1:
+        keyboard.append([InlineKeyboardButton("📅 Текущая неделя", callback_data='week:0')])
+    keyboard.extend(get_main_menu().inline_keyboard)
+    return InlineKeyboardMarkup(keyboard)
+
+MONTH_NAMES = (
+    "Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
+    "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"
+)
+CALENDAR_WEEKDAYS = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+DATE_MESSAGE_RE = re.compile(r'^\d{1,2}\.\d{1,2}$')
+
+def get_date_picker(year=None, month=None):
+    """Календарь для выбора даты; по умолчанию текущий месяц с отмеченным сегодняшним днем"""
+    today = get_moscow_time().date()
+    year = year or today.year
+    month = month or today.month
+    marked_day = today.day if (year, month) == (today.year, today.month) else 0
+    return build_month_keyboard(year, month, marked_day)
+
+@functools.lru_cache(maxsize=64)
+def build_month_keyboard(year, month, marked_day):
+    """Клавиатура месяца: день - day:ГГГГММДД, листание - cal:ГГГГ-ММ; собирается один раз на месяц"""
+    keyboard = [
+        [InlineKeyboardButton(f"{MONTH_NAMES[month - 1]} {year}", callback_data='noop')],
+        [InlineKeyboardButton(name, callback_data='noop') for name in CALENDAR_WEEKDAYS]
+    ]
+    for week in calendar.monthcalendar(year, month):
+        keyboard.append([
+            InlineKeyboardButton(' ', callback_data='noop') if day == 0 else InlineKeyboardButton(
+                f"•{day}•" if day == marked_day else str(day), callback_data=f'day:{year:04d}{month:02d}{day:02d}'
+            )
+            for day in week
+        ])
+
+    prev_year, prev_month = (year, month - 1) if month > 1 else (year - 1, 12)
+    next_year, next_month = (year, month + 1) if month < 12 else (year + 1, 1)
+    keyboard.append([
+        InlineKeyboardButton(f"◀ {MONTH_NAMES[prev_month - 1]}", callback_data=f'cal:{prev_year:04d}-{prev_month:02d}'),
+        InlineKeyboardButton(f"{MONTH_NAMES[next_month - 1]} ▶", callback_data=f'cal:{next_year:04d}-{next_month:02d}')
+    ])
+    keyboard.extend(get_main_menu().inline_keyboard)
+    return InlineKeyboardMarkup(keyboard)
+
+def parse_picked_date(callback_data):
+    """Дата из callback_data вида day:ГГГГММДД или None"""
+    try:
+        return datetime.strptime(callback_data[4:], '%Y%m%d').replace(tzinfo=ZoneInfo("Europe/Moscow"))
+    except ValueError:
+        return None
+
+# Кнопки меню, нажатия которых учитываются в статистике
+MENU_ACTIONS = ('today', 'next', 'date', 'week')
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
     user_id = update.message.from_user.id
     add_user(user_id)
+    usage_analytics.record('/start', user_id)
     logger.info(f"Новый пользователь: {user_id}")
 
     await update.message.reply_text(
@@ -285,7 +613,25 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик нажатий кнопок"""
     query = update.callback_query
-    await query.answer()
+    # Ответ на нажатие не зависит от нового текста сообщения, поэтому идет параллельно
+    # с его подготовкой и редактированием: нажатие стоит один сетевой круг вместо двух
+    answer = asyncio.create_task(query.answer())
+    try:
+        await handle_button(query, context)
+    finally:
+        await settle_answer(answer)
+
+async def settle_answer(answer):
+    """Дожидается ответа на нажатие; его ошибка не должна скрывать результат обработчика"""
+    try:
+        await answer
+    except Exception as e:
+        logger.debug(f"Не удалось ответить на нажатие кнопки: {e}")
+
+async def handle_button(query, context):
+    """Выполняет действие кнопки"""
+    if query.data in MENU_ACTIONS:
+        usage_analytics.record(query.data, query.from_user.id)
 
     if query.data == 'today':
         schedule = get_schedule_for_date()
@@ -295,33 +641,161 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=get_main_menu()
         )
 
-    elif query.data == 'date':
+    elif query.data == 'next':
         await query.edit_message_text(
-            text='📝 Введите дату в формате ДД.ММ (например: 25.12)\n\nПосле ввода даты выберите следующее действие:',
+            text=f"{get_next_class()}\n\nВыберите следующее действие:",
             reply_markup=get_main_menu()
         )
-        context.user_data['waiting_for_date'] = True
 
-    elif query.data == 'week':
-        schedule = get_week_schedule()
-        # Показываем расписание и меню
+    elif query.data == 'date':
+        # Дата выбирается в календаре и приходит в callback_data, состояние диалога не нужно
+        await query.edit_message_text(text='📆 Выберите дату:', reply_markup=get_date_picker())
+
+    elif query.data.startswith('cal:'):
+        try:
+            year, month = map(int, query.data[4:].split('-'))
+            keyboard = get_date_picker(year, month)
+        except (ValueError, IndexError):
+            return
+        await query.edit_message_text(text='📆 Выберите дату:', reply_markup=keyboard)
+
+    elif query.data.startswith('day:'):
+        target_date = parse_picked_date(query.data)
+        if target_date is None or not COMPILED_SCHEDULE:
+            return
+        usage_analytics.record('date_pick', query.from_user.id)
         await query.edit_message_text(
-            text=f"{schedule}\n\nВыберите следующее действие:",
+            text=f"{render_day_schedule(target_date)}\n\nВыберите следующее действие:",
             reply_markup=get_main_menu()
         )
 
+    elif query.data.startswith('bc:'):
+        await handle_broadcast_action(query, context)
+
+    elif query.data == 'week' or query.data.startswith('week:'):
+        try:
+            offset = int(query.data.partition(':')[2] or 0)
+        except ValueError:
+            return
+        if offset:
+            usage_analytics.record('week_nav', query.from_user.id)
+        await query.edit_message_text(
+            text=f"{get_week_schedule(offset)}\n\nВыберите следующее действие:",
+            reply_markup=get_week_navigation(offset)
+        )
+
+async def next_class_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /next"""
+    usage_analytics.record('/next', update.message.from_user.id)
+    await update.message.reply_text(
+        f"{get_next_class()}\n\nВыберите следующее действие:",
+        reply_markup=get_main_menu()
+    )
+
+async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /find <предмет, аудитория или адрес>"""
+    usage_analytics.record('/find', update.message.from_user.id)
+    query = ' '.join(context.args or []).strip()
+    if not query:
+        text = '🔍 Использование: /find <предмет, аудитория или адрес>\nНапример: /find матан или /find 2304'
+    else:
+        text = find_classes(query)
+    await update.message.reply_text(text, reply_markup=get_main_menu())
+
+async def remind_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /remind [минуты|off]"""
+    user_id = update.message.from_user.id
+    usage_analytics.record('/remind', user_id)
+    backend = get_backend()
+    offsets = ', '.join(map(str, REMINDER_OFFSETS))
+    args = context.args or []
+
+    if args and args[0].lower() in ('off', 'выкл', 'стоп'):
+        backend.set_reminder(user_id, None)
+        text = "🔕 Напоминания о парах выключены"
+    elif args:
+        try:
+            minutes = int(args[0])
+        except ValueError:
+            minutes = None
+        if minutes not in REMINDER_OFFSETS:
+            text = f"❌ Можно напоминать за {offsets} минут. Например: /remind 10"
+        else:
+            backend.set_reminder(user_id, minutes)
+            text = f"🔔 Напомню о каждой паре за {minutes} мин"
+    else:
+        minutes = backend.get_reminders().get(user_id)
+        if minutes:
+            text = f"🔔 Напоминания включены: за {minutes} мин до пары\n\nИзменить: /remind <{offsets}>\nВыключить: /remind off"
+        else:
+            backend.set_reminder(user_id, DEFAULT_REMINDER_MINUTES)
+            text = (
+                f"🔔 Напомню о каждой паре за {DEFAULT_REMINDER_MINUTES} мин\n\n"
+                f"Изменить: /remind <{offsets}>\nВыключить: /remind off"
+            )
+
+    await update.message.reply_text(text, reply_markup=get_main_menu())
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /broadcast <текст> (только для администраторов)"""
+    message = update.message
+    if not is_admin(message.from_user.id):
+        await message.reply_text('❓ Неизвестная команда. Выберите действие из меню:', reply_markup=get_main_menu())
+        return
+
+    # Текст берется целиком, с переносами строк
+    parts = message.text.split(maxsplit=1)
+    text = parts[1].strip() if len(parts) > 1 else ''
+    if not text:
+        job = load_job()
+        if job:
+            await message.reply_text(format_job_status(job), reply_markup=job_keyboard(job))
+        else:
+            await message.reply_text('📣 Использование: /broadcast <текст рассылки>')
+        return
+
+    job, created = broadcast_manager.create_job(text, message.chat_id)
+    if not created:
+        await message.reply_text(
+            f"⚠️ Уже есть незавершенная рассылка\n\n{format_job_status(job)}", reply_markup=job_keyboard(job)
+        )
+        return
+
+    status_message = await message.reply_text(format_job_status(job), reply_markup=job_keyboard(job))
+    job['status_message_id'] = status_message.message_id
+    save_job(job)
+    broadcast_manager.start(context.bot, job)
+    logger.info(f"📣 Администратор {message.from_user.id} запустил рассылку {job['id']}")
+
+async def handle_broadcast_action(query, context):
+    """Пауза, продолжение и отмена рассылки кнопками в сообщении с прогрессом"""
+    if not is_admin(query.from_user.id):
+        return
+
+    _, action, job_id = query.data.split(':', 2)
+    status = BROADCAST_ACTIONS.get(action)
+    job = broadcast_manager.set_status(job_id, status) if status else None
+    if job is None:
+        await query.edit_message_text(text='⚠️ Рассылка уже завершена')
+        return
+
+    if job['status'] == RUNNING:
+        broadcast_manager.start(context.bot, job)
+    await query.edit_message_text(text=format_job_status(job), reply_markup=job_keyboard(job))
+    logger.info(f"📣 Рассылка {job_id}: {action} (администратор {query.from_user.id})")
+
 async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик текстовых сообщений"""
-    if context.user_data.get('waiting_for_date'):
-        date_str = update.message.text.strip()
-        schedule = get_schedule_for_date(date_str)
+    text = update.message.text.strip()
+    # Дату в формате ДД.ММ по-прежнему можно написать сообщением, без выбора в календаре
+    if DATE_MESSAGE_RE.match(text):
+        schedule = get_schedule_for_date(text)
 
         # Показываем расписание и меню
         await update.message.reply_text(
             f"{schedule}\n\nВыберите следующее действие:",
             reply_markup=get_main_menu()
         )
-        context.user_data['waiting_for_date'] = False
     else:
         # Показываем меню для неизвестных команд
         await update.message.reply_text(
@@ -329,18 +803,32 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=get_main_menu()
         )
 
+async def track_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отмечает пользователя и чат активными (до остальных обработчиков)"""
+    state_retention.touch_update(update)
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик ошибок"""
     logger.error(f'Update {update} caused error {context.error}')
     if update and update.message:
         await update.message.reply_text('❌ Произошла ошибка. Попробуйте еще раз.')
 
+async def _timed_phase(name, coro):
+    """Выполняет корутину и записывает длительность фазы запуска"""
+    phase_started = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        record_startup_phase(name, phase_started)
+
 async def create_application():
     """Создает и настраивает Telegram Application асинхронно"""
     logger.info("🚀 Инициализация Telegram бота ИТМО...")
 
     # Загружаем расписание
+    phase_started = time.perf_counter()
     load_schedule()
+    record_startup_phase('load_schedule', phase_started)
 
     if not SCHEDULE_DATA:
         logger.error("❌ Не удалось загрузить расписание из переменной окружения SCHEDULE_JSON")
@@ -355,26 +843,70 @@ async def create_application():
         return None
 
     # Создаем приложение
-    application = Application.builder().token(token).build()
+    phase_started = time.perf_counter()
+    # TracingRequest замеряет каждый вызов Bot API для трассировки задержек обновлений
+    application = (
+        Application.builder()
+        .token(token)
+        .request(TracingRequest(connection_pool_size=256))
+        .build()
+    )
+    record_startup_phase('build_application', phase_started)
     logger.info("📱 Application создан с токеном")
 
     # Инициализируем приложение асинхронно (обязательно для версии 21.7+)
-    await application.initialize()
+    # и параллельно устанавливаем webhook через тот же пул соединений
+    if BOT_MODE == 'polling':
+        await _timed_phase('initialize', application.initialize())
+    else:
+        phase_started = time.perf_counter()
+        await asyncio.gather(
+            _timed_phase('initialize', application.initialize()),
+            _timed_phase('set_webhook', set_webhook_async(application.bot))
+        )
+        record_startup_phase('initialize_and_webhook', phase_started)
     logger.info("🔧 Application инициализирован асинхронно")
 
     # Регистрируем обработчики
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CallbackQueryHandler(button_handler))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_handler))
+    # Группа -1 выполняется до остальных: отмечает активность для вытеснения состояния
+    application.add_handler(TypeHandler(Update, track_activity), group=-1)
+    # traced_handler относит вызовы Bot API к обработчику в статистике задержек /status
+    application.add_handler(CommandHandler("start", traced_handler(start)))
+    application.add_handler(CommandHandler("next", traced_handler(next_class_command)))
+    application.add_handler(CommandHandler("find", traced_handler(find_command)))
+    application.add_handler(CommandHandler("remind", traced_handler(remind_command)))
+    application.add_handler(CommandHandler("broadcast", traced_handler(broadcast_command)))
+    application.add_handler(CallbackQueryHandler(traced_handler(button_handler)))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, traced_handler(message_handler)))
     application.add_error_handler(error_handler)
     logger.info("🎯 Обработчики команд зарегистрированы")
 
     logger.info("✅ Telegram Application создан и настроен")
     return application
 
+def register_server_hooks(application):
+    """Подключает к веб-серверу прогрев, расписание, напоминания и их статус"""
+    register_warmup_hook(warm_up_schedule)
+    register_schedule_provider(get_compiled_schedule)
+    register_schedule_reloader(reload_schedule)
+    register_background_task(lambda: reminder_scheduler.run(application.bot))
+    # Рассылка, прерванная перезапуском, продолжается с сохраненного курсора
+    register_background_task(lambda: broadcast_manager.resume(application.bot))
+    register_status_provider('reminders', reminder_scheduler.snapshot)
+    # user_data, chat_data и диалоги неактивных пользователей удаляются по TTL
+    register_background_task(lambda: state_retention.run(application))
+    register_status_provider('state_retention', state_retention.snapshot)
+    # Перезагрузка через /admin/schedule доходит до всех воркеров через общее хранилище
+    register_background_task(run_schedule_sync)
+    # Рассылка об изменениях идет в цикле процессора, где работает бот, и только из одного воркера
+    add_schedule_listener(
+        lambda old_model, new_model: submit_to_processor(notify_schedule_changes(application.bot, old_model, new_model)),
+        origin_only=True
+    )
+
 async def main():
-    """Основная асинхронная функция запуска бота с webhook"""
-    logger.info("🚀 Запуск Telegram бота ИТМО с webhook...")
+    """Основная асинхронная функция запуска бота с webhook или polling"""
+    logger.info(f"🚀 Запуск Telegram бота ИТМО в режиме {BOT_MODE}...")
 
     # Создаем Telegram Application асинхронно
     application = await create_application()
@@ -383,20 +915,38 @@ async def main():
         return
 
     # Инициализируем веб-сервер с Telegram Application
+    register_server_hooks(application)
     initialize_telegram_app(application)
 
     # Обновляем статус бота
     update_bot_status(running=True)
 
-    logger.info("✅ Бот готов к работе через webhook")
+    logger.info(f"✅ Бот готов к работе через {BOT_MODE}")
 
     # Запускаем веб-сервер (блокирующий вызов)
     run_server()
 
+def bootstrap():
+    """Запускает бота внутри воркера gunicorn (см. wsgi.py) без встроенного сервера Flask"""
+    # Event loop не закрывается, как и при запуске через python main.py
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    application = loop.run_until_complete(create_application())
+    if not application:
+        logger.error("❌ Не удалось создать Telegram Application")
+        return None
+
+    register_server_hooks(application)
+    initialize_telegram_app(application)
+    prepare_server()
+
+    logger.info("✅ Воркер готов к работе через webhook")
+    return application
+
 if __name__ == '__main__':
     """Основная функция - точка входа"""
     try:
-        import asyncio
         asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("⏹️ Остановка бота пользователем...")
@@ -0,0 +1,113 @@
+"""
+Профилирование обработки обновлений по требованию
+
+Профилируется доля обновлений PROFILE_SAMPLE_RATE или все обновления в течение окна,
+запущенного через защищенный админский эндпоинт. Обработчики выполняются конкурентно
+в одном потоке, поэтому используется один cProfile на "сессию": он включается
+с первым выбранным обновлением и выключается, когда выбранных в обработке не осталось.
+Статистика сессий накапливается в pstats и отдается файлом .prof
+(открывается snakeviz, flameprof, gprof2dot или python -m pstats).
+
+cProfile и pstats импортируются при первом профилируемом обновлении: по умолчанию
+профилирование выключено, и холодный старт за них не платит.
+"""
+
+import io
+import os
+import time
+import random
+import marshal
+import threading
+
+# Доля профилируемых обновлений (0 - только окна по запросу)
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+# Максимальная длительность окна профилирования в секундах
+PROFILE_MAX_WINDOW = 600
+# Ключи сортировки отчета, которые принимает pstats.Stats.sort_stats
+PROFILE_SORT_KEYS = (
+    'calls', 'cumtime', 'cumulative', 'filename', 'line', 'module', 'name',
+    'ncalls', 'nfl', 'pcalls', 'stdname', 'time', 'tottime'
+)
+
+class UpdateProfiler:
+    """Выборочный профилировщик process_update с накоплением статистики"""
+
+    def __init__(self, sample_rate=PROFILE_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self._window_until = 0.0
+        self._profile = None
+        self._active = 0
+        self._stats = None
+        self._lock = threading.Lock()
+        self.profiled_updates = 0
+
+    def start_window(self, seconds):
+        """Профилирует все обновления в течение seconds секунд"""
+        seconds = max(0, min(float(seconds), PROFILE_MAX_WINDOW))
+        self._window_until = time.time() + seconds
+        return self._window_until
+
+    def window_active(self):
+        return time.time() < self._window_until
+
+    def begin(self):
+        """Вызывается перед process_update в потоке процессора; возвращает, выбрано ли обновление"""
+        if not (self.window_active() or (self.sample_rate > 0 and random.random() < self.sample_rate)):
+            return False
+
+        if self._active == 0:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        self._active += 1
+        return True
+
+    def end(self, sampled):
+        """Вызывается после process_update; завершает сессию, когда выбранных обновлений не осталось"""
+        if not sampled:
+            return
+
+        self._active -= 1
+        self.profiled_updates += 1
+        if self._active == 0 and self._profile is not None:
+            self._profile.disable()
+            with self._lock:
+                if self._stats is None:
+                    import pstats
+                    self._stats = pstats.Stats(self._profile)
+                else:
+                    self._stats.add(self._profile)
+            self._profile = None
+
+    def reset(self):
+        """Сбрасывает накопленную статистику"""
+        with self._lock:
+            self._stats = None
+        self.profiled_updates = 0
+
+    def dump(self):
+        """Статистика в формате файла pstats (marshal), None если данных нет"""
+        with self._lock:
+            if self._stats is None:
+                return None
+            return marshal.dumps(self._stats.stats)
+
+    def report(self, limit=30, sort='cumulative'):
+        """Текстовый отчет с самыми дорогими функциями"""
+        with self._lock:
+            if self._stats is None:
+                return "Нет данных профилирования"
+            stream = io.StringIO()
+            self._stats.stream = stream
+            self._stats.sort_stats(sort).print_stats(limit)
+            return stream.getvalue()
+
+    def snapshot(self):
+        """Состояние профилировщика для /status"""
+        return {
+            'sample_rate': self.sample_rate,
+            'window_active': self.window_active(),
+            'window_until': self._window_until or None,
+            'profiled_updates': self.profiled_updates,
+            'has_stats': self._stats is not None
+        }
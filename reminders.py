@@ -0,0 +1,187 @@
+"""
+Напоминания о парах за N минут до начала
+
+Вместо отдельной задачи на каждого пользователя и каждую пару используется одна
+куча событий с ключом (группа, начало пары, за сколько минут напомнить). События
+строятся из предрасчитанных интервалов модели расписания на ближайшие дни; при
+наступлении события сообщение рассылается всем подписчикам с этим интервалом
+через RateLimitedSender. Подписчики хранятся один раз в хранилище состояния,
+поэтому размер кучи не зависит от их числа.
+
+При перезагрузке расписания события пересчитываются инкрементально: в куче
+остаются неизменившиеся события, удаленные помечаются устаревшими, новые добавляются.
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from calendar_feed import get_schedule_group
+from delivery import RateLimitedSender, SENT
+from schedule_model import format_class_info, week_type_for_date
+from state_backend import get_backend
+
+logger = logging.getLogger(__name__)
+
+# За сколько минут до пары можно получать напоминания
+REMINDER_OFFSETS = (5, 10, 15, 30)
+# Интервал по умолчанию для /remind без аргумента
+DEFAULT_REMINDER_MINUTES = int(os.getenv('REMINDER_MINUTES', '10'))
+# На сколько дней вперед строятся события
+REMINDER_HORIZON_DAYS = 2
+# Напоминание, опоздавшее больше чем на столько секунд (например, после перезапуска), пропускается
+REMINDER_GRACE = 120
+# Максимальный сон планировщика: за это время он замечает перезагрузку расписания
+REMINDER_MAX_SLEEP = 30
+
+MOSCOW_TZ = ZoneInfo("Europe/Moscow")
+
+def build_reminder_events(model, group, start_date, days=REMINDER_HORIZON_DAYS, offsets=REMINDER_OFFSETS):
+    """События напоминаний на days дней с start_date: ключ (группа, начало, интервал) -> (момент отправки, текст)"""
+    calendar = model['calendar']
+    intervals = model['intervals']
+    events = {}
+
+    for offset_days in range(days):
+        current_date = start_date + timedelta(days=offset_days)
+        week_type = calendar.get(current_date.toordinal()) or week_type_for_date(current_date)
+        key = (week_type, current_date.weekday())
+        day_intervals = intervals.get(key)
+        if not day_intervals:
+            continue
+
+        classes = model['days'][key]['classes']
+        starts, _, positions = day_intervals
+        for start, position in zip(starts, positions):
+            start_ts = datetime(
+                current_date.year, current_date.month, current_date.day,
+                start // 60, start % 60, tzinfo=MOSCOW_TZ
+            ).timestamp()
+            class_text = format_class_info(classes[position])
+            for minutes in offsets:
+                events[(group, start_ts, minutes)] = (start_ts - minutes * 60, f"⏰ Через {minutes} мин пара:\n{class_text}")
+    return events
+
+class ReminderScheduler:
+    """Одна куча событий напоминаний для всех подписчиков"""
+
+    def __init__(self, get_model, offsets=REMINDER_OFFSETS, horizon_days=REMINDER_HORIZON_DAYS):
+        self.get_model = get_model
+        self.group = None
+        self.offsets = offsets
+        self.horizon_days = horizon_days
+        self._heap = []
+        self._events = {}
+        self._built_for = None
+        self._lock = threading.Lock()
+        self._tasks = set()
+        self.stats = {'fired': 0, 'sent': 0, 'skipped': 0}
+
+    def rebuild(self, model=None, now=None):
+        """Инкрементально пересчитывает события на горизонт от текущего дня"""
+        model = model or self.get_model()
+        if not model:
+            return 0, 0
+
+        now = time.time() if now is None else now
+        today = datetime.fromtimestamp(now, MOSCOW_TZ).date()
+        self.group = get_schedule_group(model)
+        events = {
+            key: event
+            for key, event in build_reminder_events(model, self.group, today, self.horizon_days, self.offsets).items()
+            if event[0] > now
+        }
+
+        with self._lock:
+            added = 0
+            for key, event in events.items():
+                old_event = self._events.get(key)
+                if old_event is None or old_event[0] != event[0]:
+                    heapq.heappush(self._heap, (event[0], key))
+                    added += 1
+            removed = len(self._events.keys() - events.keys())
+            # Записи кучи без события в словаре пропускаются при извлечении
+            self._events = events
+            self._built_for = today
+            # Куча сжимается, когда устаревших записей становится больше актуальных
+            if len(self._heap) > 2 * len(self._events) + 64:
+                self._heap = [(event[0], key) for key, event in self._events.items()]
+                heapq.heapify(self._heap)
+
+        if added or removed:
+            logger.info(f"⏰ События напоминаний пересчитаны: +{added}, -{removed}, всего {len(events)}")
+        return added, removed
+
+    def on_schedule_reload(self, old_model, new_model):
+        """Слушатель перезагрузки расписания"""
+        self.rebuild(new_model)
+
+    def pop_due(self, now):
+        """Извлекает наступившие события; возвращает список (ключ, момент отправки, текст) и время до следующего"""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                fire_at, key = heapq.heappop(self._heap)
+                event = self._events.get(key)
+                if event is None or event[0] != fire_at:
+                    continue
+                del self._events[key]
+                due.append((key, fire_at, event[1]))
+            next_at = self._heap[0][0] if self._heap else None
+        return due, next_at
+
+    async def fire(self, sender, key, text):
+        """Рассылает напоминание подписчикам с нужным интервалом; один воркер на событие"""
+        _, start_ts, minutes = key
+        backend = get_backend()
+        # При нескольких воркерах событие обрабатывает тот, кто первым его занял
+        if not backend.claim_job(f"reminder:{self.group}:{int(start_ts)}:{minutes}", ttl=minutes * 60 + 3600):
+            return
+
+        subscribers = [
+            user_id for user_id, user_minutes in backend.get_reminders().items() if user_minutes == minutes
+        ]
+        if not subscribers:
+            return
+
+        active = backend.get_active_users()
+        results = await sender.send_many([user_id for user_id in subscribers if user_id in active], text)
+        self.stats['fired'] += 1
+        self.stats['sent'] += results[SENT]
+        logger.info(f"⏰ Напоминание за {minutes} мин отправлено: {results[SENT]} из {len(subscribers)}")
+
+    async def run(self, bot):
+        """Цикл планировщика в event loop процессора обновлений"""
+        sender = RateLimitedSender(bot)
+        self.rebuild()
+        logger.info(f"⏰ Планировщик напоминаний запущен, событий: {len(self._events)}")
+
+        while True:
+            now = time.time()
+            # Горизонт сдвигается с наступлением нового дня
+            if datetime.fromtimestamp(now, MOSCOW_TZ).date() != self._built_for:
+                self.rebuild(now=now)
+
+            due, next_at = self.pop_due(now)
+            for key, fire_at, text in due:
+                if now - fire_at > REMINDER_GRACE:
+                    self.stats['skipped'] += 1
+                    continue
+                # Долгая рассылка не задерживает следующие события
+                task = asyncio.create_task(self.fire(sender, key, text))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+            sleep_for = REMINDER_MAX_SLEEP if next_at is None else min(REMINDER_MAX_SLEEP, next_at - now)
+            await asyncio.sleep(max(0.0, sleep_for))
+
+    def snapshot(self):
+        """Состояние планировщика для /status"""
+        with self._lock:
+            next_at = min((event[0] for event in self._events.values()), default=None)
+            return dict(self.stats, pending_events=len(self._events), heap_size=len(self._heap), next_at=next_at)
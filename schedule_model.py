@@ -0,0 +1,494 @@
+"""
+Скомпилированная модель расписания
+Проверяет SCHEDULE_JSON, строит индексированную модель с интернированными строками,
+предрасчитанным календарем четности недель, готовыми текстами дней и недель
+и страницами всех недель семестра для навигации по неделям. Для поиска по предмету,
+аудитории и адресу строится инвертированный индекс: отсортированные токены и
+списки занятий (неделя, день недели, позиция), префиксы ищутся бинарным поиском.
+Для поиска текущей и следующей пары время занятий заранее разбирается
+в отсортированные интервалы в минутах. Модель сохраняется в версионированный бинарный снимок (marshal), который main.py
+загружает при старте вместо разбора и компиляции JSON.
+"""
+
+import os
+import re
+import sys
+import bisect
+import struct
+import marshal
+import hashlib
+from datetime import date, datetime, timedelta
+
+# Версия формата снимка: увеличивайте при любом изменении структуры модели
+SNAPSHOT_VERSION = 4
+SNAPSHOT_MAGIC = b'ITMOSCH'
+SNAPSHOT_HEADER = struct.Struct('<7sHH')
+
+WEEKDAYS = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
+WEEKDAY_INDEX = {name: index for index, name in enumerate(WEEKDAYS)}
+
+# Базовая дата - 6 октября 2025, понедельник, начало четной недели
+BASE_MONDAY = date(2025, 10, 6)
+
+# Границы семестра для предрасчета календаря (ДД.ММ.ГГГГ); без них семестр определяется по текущей дате
+SEMESTER_START = os.getenv('SEMESTER_START')
+SEMESTER_END = os.getenv('SEMESTER_END')
+
+# На сколько дней вперед искать следующую пару
+NEXT_CLASS_LOOKAHEAD_DAYS = 14
+
+# Поля занятия, изменения которых попадают в уведомление, и их подписи
+CHANGE_FIELDS = (('time', 'время'), ('room', 'ауд.'), ('address', 'адрес'))
+
+CLASS_FIELDS = ('subject', 'time', 'room', 'address')
+# Поля занятия, по которым работает поиск (teacher - необязательное поле)
+SEARCH_FIELDS = ('subject', 'room', 'address', 'teacher')
+SEARCH_TOKEN_RE = re.compile(r'\w+')
+# На сколько дней вперед ищутся даты найденных занятий
+SEARCH_LOOKAHEAD_DAYS = 28
+TIME_RANGE_RE = re.compile(r'^\s*(\d{1,2})[:.](\d{2})\s*[-–—]\s*(\d{1,2})[:.](\d{2})\s*$')
+
+class ScheduleError(ValueError):
+    """Ошибка проверки или загрузки расписания"""
+
+def format_class_info(class_item):
+    """Форматирует информацию о занятии в минималистичном стиле"""
+    if 'window' in class_item:
+        return f"🪟 Окно {class_item['window']} ({class_item['duration']})"
+    else:
+        return (
+            f"📚 {class_item['subject']}\n"
+            f"⏰ {class_item['time']} • Ауд. {class_item['room']}\n"
+            f"📍 {class_item['address']}\n"
+        )
+
+def parse_time_range(time_str):
+    """Разбирает строку вида '08:20-09:50' в минуты от начала дня (начало, конец)"""
+    match = TIME_RANGE_RE.match(time_str or '')
+    if not match:
+        return None
+
+    start_hour, start_minute, end_hour, end_minute = map(int, match.groups())
+    start = start_hour * 60 + start_minute
+    end = end_hour * 60 + end_minute
+    if start_hour > 23 or end_hour > 23 or start_minute > 59 or end_minute > 59 or end <= start:
+        return None
+    return start, end
+
+def week_type_for_date(target_date):
+    """Определяет тип недели (1 - нечетная, 2 - четная) для даты без часового пояса"""
+    reference_monday = target_date - timedelta(days=target_date.weekday())
+    weeks_since_base = (reference_monday - BASE_MONDAY).days // 7
+    return 2 if weeks_since_base % 2 == 0 else 1
+
+def parse_semester_date(date_str):
+    """Разбирает дату границы семестра в формате ДД.ММ.ГГГГ"""
+    return datetime.strptime(date_str, "%d.%m.%Y").date()
+
+def validate_schedule(data):
+    """Проверяет структуру расписания, возвращает (ошибки, предупреждения)"""
+    errors = []
+    warnings = []
+
+    if not isinstance(data, dict) or not isinstance(data.get('schedule'), list):
+        return ["Ожидается объект с ключом 'schedule' (список недель)"], warnings
+
+    seen_weeks = set()
+    for week_pos, week in enumerate(data['schedule']):
+        where = f"schedule[{week_pos}]"
+        if not isinstance(week, dict):
+            errors.append(f"{where}: неделя должна быть объектом")
+            continue
+
+        week_type = week.get('week')
+        if week_type not in (1, 2):
+            errors.append(f"{where}: 'week' должен быть 1 (нечетная) или 2 (четная), получено {week_type!r}")
+        elif week_type in seen_weeks:
+            warnings.append(f"{where}: неделя {week_type} описана повторно, будет использована первая")
+        seen_weeks.add(week_type)
+
+        if not isinstance(week.get('days'), list):
+            errors.append(f"{where}: 'days' должен быть списком")
+            continue
+
+        for day_pos, day in enumerate(week['days']):
+            day_where = f"{where}.days[{day_pos}]"
+            if not isinstance(day, dict):
+                errors.append(f"{day_where}: день должен быть объектом")
+                continue
+            if day.get('day') not in WEEKDAY_INDEX:
+                errors.append(f"{day_where}: неизвестный день недели {day.get('day')!r}")
+            if not isinstance(day.get('classes'), list):
+                errors.append(f"{day_where}: 'classes' должен быть списком")
+                continue
+
+            for class_pos, class_item in enumerate(day['classes']):
+                class_where = f"{day_where}.classes[{class_pos}]"
+                if not isinstance(class_item, dict):
+                    errors.append(f"{class_where}: занятие должно быть объектом")
+                    continue
+                if 'window' in class_item:
+                    if 'duration' not in class_item:
+                        errors.append(f"{class_where}: у окна нет поля 'duration'")
+                    continue
+
+                missing = [field for field in CLASS_FIELDS if field not in class_item]
+                if missing:
+                    errors.append(f"{class_where}: нет полей {', '.join(missing)}")
+                elif parse_time_range(str(class_item['time'])) is None:
+                    warnings.append(f"{class_where}: время {class_item['time']!r} не в формате ЧЧ:ММ-ЧЧ:ММ")
+
+    missing_weeks = {1, 2} - seen_weeks
+    if missing_weeks:
+        warnings.append(f"Нет описания недель: {', '.join(map(str, sorted(missing_weeks)))}")
+
+    return errors, warnings
+
+def _intern_value(value):
+    """Интернирует строки, чтобы повторяющиеся предметы и адреса хранились один раз"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+def current_semester(today=None):
+    """Границы семестра (начало, конец), в который попадает дата today
+
+    SEMESTER_START и SEMESTER_END задают границы явно. Без них осенний семестр
+    длится с 1 сентября по 31 января, весенний - с 1 февраля по 31 августа,
+    так что любая дата попадает в какой-то семестр.
+    """
+    today = today or date.today()
+    if today.month >= 9:
+        start, end = date(today.year, 9, 1), date(today.year + 1, 1, 31)
+    elif today.month == 1:
+        start, end = date(today.year - 1, 9, 1), date(today.year, 1, 31)
+    else:
+        start, end = date(today.year, 2, 1), date(today.year, 8, 31)
+
+    if SEMESTER_START:
+        start = parse_semester_date(SEMESTER_START)
+    if SEMESTER_END:
+        end = parse_semester_date(SEMESTER_END)
+    return start, end
+
+def build_calendar(start=None, end=None):
+    """Предрасчитывает тип недели для каждого дня семестра: порядковый номер даты -> тип"""
+    if start is None or end is None:
+        default_start, default_end = current_semester()
+        start = start or default_start
+        end = end or default_end
+
+    week_types = {}
+    current = start
+    while current <= end:
+        week_types[current.toordinal()] = week_type_for_date(current)
+        current += timedelta(days=1)
+    return week_types
+
+def format_week_page(monday, body):
+    """Страница расписания на неделю, начинающуюся с monday"""
+    sunday = monday + timedelta(days=6)
+    return f"📅 Расписание на неделю ({monday.strftime('%d.%m')} - {sunday.strftime('%d.%m.%Y')})\n\n{body}"
+
+def build_week_pages(rendered_weeks, calendar):
+    """Готовые страницы всех недель семестра: порядковый номер понедельника -> текст"""
+    pages = {}
+    for ordinal in sorted(calendar):
+        monday = date.fromordinal(ordinal - date.fromordinal(ordinal).weekday())
+        if monday.toordinal() in pages:
+            continue
+        # Тип недели берется по понедельнику, даже если семестр начинается в середине недели
+        body = rendered_weeks.get(calendar.get(monday.toordinal()) or week_type_for_date(monday))
+        if body is not None:
+            pages[monday.toordinal()] = format_week_page(monday, body)
+    return pages
+
+def build_intervals(days):
+    """Интервалы занятий каждого дня, отсортированные по началу
+
+    (неделя, день недели) -> (начала, окончания, позиции занятий в дне); окна
+    и занятия с нераспознанным временем пропускаются.
+    """
+    intervals = {}
+    for key, day in days.items():
+        parsed = []
+        for position, class_item in enumerate(day['classes']):
+            if 'window' in class_item:
+                continue
+            time_range = parse_time_range(str(class_item.get('time', '')))
+            if time_range:
+                parsed.append((time_range[0], time_range[1], position))
+
+        if parsed:
+            parsed.sort()
+            starts, ends, positions = zip(*parsed)
+            intervals[key] = (starts, ends, positions)
+    return intervals
+
+def find_next_class(model, target_date, minute, lookahead_days=NEXT_CLASS_LOOKAHEAD_DAYS):
+    """Находит текущую или ближайшую следующую пару бинарным поиском по интервалам
+
+    target_date - дата, minute - минута от начала дня. Возвращает
+    (дата, занятие, начало, конец, идет_сейчас) или None, если пар в ближайшие дни нет.
+    """
+    calendar = model['calendar']
+    intervals = model['intervals']
+    days = model['days']
+
+    for offset in range(lookahead_days + 1):
+        current_date = target_date + timedelta(days=offset)
+        week_type = calendar.get(current_date.toordinal()) or week_type_for_date(current_date)
+        key = (week_type, current_date.weekday())
+        day_intervals = intervals.get(key)
+        if not day_intervals:
+            continue
+
+        starts, ends, positions = day_intervals
+        index = 0
+        if offset == 0:
+            index = bisect.bisect_right(starts, minute)
+            # Пара, начавшаяся не позже текущей минуты, еще идет
+            if index > 0 and ends[index - 1] > minute:
+                position = positions[index - 1]
+                return current_date, days[key]['classes'][position], starts[index - 1], ends[index - 1], True
+            if index == len(starts):
+                continue
+
+        position = positions[index]
+        return current_date, days[key]['classes'][position], starts[index], ends[index], False
+    return None
+
+def normalize_tokens(text):
+    """Токены для поиска: нижний регистр, ё -> е, только буквы и цифры"""
+    return SEARCH_TOKEN_RE.findall(str(text).lower().replace('ё', 'е'))
+
+def build_search_index(days):
+    """Инвертированный индекс: (отсортированные токены, занятия (неделя, день недели, позиция) каждого токена)"""
+    postings = {}
+    for (week_type, weekday), day in days.items():
+        for position, class_item in enumerate(day['classes']):
+            if 'window' in class_item:
+                continue
+            for field in SEARCH_FIELDS:
+                for token in normalize_tokens(class_item.get(field, '')):
+                    postings.setdefault(token, set()).add((week_type, weekday, position))
+
+    tokens = tuple(sorted(postings))
+    return tokens, tuple(tuple(sorted(postings[token])) for token in tokens)
+
+def search_classes(model, query):
+    """Занятия, в которых каждое слово запроса является префиксом какого-то токена"""
+    tokens, postings = model['search_index']
+    found = None
+    for term in normalize_tokens(query):
+        start = bisect.bisect_left(tokens, term)
+        # Все токены с префиксом term идут подряд после start
+        end = bisect.bisect_left(tokens, term + '\uffff', start)
+        matched = set().union(*postings[start:end])
+        found = matched if found is None else found & matched
+        if not found:
+            return set()
+    return found or set()
+
+def next_class_dates(model, matches, target_date, minute=0, limit=5, lookahead_days=SEARCH_LOOKAHEAD_DAYS):
+    """Ближайшие даты найденных занятий: список (дата, занятие, начало, конец) в порядке времени
+
+    Занятия, закончившиеся к minute в день target_date, пропускаются.
+    """
+    by_day = {}
+    for week_type, weekday, position in matches:
+        by_day.setdefault((week_type, weekday), set()).add(position)
+
+    calendar = model['calendar']
+    intervals = model['intervals']
+    results = []
+    for offset in range(lookahead_days + 1):
+        current_date = target_date + timedelta(days=offset)
+        key = (calendar.get(current_date.toordinal()) or week_type_for_date(current_date), current_date.weekday())
+        positions = by_day.get(key)
+        if not positions or key not in intervals:
+            continue
+
+        for start, end, position in zip(*intervals[key]):
+            if position not in positions or (offset == 0 and end <= minute):
+                continue
+            results.append((current_date, model['days'][key]['classes'][position], start, end))
+            if len(results) >= limit:
+                return results
+    return results
+
+def compile_schedule(data, source_hash=None, semester=None):
+    """Строит индексированную модель расписания с готовыми текстами
+
+    semester - границы (начало, конец) для календаря и страниц недель, по умолчанию текущий семестр.
+    """
+    errors, _ = validate_schedule(data)
+    if errors:
+        raise ScheduleError(f"Расписание не прошло проверку: {errors[0]}")
+
+    days = {}
+    rendered_days = {}
+    rendered_weeks = {}
+
+    for week in data['schedule']:
+        week_type = week['week']
+        week_text = ""
+
+        for day in week['days']:
+            day_name = sys.intern(day['day'])
+            classes = [
+                {key: _intern_value(value) for key, value in class_item.items()}
+                for class_item in day['classes']
+            ]
+            note = day.get('note', 'Нет занятий')
+
+            week_text += f"📅 {day_name}:\n"
+            if not classes:
+                week_text += f"   {note}\n\n"
+            else:
+                for class_item in classes:
+                    week_text += f"   {format_class_info(class_item)}\n"
+            week_text += "\n"
+
+            # Как и раньше, при повторном описании дня побеждает первое
+            key = (week_type, WEEKDAY_INDEX[day_name])
+            if key in days:
+                continue
+
+            days[key] = {'day': day_name, 'classes': classes, 'note': note}
+            if not classes:
+                rendered_days[key] = note
+            else:
+                rendered_days[key] = "".join(format_class_info(class_item) + "\n" for class_item in classes)
+
+        rendered_weeks.setdefault(week_type, week_text)
+
+    calendar = build_calendar(*(semester or current_semester()))
+    return {
+        'version': SNAPSHOT_VERSION,
+        'source_hash': source_hash,
+        'data': data,
+        'days': days,
+        'rendered_days': rendered_days,
+        'rendered_weeks': rendered_weeks,
+        'week_pages': build_week_pages(rendered_weeks, calendar),
+        'intervals': build_intervals(days),
+        'search_index': build_search_index(days),
+        'calendar': calendar
+    }
+
+def _class_signature(class_item):
+    return tuple(class_item.get(field) for field in CLASS_FIELDS)
+
+def diff_day(old_classes, new_classes):
+    """Изменения занятий одного дня: список ('added'|'removed'|'changed', старое, новое)
+
+    Занятия сопоставляются по предмету (повторы - по порядку), окна не учитываются.
+    """
+    by_subject = {}
+    for class_item in old_classes:
+        if 'window' not in class_item:
+            by_subject.setdefault(class_item['subject'], []).append(class_item)
+    for candidates in by_subject.values():
+        candidates.reverse()
+
+    changes = []
+    for class_item in new_classes:
+        if 'window' in class_item:
+            continue
+        candidates = by_subject.get(class_item['subject'])
+        if not candidates:
+            changes.append(('added', None, class_item))
+            continue
+        old_item = candidates.pop()
+        if _class_signature(old_item) != _class_signature(class_item):
+            changes.append(('changed', old_item, class_item))
+
+    for candidates in by_subject.values():
+        for old_item in reversed(candidates):
+            changes.append(('removed', old_item, None))
+    return changes
+
+def diff_schedules(old_model, new_model):
+    """Структурная разница двух моделей: (неделя, день недели) -> изменения занятий
+
+    Время линейно по размеру расписания: каждый день сравнивается один раз,
+    занятия внутри дня сопоставляются через словарь.
+    """
+    old_days = old_model['days'] if old_model else {}
+    new_days = new_model['days']
+    diff = {}
+    for key in old_days.keys() | new_days.keys():
+        old_day = old_days.get(key)
+        new_day = new_days.get(key)
+        old_classes = old_day['classes'] if old_day else []
+        new_classes = new_day['classes'] if new_day else []
+        if old_classes is new_classes or old_classes == new_classes:
+            continue
+        changes = diff_day(old_classes, new_classes)
+        if changes:
+            diff[key] = changes
+    return diff
+
+def format_class_change(kind, old_item, new_item):
+    """Одна строка уведомления об изменении занятия"""
+    if kind == 'added':
+        return f"➕ {new_item['subject']}: {new_item['time']}, ауд. {new_item['room']}"
+    if kind == 'removed':
+        return f"➖ {old_item['subject']}: {old_item['time']} отменено"
+
+    fields = [
+        f"{label} {old_item.get(field)} → {new_item.get(field)}"
+        for field, label in CHANGE_FIELDS
+        if old_item.get(field) != new_item.get(field)
+    ]
+    return f"✏️ {new_item['subject']}: {', '.join(fields)}"
+
+def upcoming_changes(diff, model, start_date, days):
+    """Даты ближайших days дней, которых касается разница: список (дата, изменения)"""
+    if not diff:
+        return []
+
+    calendar = model['calendar']
+    affected = []
+    for offset in range(days):
+        current_date = start_date + timedelta(days=offset)
+        week_type = calendar.get(current_date.toordinal()) or week_type_for_date(current_date)
+        changes = diff.get((week_type, current_date.weekday()))
+        if changes:
+            affected.append((current_date, changes))
+    return affected
+
+def hash_source(schedule_json):
+    """Хеш исходного SCHEDULE_JSON для проверки актуальности снимка"""
+    return hashlib.sha256(schedule_json.encode('utf-8')).hexdigest()
+
+def dump_snapshot(model):
+    """Сериализует модель в версионированный бинарный снимок"""
+    return SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, marshal.version) + marshal.dumps(model)
+
+def load_snapshot(payload, source_hash=None):
+    """Загружает модель из снимка, проверяя версию формата и хеш исходного JSON"""
+    if len(payload) < SNAPSHOT_HEADER.size:
+        raise ScheduleError("Снимок расписания поврежден")
+
+    magic, version, marshal_version = SNAPSHOT_HEADER.unpack_from(payload)
+    if magic != SNAPSHOT_MAGIC:
+        raise ScheduleError("Файл не является снимком расписания")
+    if version != SNAPSHOT_VERSION or marshal_version != marshal.version:
+        raise ScheduleError(f"Несовместимая версия снимка: {version}/{marshal_version}")
+
+    model = marshal.loads(payload[SNAPSHOT_HEADER.size:])
+    if source_hash is not None and model.get('source_hash') != source_hash:
+        raise ScheduleError("Снимок собран из другой версии SCHEDULE_JSON")
+    return model
+
+def write_snapshot(model, path):
+    """Атомарно записывает снимок в файл"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(dump_snapshot(model))
+    os.replace(tmp_path, path)
+
+def read_snapshot(path, source_hash=None):
+    """Читает снимок из файла"""
+    with open(path, 'rb') as f:
+        return load_snapshot(f.read(), source_hash)
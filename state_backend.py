@@ -0,0 +1,551 @@
+"""
+Хранилище общего состояния бота
+Пользователи, дедупликация обновлений, состояние диалогов, подписки
+на напоминания, однократные задания воркеров и статус воркеров.
+
+Бэкенды:
+- memory - состояние в памяти процесса, пользователи, отметки недоступных и подписки
+           на напоминания сохраняются в pickle, состояние диалогов и рассылки -
+           в отдельный небольшой pickle (один воркер)
+- sqlite - общий файл SQLite в режиме WAL (несколько воркеров на одном хосте)
+- redis  - общий Redis (несколько хостов); без пакета redis или REDIS_URL
+           используется локальная замена на SQLite
+
+Бэкенд выбирается переменной окружения STATE_BACKEND.
+"""
+
+import os
+import json
+import time
+import pickle
+import logging
+import threading
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+USERS_FILE = os.getenv('USERS_FILE', 'bot_users.pkl')
+STATE_DB_PATH = os.getenv('STATE_DB_PATH', 'bot_state.db')
+# Сколько секунд помнить обработанные update_id (Telegram повторяет доставку при ошибках)
+DEDUP_TTL = int(os.getenv('DEDUP_TTL', '3600'))
+# Размер словаря занятых заданий memory-бэкенда, после которого удаляются истекшие
+CLAIMS_PRUNE_MIN = 1024
+
+def load_pickled_state(users_file):
+    """Загружает сохраненное состояние из pickle-файла
+
+    Старый формат файла - только множество пользователей, новый - словарь
+    с пользователями, отметками недоступных и подписками на напоминания.
+    """
+    try:
+        if os.path.exists(users_file):
+            with open(users_file, 'rb') as f:
+                stored = pickle.load(f)
+            if isinstance(stored, dict):
+                return stored
+            return {'users': set(stored)}
+        return {}
+    except Exception as e:
+        logger.error(f"Ошибка загрузки пользователей: {e}")
+        return {}
+
+def load_pickled_users(users_file):
+    """Загружает список пользователей из pickle-файла"""
+    return set(load_pickled_state(users_file).get('users', set()))
+
+def get_states_file(users_file):
+    """Файл состояния диалогов и рассылки рядом с файлом пользователей"""
+    return f"{os.path.splitext(users_file)[0]}_states.pkl"
+
+class MemoryBackend:
+    """Состояние в памяти процесса; пользователи, отметки, напоминания и состояния сохраняются в pickle"""
+
+    name = 'memory'
+
+    def __init__(self, users_file=USERS_FILE, dedup_ttl=DEDUP_TTL, states_file=None):
+        self.users_file = users_file
+        # Состояния меняются часто (курсор рассылки - на каждой пачке), поэтому лежат отдельно
+        # от пользователей: запись не зависит от их числа
+        self.states_file = states_file or get_states_file(users_file)
+        self.dedup_ttl = dedup_ttl
+        self._lock = threading.Lock()
+        stored = load_pickled_state(users_file)
+        self._users = set(stored.get('users', set()))
+        # Без сохранения отметок после перезапуска рассылки снова тратились бы на недоступные чаты
+        self._inactive = dict(stored.get('inactive', {}))
+        self._delivery_stats = {}
+        self._seen_updates = {}
+        # Здесь же задание рассылки с курсором: без сохранения перезапуск обрывал бы ее
+        self._states = {
+            user_id: dict(states) for user_id, states in load_pickled_state(self.states_file).get('states', {}).items()
+        }
+        self._reminders = dict(stored.get('reminders', {}))
+        # Имя задания -> (момент занятия, ttl)
+        self._claims = {}
+        self._claims_prune_at = CLAIMS_PRUNE_MIN
+        self._statuses = {}
+
+    def _dump(self, path, payload):
+        """Атомарно записывает payload в pickle-файл"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(payload, f)
+        os.replace(tmp_path, path)
+
+    def _save_users(self):
+        """Сохраняет пользователей, отметки недоступных и подписки на напоминания в файл"""
+        try:
+            self._dump(self.users_file, {'users': self._users, 'inactive': self._inactive, 'reminders': self._reminders})
+        except Exception as e:
+            logger.error(f"Ошибка сохранения пользователей: {e}")
+
+    def _save_states(self):
+        """Сохраняет состояние диалогов и служебные записи (рассылка, webhook) в отдельный файл"""
+        try:
+            self._dump(self.states_file, {'states': self._states})
+        except Exception as e:
+            logger.error(f"Ошибка сохранения состояния: {e}")
+
+    def add_user(self, user_id):
+        with self._lock:
+            # Вернувшийся пользователь снова получает рассылки
+            reactivated = self._inactive.pop(user_id, None) is not None
+            # Файл перезаписывается только при появлении нового или возвращении недоступного пользователя
+            if user_id in self._users:
+                if reactivated:
+                    self._save_users()
+                return reactivated
+            self._users.add(user_id)
+            self._save_users()
+            return True
+
+    def get_users(self):
+        with self._lock:
+            return set(self._users)
+
+    def get_active_users(self):
+        with self._lock:
+            return self._users - self._inactive.keys()
+
+    def mark_user_inactive(self, user_id, reason):
+        with self._lock:
+            if self._inactive.get(user_id) == reason:
+                return
+            self._inactive[user_id] = reason
+            self._save_users()
+
+    def get_inactive_users(self):
+        return dict(self._inactive)
+
+    def record_delivery(self, user_id, outcome):
+        with self._lock:
+            stats = self._delivery_stats.setdefault(user_id, {})
+            stats[outcome] = stats.get(outcome, 0) + 1
+            stats['last_outcome'] = outcome
+            stats['last_attempt'] = time.time()
+
+    def get_delivery_stats(self, user_id):
+        return dict(self._delivery_stats.get(user_id, {}))
+
+    def set_users(self, users):
+        with self._lock:
+            self._users = set(users)
+            self._save_users()
+
+    def count_users(self):
+        return len(self._users)
+
+    def mark_update_seen(self, update_id):
+        now = time.time()
+        with self._lock:
+            if update_id in self._seen_updates:
+                return False
+            # Словарь упорядочен по времени вставки, поэтому устаревшие записи в начале
+            while self._seen_updates:
+                oldest_id, seen_at = next(iter(self._seen_updates.items()))
+                if now - seen_at < self.dedup_ttl:
+                    break
+                del self._seen_updates[oldest_id]
+            self._seen_updates[update_id] = now
+            return True
+
+    def get_state(self, user_id, key, default=None):
+        return self._states.get(user_id, {}).get(key, default)
+
+    def set_state(self, user_id, key, value):
+        with self._lock:
+            self._states.setdefault(user_id, {})[key] = value
+            self._save_states()
+
+    def delete_state(self, user_id, key):
+        with self._lock:
+            user_states = self._states.get(user_id)
+            if user_states and key in user_states:
+                del user_states[key]
+                if not user_states:
+                    del self._states[user_id]
+                self._save_states()
+
+    def clear_state(self, user_id):
+        with self._lock:
+            if self._states.pop(user_id, None) is not None:
+                self._save_states()
+
+    def set_reminder(self, user_id, minutes):
+        with self._lock:
+            if self._reminders.get(user_id) == minutes:
+                return
+            if minutes is None:
+                self._reminders.pop(user_id, None)
+            else:
+                self._reminders[user_id] = minutes
+            # Подписки не должны пропадать при перезапуске процесса
+            self._save_users()
+
+    def get_reminders(self):
+        with self._lock:
+            return dict(self._reminders)
+
+    def claim_job(self, name, ttl):
+        now = time.time()
+        with self._lock:
+            claim = self._claims.get(name)
+            if claim is not None and now - claim[0] < ttl:
+                return False
+            # Напоминания занимаются на каждое событие: записи, чей TTL истек, удаляются,
+            # иначе словарь растет все время жизни процесса
+            if len(self._claims) >= self._claims_prune_at:
+                self._claims = {
+                    key: (claimed_at, claim_ttl) for key, (claimed_at, claim_ttl) in self._claims.items()
+                    if now - claimed_at < claim_ttl
+                }
+                self._claims_prune_at = max(CLAIMS_PRUNE_MIN, 2 * len(self._claims))
+            self._claims[name] = (now, ttl)
+            return True
+
+    def publish_status(self, worker_id, status):
+        self._statuses[worker_id] = dict(status, updated_at=time.time())
+
+    def get_statuses(self):
+        return dict(self._statuses)
+
+class SQLiteBackend:
+    """Состояние в общем файле SQLite, доступном всем воркерам на хосте"""
+
+    name = 'sqlite'
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY, added_at REAL, active INTEGER DEFAULT 1, inactive_reason TEXT
+        );
+        CREATE TABLE IF NOT EXISTS delivery_stats (
+            user_id INTEGER, outcome TEXT, count INTEGER, last_attempt REAL, PRIMARY KEY (user_id, outcome)
+        );
+        CREATE TABLE IF NOT EXISTS seen_updates (update_id INTEGER PRIMARY KEY, seen_at REAL);
+        CREATE INDEX IF NOT EXISTS seen_updates_seen_at ON seen_updates (seen_at);
+        CREATE TABLE IF NOT EXISTS conversation_state (
+            user_id INTEGER, key TEXT, value TEXT, PRIMARY KEY (user_id, key)
+        );
+        CREATE TABLE IF NOT EXISTS reminders (user_id INTEGER PRIMARY KEY, minutes INTEGER);
+        CREATE TABLE IF NOT EXISTS job_claims (name TEXT PRIMARY KEY, claimed_at REAL);
+        CREATE TABLE IF NOT EXISTS worker_status (worker_id TEXT PRIMARY KEY, payload TEXT, updated_at REAL);
+    """
+
+    # Как часто (в вставках) удалять устаревшие update_id
+    DEDUP_CLEANUP_EVERY = 500
+
+    def __init__(self, path=STATE_DB_PATH, dedup_ttl=DEDUP_TTL):
+        self.path = path
+        self.dedup_ttl = dedup_ttl
+        self._local = threading.local()
+        self._inserts = 0
+        connection = self._connection()
+        connection.executescript(self.SCHEMA)
+
+        # Файлы, созданные до появления отметки неактивных пользователей
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(users)")}
+        if 'active' not in columns:
+            connection.execute("ALTER TABLE users ADD COLUMN active INTEGER DEFAULT 1")
+            connection.execute("ALTER TABLE users ADD COLUMN inactive_reason TEXT")
+
+    def _connection(self):
+        """Отдельное соединение на поток: Flask и процессор обновлений работают в разных потоках"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # sqlite3 нужен только бэкенду sqlite, по умолчанию используется memory
+            import sqlite3
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def add_user(self, user_id):
+        # Вернувшийся пользователь снова получает рассылки; активный не вызывает записи
+        cursor = self._connection().execute(
+            "INSERT INTO users (user_id, added_at, active) VALUES (?, ?, 1) "
+            "ON CONFLICT (user_id) DO UPDATE SET active = 1, inactive_reason = NULL WHERE active = 0",
+            (user_id, time.time())
+        )
+        return cursor.rowcount == 1
+
+    def get_users(self):
+        return {row[0] for row in self._connection().execute("SELECT user_id FROM users")}
+
+    def get_active_users(self):
+        return {row[0] for row in self._connection().execute("SELECT user_id FROM users WHERE active = 1")}
+
+    def mark_user_inactive(self, user_id, reason):
+        self._connection().execute(
+            "UPDATE users SET active = 0, inactive_reason = ? WHERE user_id = ?", (reason, user_id)
+        )
+
+    def get_inactive_users(self):
+        rows = self._connection().execute("SELECT user_id, inactive_reason FROM users WHERE active = 0")
+        return dict(rows.fetchall())
+
+    def record_delivery(self, user_id, outcome):
+        self._connection().execute(
+            "INSERT INTO delivery_stats (user_id, outcome, count, last_attempt) VALUES (?, ?, 1, ?) "
+            "ON CONFLICT (user_id, outcome) DO UPDATE SET count = count + 1, last_attempt = excluded.last_attempt",
+            (user_id, outcome, time.time())
+        )
+
+    def get_delivery_stats(self, user_id):
+        rows = self._connection().execute(
+            "SELECT outcome, count, last_attempt FROM delivery_stats WHERE user_id = ? ORDER BY last_attempt, rowid",
+            (user_id,)
+        ).fetchall()
+        stats = {outcome: count for outcome, count, _ in rows}
+        if rows:
+            stats['last_outcome'] = rows[-1][0]
+            stats['last_attempt'] = rows[-1][2]
+        return stats
+
+    def set_users(self, users):
+        connection = self._connection()
+        now = time.time()
+        with connection:
+            connection.execute("BEGIN")
+            connection.execute("DELETE FROM users")
+            connection.executemany(
+                "INSERT INTO users (user_id, added_at) VALUES (?, ?)", ((user_id, now) for user_id in users)
+            )
+
+    def count_users(self):
+        return self._connection().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def mark_update_seen(self, update_id):
+        connection = self._connection()
+        now = time.time()
+        cursor = connection.execute(
+            "INSERT OR IGNORE INTO seen_updates (update_id, seen_at) VALUES (?, ?)", (update_id, now)
+        )
+        self._inserts += 1
+        if self._inserts % self.DEDUP_CLEANUP_EVERY == 0:
+            connection.execute("DELETE FROM seen_updates WHERE seen_at < ?", (now - self.dedup_ttl,))
+        return cursor.rowcount == 1
+
+    def get_state(self, user_id, key, default=None):
+        row = self._connection().execute(
+            "SELECT value FROM conversation_state WHERE user_id = ? AND key = ?", (user_id, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_state(self, user_id, key, value):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO conversation_state (user_id, key, value) VALUES (?, ?, ?)",
+            (user_id, key, json.dumps(value))
+        )
+
+    def delete_state(self, user_id, key):
+        self._connection().execute(
+            "DELETE FROM conversation_state WHERE user_id = ? AND key = ?", (user_id, key)
+        )
+
+    def clear_state(self, user_id):
+        self._connection().execute("DELETE FROM conversation_state WHERE user_id = ?", (user_id,))
+
+    def set_reminder(self, user_id, minutes):
+        if minutes is None:
+            self._connection().execute("DELETE FROM reminders WHERE user_id = ?", (user_id,))
+        else:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO reminders (user_id, minutes) VALUES (?, ?)", (user_id, minutes)
+            )
+
+    def get_reminders(self):
+        return dict(self._connection().execute("SELECT user_id, minutes FROM reminders").fetchall())
+
+    def claim_job(self, name, ttl):
+        now = time.time()
+        # Занять можно новое задание или задание, чей срок истек
+        cursor = self._connection().execute(
+            "INSERT INTO job_claims (name, claimed_at) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET claimed_at = excluded.claimed_at WHERE claimed_at < ?",
+            (name, now, now - ttl)
+        )
+        return cursor.rowcount == 1
+
+    def publish_status(self, worker_id, status):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO worker_status (worker_id, payload, updated_at) VALUES (?, ?, ?)",
+            (worker_id, json.dumps(status), time.time())
+        )
+
+    def get_statuses(self):
+        rows = self._connection().execute("SELECT worker_id, payload, updated_at FROM worker_status")
+        return {worker_id: dict(json.loads(payload), updated_at=updated_at) for worker_id, payload, updated_at in rows}
+
+class RedisBackend:
+    """Состояние в Redis, общее для воркеров на разных хостах"""
+
+    name = 'redis'
+
+    def __init__(self, url, prefix='itmo_bot', dedup_ttl=DEDUP_TTL):
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.dedup_ttl = dedup_ttl
+
+    def _key(self, *parts):
+        return ':'.join((self.prefix,) + tuple(str(part) for part in parts))
+
+    def add_user(self, user_id):
+        # Вернувшийся пользователь снова получает рассылки
+        pipeline = self.client.pipeline()
+        pipeline.sadd(self._key('users'), user_id)
+        pipeline.hdel(self._key('inactive'), user_id)
+        added, reactivated = pipeline.execute()
+        return added == 1 or reactivated == 1
+
+    def get_users(self):
+        return {int(user_id) for user_id in self.client.smembers(self._key('users'))}
+
+    def get_active_users(self):
+        inactive = {int(user_id) for user_id in self.client.hkeys(self._key('inactive'))}
+        return self.get_users() - inactive
+
+    def mark_user_inactive(self, user_id, reason):
+        self.client.hset(self._key('inactive'), user_id, reason)
+
+    def get_inactive_users(self):
+        return {int(user_id): reason for user_id, reason in self.client.hgetall(self._key('inactive')).items()}
+
+    def record_delivery(self, user_id, outcome):
+        pipeline = self.client.pipeline()
+        pipeline.hincrby(self._key('delivery', user_id), outcome, 1)
+        pipeline.hset(self._key('delivery', user_id), mapping={'last_outcome': outcome, 'last_attempt': time.time()})
+        pipeline.execute()
+
+    def get_delivery_stats(self, user_id):
+        stats = self.client.hgetall(self._key('delivery', user_id))
+        return {
+            key: value if key == 'last_outcome' else float(value) if key == 'last_attempt' else int(value)
+            for key, value in stats.items()
+        }
+
+    def set_users(self, users):
+        pipeline = self.client.pipeline()
+        pipeline.delete(self._key('users'))
+        if users:
+            pipeline.sadd(self._key('users'), *users)
+        pipeline.execute()
+
+    def count_users(self):
+        return self.client.scard(self._key('users'))
+
+    def mark_update_seen(self, update_id):
+        return bool(self.client.set(self._key('seen', update_id), 1, nx=True, ex=self.dedup_ttl))
+
+    def get_state(self, user_id, key, default=None):
+        value = self.client.hget(self._key('state', user_id), key)
+        return json.loads(value) if value is not None else default
+
+    def set_state(self, user_id, key, value):
+        self.client.hset(self._key('state', user_id), key, json.dumps(value))
+
+    def delete_state(self, user_id, key):
+        self.client.hdel(self._key('state', user_id), key)
+
+    def clear_state(self, user_id):
+        self.client.delete(self._key('state', user_id))
+
+    def set_reminder(self, user_id, minutes):
+        if minutes is None:
+            self.client.hdel(self._key('reminders'), user_id)
+        else:
+            self.client.hset(self._key('reminders'), user_id, minutes)
+
+    def get_reminders(self):
+        return {int(user_id): int(minutes) for user_id, minutes in self.client.hgetall(self._key('reminders')).items()}
+
+    def claim_job(self, name, ttl):
+        return bool(self.client.set(self._key('claim', name), 1, nx=True, ex=int(ttl)))
+
+    def publish_status(self, worker_id, status):
+        self.client.hset(self._key('status'), worker_id, json.dumps(dict(status, updated_at=time.time())))
+
+    def get_statuses(self):
+        return {worker_id: json.loads(payload) for worker_id, payload in self.client.hgetall(self._key('status')).items()}
+
+def migrate_pickled_users(backend, users_file=USERS_FILE):
+    """Переносит пользователей из старого pickle-файла в пустое общее хранилище"""
+    if backend.name == 'memory' or backend.count_users() or not os.path.exists(users_file):
+        return 0
+
+    stored = load_pickled_state(users_file)
+    users = set(stored.get('users', set()))
+    if users:
+        backend.set_users(users)
+        for user_id, reason in stored.get('inactive', {}).items():
+            backend.mark_user_inactive(user_id, reason)
+        for user_id, minutes in stored.get('reminders', {}).items():
+            backend.set_reminder(user_id, minutes)
+        for user_id, states in load_pickled_state(get_states_file(users_file)).get('states', {}).items():
+            for key, value in states.items():
+                backend.set_state(user_id, key, value)
+        logger.info(f"📦 Перенесено {len(users)} пользователей из {users_file} в хранилище {backend.name}")
+    return len(users)
+
+def create_backend(kind=None):
+    """Создает бэкенд состояния по имени или по переменной окружения STATE_BACKEND"""
+    kind = (kind or os.getenv('STATE_BACKEND', 'memory')).lower()
+
+    if kind == 'redis':
+        redis_url = os.getenv('REDIS_URL')
+        if redis is not None and redis_url:
+            backend = RedisBackend(redis_url)
+        else:
+            logger.warning("⚠️ Пакет redis или REDIS_URL недоступны, используется локальная замена на SQLite")
+            backend = SQLiteBackend()
+    elif kind == 'sqlite':
+        backend = SQLiteBackend()
+    else:
+        if kind != 'memory':
+            logger.warning(f"⚠️ Неизвестный STATE_BACKEND={kind}, используется memory")
+        backend = MemoryBackend()
+
+    migrate_pickled_users(backend)
+    logger.info(f"🗄️ Хранилище состояния: {backend.name}")
+    return backend
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """Возвращает общий для процесса бэкенд состояния"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+    return _backend
+
+def set_backend(backend):
+    """Подменяет бэкенд состояния (бенчмарки и тесты)"""
+    global _backend
+    _backend = backend
@@ -0,0 +1,107 @@
+"""
+Вытеснение состояния неактивных пользователей и чатов
+
+Application из python-telegram-bot хранит user_data и chat_data для каждого, кто
+когда-либо писал боту, а хранилище состояния - незавершенные диалоги.
+Без очистки эти данные растут весь семестр.
+
+Каждое обновление отмечает пользователя и чат как активных. Сроки истечения лежат
+в куче; при отметке в кучу просто добавляется новая запись, а устаревшие записи
+пропускаются при извлечении (ленивое удаление). Поэтому отметка стоит O(log n),
+а объем памяти пропорционален числу пользователей, активных за последние STATE_TTL секунд.
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import logging
+import threading
+
+from state_backend import get_backend
+
+logger = logging.getLogger(__name__)
+
+# Через сколько секунд бездействия состояние пользователя или чата удаляется
+STATE_TTL = float(os.getenv('STATE_TTL', str(6 * 3600)))
+# Как часто проверять истекшие записи, в секундах
+STATE_SWEEP_INTERVAL = 60
+
+USER = 'user'
+CHAT = 'chat'
+
+class StateRetention:
+    """Индекс времени последней активности с ленивым удалением из кучи"""
+
+    def __init__(self, ttl=STATE_TTL):
+        self.ttl = ttl
+        self._last_seen = {}
+        self._heap = []
+        self._lock = threading.Lock()
+        self.stats = {'evicted_users': 0, 'evicted_chats': 0}
+
+    def touch(self, kind, key, now=None):
+        """Отмечает активность пользователя или чата"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._last_seen[(kind, key)] = now
+            heapq.heappush(self._heap, (now + self.ttl, kind, key))
+            # Куча сжимается, когда устаревших записей становится больше актуальных
+            if len(self._heap) > 2 * len(self._last_seen) + 64:
+                self._heap = [(seen + self.ttl, kind, key) for (kind, key), seen in self._last_seen.items()]
+                heapq.heapify(self._heap)
+
+    def touch_update(self, update, now=None):
+        """Отмечает пользователя и чат из обновления Telegram"""
+        if update.effective_user:
+            self.touch(USER, update.effective_user.id, now)
+        if update.effective_chat:
+            self.touch(CHAT, update.effective_chat.id, now)
+
+    def pop_expired(self, now=None):
+        """Извлекает записи без активности дольше TTL; возвращает список (вид, id)"""
+        now = time.time() if now is None else now
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                expires_at, kind, key = heapq.heappop(self._heap)
+                seen = self._last_seen.get((kind, key))
+                # Пользователь был активен после этой записи - для него в куче есть более поздняя
+                if seen is None or seen + self.ttl != expires_at:
+                    continue
+                del self._last_seen[(kind, key)]
+                expired.append((kind, key))
+        return expired
+
+    def evict(self, application, now=None):
+        """Удаляет user_data, chat_data и состояние диалогов неактивных пользователей"""
+        expired = self.pop_expired(now)
+        if not expired:
+            return 0
+
+        backend = get_backend()
+        for kind, key in expired:
+            # drop_*_data запоминает id для удаления из persistence, а без persistence этот
+            # набор никогда не очищается, поэтому удаляются только действительно созданные записи
+            if kind == USER:
+                if key in application.user_data:
+                    application.drop_user_data(key)
+                backend.clear_state(key)
+                self.stats['evicted_users'] += 1
+            else:
+                if key in application.chat_data:
+                    application.drop_chat_data(key)
+                self.stats['evicted_chats'] += 1
+        logger.info(f"🧹 Удалено состояние неактивных: {len(expired)}")
+        return len(expired)
+
+    async def run(self, application):
+        """Периодическая очистка в цикле процессора обновлений"""
+        while True:
+            await asyncio.sleep(STATE_SWEEP_INTERVAL)
+            self.evict(application)
+
+    def snapshot(self):
+        """Состояние индекса для /status"""
+        with self._lock:
+            return dict(self.stats, tracked=len(self._last_seen), heap_size=len(self._heap), ttl=self.ttl)
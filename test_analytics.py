@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Тест статистики использования бота
+"""
+
+import sys
+import os
+import tempfile
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from analytics import HyperLogLog, UsageAnalytics, MOSCOW_TZ
+
+def test_hyperloglog_estimate():
+    """Оценка уникальных в пределах погрешности, повторы не учитываются, память фиксирована"""
+    print("🧪 ПРОВЕРКА HYPERLOGLOG")
+    for expected in (10, 1000, 50000):
+        hll = HyperLogLog()
+        for _ in range(2):
+            for user_id in range(expected):
+                hll.add(user_id)
+        error = abs(hll.count() - expected) / expected
+        assert error < 0.05, (expected, hll.count())
+        assert len(hll.registers) == 4096
+
+    left, right = HyperLogLog(), HyperLogLog()
+    for user_id in range(3000):
+        (left if user_id % 2 else right).add(user_id)
+    left.merge(HyperLogLog.from_text(right.to_text()))
+    assert abs(left.count() - 3000) / 3000 < 0.05, left.count()
+    print("✅ Оценки точны, объединение работает")
+
+def test_flush_merges_workers():
+    """Два воркера пишут в один файл: счетчики складываются, уникальные не удваиваются"""
+    print("🧪 ПРОВЕРКА СБРОСА НА ДИСК")
+    now = datetime(2025, 3, 10, 12, 0, tzinfo=MOSCOW_TZ)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'analytics.json')
+        first, second = UsageAnalytics(path), UsageAnalytics(path)
+        for user_id in range(100):
+            first.record('today', user_id, now)
+            second.record('week', user_id + 50, now)
+        second.record('/start', 1, now)
+
+        assert first.flush() == 100
+        assert second.flush() == 101
+        assert first.flush() == 0
+
+        stats = first.stats()
+        day = stats['days']['2025-03-10']
+        assert day['actions'] == {'today': 100, 'week': 100, '/start': 1}, day
+        assert 145 <= day['unique_users'] <= 155, day
+        assert 145 <= stats['months']['2025-03']['unique_users'] <= 155, stats['months']
+
+        # Новый процесс подхватывает сохраненную статистику
+        restarted = UsageAnalytics(path)
+        restarted.flush()
+        assert restarted.stats()['days']['2025-03-10']['actions']['today'] == 100
+    print("✅ Статистика воркеров объединена")
+
+if __name__ == "__main__":
+    try:
+        test_hyperloglog_estimate()
+        test_flush_merges_workers()
+        print("\n✅ ВСЕ ТЕСТЫ ПРОЙДЕНЫ УСПЕШНО!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n❌ ОШИБКА ПРИ ТЕСТИРОВАНИИ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
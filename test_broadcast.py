@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Тест рассылок администратора с сохранением прогресса
+"""
+
+import sys
+import os
+import asyncio
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from broadcast import BroadcastManager, DONE, PAUSED, RUNNING, load_job, save_job
+from state_backend import MemoryBackend, SQLiteBackend, set_backend
+from tracing import UpdateTrace, current_trace
+
+class FakeBot:
+    def __init__(self, on_send=None):
+        self.sent = []
+        self.edits = 0
+        self.on_send = on_send
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(chat_id)
+        if self.on_send:
+            self.on_send(chat_id)
+
+    async def edit_message_text(self, **kwargs):
+        self.edits += 1
+
+def test_pause_and_resume_after_restart():
+    """Рассылка на паузе сохраняет курсор, а после перезапуска продолжается без повторов"""
+    print("🧪 ПРОВЕРКА ПАУЗЫ И ПРОДОЛЖЕНИЯ РАССЫЛКИ")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backend = SQLiteBackend(os.path.join(tmp_dir, "bot_state.db"))
+        set_backend(backend)
+        try:
+            for user_id in range(1, 8):
+                backend.add_user(user_id)
+            backend.mark_user_inactive(7, 'forbidden')
+
+            manager = BroadcastManager('host:1', chunk_size=2)
+            job, created = manager.create_job('Привет', admin_chat_id=100)
+            assert created and job['total'] == 6
+            assert manager.create_job('Еще одна', admin_chat_id=100)[1] is False
+
+            # Администратор ставит паузу, пока отправляется вторая пачка
+            def pause_on_fourth(chat_id):
+                if chat_id == 4:
+                    manager.set_status(job['id'], PAUSED)
+
+            first_bot = FakeBot(pause_on_fourth)
+            asyncio.run(manager.run(first_bot, job['id']))
+            paused = load_job()
+            assert paused['status'] == PAUSED and paused['cursor'] == 4
+            assert first_bot.sent == [1, 2, 3, 4]
+
+            # Процесс перезапущен: новый воркер подхватывает рассылку с курсора
+            paused['status'] = RUNNING
+            paused['heartbeat'] = 0
+            save_job(paused)
+            restarted = BroadcastManager('host:2', chunk_size=2)
+            second_bot = FakeBot()
+
+            async def resume_once():
+                resume_task = asyncio.create_task(restarted.resume(second_bot))
+                while restarted._task is None:
+                    await asyncio.sleep(0.01)
+                await restarted._task
+                resume_task.cancel()
+
+            asyncio.run(resume_once())
+
+            finished = load_job()
+            assert second_bot.sent == [5, 6]
+            assert finished['status'] == DONE and finished['sent'] == 6 and finished['total'] == 6
+        finally:
+            set_backend(None)
+    print("✅ Рассылка продолжается с сохраненного курсора")
+
+def test_resume_on_memory_backend():
+    """На бэкенде по умолчанию задание и курсор переживают перезапуск процесса"""
+    print("🧪 ПРОВЕРКА РАССЫЛКИ ПОСЛЕ ПЕРЕЗАПУСКА НА MEMORY BACKEND")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        users_file = os.path.join(tmp_dir, "bot_users.pkl")
+        backend = MemoryBackend(users_file)
+        set_backend(backend)
+        try:
+            for user_id in range(1, 6):
+                backend.add_user(user_id)
+
+            manager = BroadcastManager('host:1', chunk_size=2)
+            job, _ = manager.create_job('Привет', admin_chat_id=100)
+
+            def pause_on_second(chat_id):
+                if chat_id == 2:
+                    manager.set_status(job['id'], PAUSED)
+
+            asyncio.run(manager.run(FakeBot(pause_on_second), job['id']))
+
+            # Новый процесс читает состояние только из файла
+            set_backend(MemoryBackend(users_file))
+            paused = load_job()
+            assert paused is not None and paused['id'] == job['id']
+            assert paused['status'] == PAUSED and paused['cursor'] == 2
+
+            restarted = BroadcastManager('host:2', chunk_size=2)
+            restarted.set_status(job['id'], RUNNING)
+            bot = FakeBot()
+            asyncio.run(restarted.run(bot, job['id']))
+            assert bot.sent == [3, 4, 5]
+
+            set_backend(MemoryBackend(users_file))
+            assert load_job()['status'] == DONE
+        finally:
+            set_backend(None)
+    print("✅ Рассылка не теряется при перезапуске")
+
+def test_broadcast_task_has_no_trace():
+    """Задача рассылки не наследует трассу обновления, из которого ее запустили"""
+    print("🧪 ПРОВЕРКА КОНТЕКСТА ЗАДАЧИ РАССЫЛКИ")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backend = MemoryBackend(os.path.join(tmp_dir, "bot_users.pkl"))
+        set_backend(backend)
+        try:
+            for user_id in (1, 2):
+                backend.add_user(user_id)
+            seen_traces = []
+            bot = FakeBot(lambda chat_id: seen_traces.append(current_trace.get()))
+            manager = BroadcastManager('host:1')
+
+            async def start_from_handler():
+                # Так выглядит контекст обработчика /broadcast
+                current_trace.set(UpdateTrace(update_id=1))
+                job, _ = manager.create_job('Привет', admin_chat_id=100)
+                manager.start(bot, job)
+                await manager._task
+
+            asyncio.run(start_from_handler())
+            assert bot.sent == [1, 2]
+            assert seen_traces == [None, None], seen_traces
+        finally:
+            set_backend(None)
+    print("✅ Вызовы рассылки не попадают в трассу обновления")
+
+if __name__ == "__main__":
+    try:
+        test_pause_and_resume_after_restart()
+        test_resume_on_memory_backend()
+        test_broadcast_task_has_no_trace()
+        print("\n✅ ВСЕ ТЕСТЫ ПРОЙДЕНЫ УСПЕШНО!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n❌ ОШИБКА ПРИ ТЕСТИРОВАНИИ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Тест ленты расписания в формате iCalendar
+"""
+
+import sys
+import os
+import gzip
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import date
+
+from schedule_model import compile_schedule
+from calendar_feed import build_ics, fold_ics_line, get_calendar_feed
+
+SAMPLE_SCHEDULE = {
+    'group': 'K3221',
+    'schedule': [
+        {'week': 1, 'days': [
+            {'day': 'Понедельник', 'classes': [
+                {'subject': 'Математический анализ', 'time': '08:20-09:50', 'room': '1404', 'address': 'Кронверкский пр., 49'},
+                {'window': 2, 'duration': '1ч 30м'}
+            ]}
+        ]},
+        {'week': 2, 'days': [
+            {'day': 'Понедельник', 'classes': [
+                {'subject': 'Физика', 'time': '10:00-11:30', 'room': '2202', 'address': 'Ломоносова, 9'}
+            ]}
+        ]}
+    ]
+}
+
+# Две недели разной четности: 6 октября 2025 - четная, 13 октября - нечетная
+TWO_WEEKS = (date(2025, 10, 6), date(2025, 10, 19))
+
+def make_model():
+    return compile_schedule(SAMPLE_SCHEDULE, 'test-hash', semester=TWO_WEEKS)
+
+def test_events_follow_week_parity():
+    """События строятся по календарю четности, время переводится из Москвы в UTC"""
+    print("🧪 ПРОВЕРКА СОБЫТИЙ ЛЕНТЫ")
+    body = build_ics(make_model(), 'K3221', TWO_WEEKS).decode('utf-8')
+
+    assert body.startswith('BEGIN:VCALENDAR\r\n') and body.endswith('END:VCALENDAR\r\n')
+    assert body.count('BEGIN:VEVENT') == 2
+    assert 'DTSTART:20251006T070000Z' in body  # Физика, четная неделя, 10:00 МСК
+    assert 'DTSTART:20251013T052000Z' in body  # Матанализ, нечетная неделя, 08:20 МСК
+    assert 'LOCATION:Ауд. 1404\\, Кронверкский пр.\\, 49' in body
+
+    # Дни вне календаря модели (следующий семестр) считаются по четности недели
+    later = build_ics(make_model(), 'K3221', (date(2026, 10, 5), date(2026, 10, 18))).decode('utf-8')
+    assert later.count('BEGIN:VEVENT') == 2
+    assert 'DTSTART:20261005T070000Z' in later  # 5 октября 2026 - четная неделя, Физика
+    print("✅ События соответствуют четности недель")
+
+def test_line_folding():
+    """Длинные строки переносятся по 75 октетов без разрыва символов UTF-8"""
+    print("🧪 ПРОВЕРКА ПЕРЕНОСА СТРОК")
+    line = 'SUMMARY:' + 'Дискретная математика ' * 10
+    folded = fold_ics_line(line)
+
+    assert all(len(part.encode('utf-8')) <= 75 for part in folded.split('\r\n'))
+    assert folded.replace('\r\n ', '') == line
+    print("✅ Строки переносятся корректно")
+
+def test_feed_is_cached_per_model():
+    """Тело, gzip и ETag вычисляются один раз на версию расписания"""
+    print("🧪 ПРОВЕРКА КЭША ЛЕНТЫ")
+    model = make_model()
+    feed = get_calendar_feed(model, 'K3221', TWO_WEEKS)
+
+    assert get_calendar_feed(model, 'K3221', TWO_WEEKS) is feed
+    assert gzip.decompress(feed['gzip_body']) == feed['body']
+    assert feed['gzip_etag'] != feed['etag']
+    # Одинаковое расписание дает одинаковый ETag в любом воркере
+    assert get_calendar_feed(make_model(), 'K3221', TWO_WEEKS)['etag'] == feed['etag']
+    # С началом нового семестра лента пересобирается
+    assert get_calendar_feed(model, 'K3221', (date(2026, 2, 2), date(2026, 2, 15)))['etag'] != feed['etag']
+    print("✅ Лента кэшируется")
+
+if __name__ == "__main__":
+    try:
+        test_events_follow_week_parity()
+        test_line_folding()
+        test_feed_is_cached_per_model()
+        print("\n✅ ВСЕ ТЕСТЫ ПРОЙДЕНЫ УСПЕШНО!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n❌ ОШИБКА ПРИ ТЕСТИРОВАНИИ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Тест календаря для выбора даты
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from main import build_month_keyboard, get_date_picker, parse_picked_date
+
+def test_month_keyboard():
+    """Дни месяца кодируют дату в callback_data, листание переходит через границу года"""
+    print("🧪 ПРОВЕРКА КАЛЕНДАРЯ МЕСЯЦА")
+    rows = build_month_keyboard(2025, 12, 0).inline_keyboard
+
+    assert rows[0][0].text == 'Декабрь 2025'
+    days = [button.callback_data for row in rows for button in row if button.callback_data.startswith('day:')]
+    assert len(days) == 31 and days[0] == 'day:20251201' and days[-1] == 'day:20251231'
+    # 1 декабря 2025 - понедельник
+    assert rows[2][0].text == '1'
+
+    navigation = [button.callback_data for button in rows[-5]]
+    assert navigation == ['cal:2025-11', 'cal:2026-01'], navigation
+
+    picked = parse_picked_date('day:20251013')
+    assert (picked.year, picked.month, picked.day) == (2025, 10, 13)
+    assert parse_picked_date('day:20251332') is None
+    print("✅ Календарь построен")
+
+def test_month_keyboard_is_cached():
+    """Клавиатура месяца собирается один раз"""
+    print("🧪 ПРОВЕРКА КЭША КАЛЕНДАРЯ")
+    assert get_date_picker(2025, 11) is get_date_picker(2025, 11)
+    assert build_month_keyboard(2025, 11, 5) is not build_month_keyboard(2025, 11, 0)
+    print("✅ Клавиатуры переиспользуются")
+
+if __name__ == "__main__":
+    try:
+        test_month_keyboard()
+        test_month_keyboard_is_cached()
+        print("\n✅ ВСЕ ТЕСТЫ ПРОЙДЕНЫ УСПЕШНО!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n❌ ОШИБКА ПРИ ТЕСТИРОВАНИИ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
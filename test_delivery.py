@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Тест рассылки: классификация ошибок и исключение недоступных пользователей
+"""
+
+import sys
+import os
+import asyncio
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TimedOut
+
+from delivery import (
+    CHAT_NOT_FOUND, ERROR, FORBIDDEN, RETRY_AFTER, SENT, TRANSIENT,
+    RateLimitedSender, classify_delivery_error
+)
+from state_backend import MemoryBackend
+
+class FakeBot:
+    """Бот, который возвращает заранее заданные ошибки для отдельных чатов"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        failure = self.failures.get(chat_id)
+        if isinstance(failure, list):
+            failure = failure.pop(0) if failure else None
+        if failure:
+            raise failure
+        self.sent.append(chat_id)
+
+def test_classify_delivery_error():
+    """Ошибки Telegram разбиваются по типам"""
+    print("🧪 ПРОВЕРКА КЛАССИФИКАЦИИ ОШИБОК")
+    assert classify_delivery_error(Forbidden("Forbidden: bot was blocked by the user")) == FORBIDDEN
+    assert classify_delivery_error(BadRequest("Chat not found")) == CHAT_NOT_FOUND
+    assert classify_delivery_error(BadRequest("Message is too long")) == ERROR
+    assert classify_delivery_error(RetryAfter(3)) == RETRY_AFTER
+    assert classify_delivery_error(TimedOut()) == TRANSIENT
+    print("✅ Ошибки классифицируются")
+
+def test_prune_unreachable_users():
+    """Недоступные чаты помечаются неактивными, временные ошибки повторяются"""
+    print("🧪 ПРОВЕРКА ИСКЛЮЧЕНИЯ НЕДОСТУПНЫХ ПОЛЬЗОВАТЕЛЕЙ")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backend = MemoryBackend(os.path.join(tmp_dir, "bot_users.pkl"))
+        backend.set_users({1, 2, 3, 4})
+
+        bot = FakeBot({
+            2: Forbidden("Forbidden: bot was blocked by the user"),
+            3: BadRequest("Chat not found"),
+            4: [RetryAfter(0)]
+        })
+        sender = RateLimitedSender(bot, rate=1000, backend=backend)
+        results = asyncio.run(sender.send_many(sorted(backend.get_active_users()), "Тест"))
+
+        assert results == {SENT: 2, FORBIDDEN: 1, CHAT_NOT_FOUND: 1}, results
+        assert sorted(bot.sent) == [1, 4]
+        assert backend.get_active_users() == {1, 4}
+        assert backend.get_inactive_users() == {2: FORBIDDEN, 3: CHAT_NOT_FOUND}
+        assert backend.get_delivery_stats(2)['last_outcome'] == FORBIDDEN
+
+        # Пользователь, снова написавший /start, возвращается в рассылку
+        assert backend.add_user(2) is True
+        assert backend.get_active_users() == {1, 2, 4}
+    print("✅ Недоступные пользователи исключаются из рассылки")
+
+def test_send_many_surfaces_errors():
+    """Ошибка on_result не теряется, даже если ее задача уже убрана из списка ожидания"""
+    print("🧪 ПРОВЕРКА ОШИБОК ОБРАБОТЧИКА РЕЗУЛЬТАТА")
+    failed = []
+
+    async def on_result(chat_id, outcome):
+        if chat_id == 3:
+            failed.append(chat_id)
+            raise RuntimeError("хранилище недоступно")
+
+    async def run():
+        sender = RateLimitedSender(FakeBot({}), rate=0, concurrency=2)
+        try:
+            # Чатов больше concurrency * 10, поэтому завершенные задачи успевают удаляться из списка
+            await sender.send_many(range(1, 60), "Тест", on_result=on_result)
+        except RuntimeError as e:
+            return e
+        return None
+
+    error = asyncio.run(run())
+    assert failed == [3]
+    assert isinstance(error, RuntimeError) and str(error) == "хранилище недоступно", error
+    print("✅ Ошибка обработчика результата проброшена")
+
+if __name__ == "__main__":
+    try:
+        test_classify_delivery_error()
+        test_prune_unreachable_users()
+        test_send_many_surfaces_errors()
+        print("\n✅ ВСЕ ТЕСТЫ ПРОЙДЕНЫ УСПЕШНО!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n❌ ОШИБКА ПРИ ТЕСТИРОВАНИИ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
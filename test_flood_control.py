@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Тест ограничения частоты обновлений от одного пользователя
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flood_control import FloodLimiter
+
+def test_token_bucket():
+    """Пользователь получает burst токенов, затем токены пополняются со скоростью rate"""
+    print("🧪 ПРОВЕРКА ТОКЕН-БАКЕТА")
+    limiter = FloodLimiter(rate=1, burst=3, max_users=100)
+
+    assert [limiter.allow(1, now=0) for _ in range(4)] == [True, True, True, False]
+    # Другой пользователь не страдает от флуда первого
+    assert limiter.allow(2, now=0) is True
+    assert limiter.allow(1, now=0.5) is False
+    assert limiter.allow(1, now=1.1) is True
+    print("✅ Токен-бакет работает")
+
+def test_deferred_callbacks():
+    """Из нажатий сверх лимита сохраняется только последнее"""
+    print("🧪 ПРОВЕРКА ОТЛОЖЕННЫХ НАЖАТИЙ")
+    limiter = FloodLimiter(rate=1, burst=1, max_users=100)
+
+    assert limiter.allow(1, now=0) is True
+    for press in ('today', 'week', 'date'):
+        assert limiter.allow(1, now=0) is False
+        limiter.defer(1, {'callback_query': {'data': press}})
+
+    assert limiter.release_ready(now=0.5) == []
+    assert limiter.release_ready(now=1.0) == [{'callback_query': {'data': 'date'}}]
+    assert limiter.stats['coalesced'] == 2
+    print("✅ Сохраняется последнее нажатие")
+
+def test_bounded_memory():
+    """Простаивающие и лишние пользователи вытесняются"""
+    print("🧪 ПРОВЕРКА ОГРАНИЧЕНИЯ ПАМЯТИ")
+    limiter = FloodLimiter(rate=1, burst=2, max_users=10)
+
+    for user_id in range(100):
+        limiter.allow(user_id, now=0)
+    assert limiter.snapshot()['tracked_users'] == 10
+
+    # Через время полного пополнения бакеты простаивающих пользователей удаляются
+    limiter.allow(1000, now=5)
+    assert limiter.snapshot()['tracked_users'] == 1
+    print("✅ Память ограничена")
+
+if __name__ == "__main__":
+    try:
+        test_token_bucket()
+        test_deferred_callbacks()
+        test_bounded_memory()
+        print("\n✅ ВСЕ ТЕСТЫ ПРОЙДЕНЫ УСПЕШНО!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n❌ ОШИБКА ПРИ ТЕСТИРОВАНИИ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
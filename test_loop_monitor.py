@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Тест мониторинга задержки event loop процессора
+"""
+
+import sys
+import os
+import time
+import asyncio
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from loop_monitor import LoopMonitor
+
+def blocking_handler():
+    """Синхронный вызов, блокирующий event loop"""
+    time.sleep(0.4)
+
+def test_blocked_loop_is_detected():
+    """Блокировка цикла увеличивает задержку, а сторож пишет стек блокирующего вызова"""
+    print("🧪 ПРОВЕРКА ОБНАРУЖЕНИЯ БЛОКИРОВКИ")
+    monitor = LoopMonitor(interval=0.05, slo_ms=200, stall_ms=150)
+    stop_event = threading.Event()
+
+    async def scenario():
+        task = asyncio.create_task(monitor.run(stop_event))
+        monitor.start_watchdog(stop_event)
+        await asyncio.sleep(0.2)
+        assert monitor.is_healthy()
+
+        blocking_handler()
+        assert not monitor.is_healthy()
+
+        await asyncio.sleep(0.1)
+        stop_event.set()
+        await task
+
+    asyncio.run(scenario())
+
+    snapshot = monitor.snapshot()
+    assert snapshot['max_lag_ms'] >= 200, snapshot
+    assert monitor.stalls == 1, monitor.stalls
+    assert 'blocking_handler' in monitor.last_stall['stack']
+    print("✅ Блокировка обнаружена, стек записан")
+
+if __name__ == "__main__":
+    try:
+        test_blocked_loop_is_detected()
+        print("\n✅ ВСЕ ТЕСТЫ ПРОЙДЕНЫ УСПЕШНО!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n❌ ОШИБКА ПРИ ТЕСТИРОВАНИИ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Тест профилирования обработки обновлений по требованию
+"""
+
+import sys
+import os
+import pstats
+import marshal
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from profiling import PROFILE_SORT_KEYS, UpdateProfiler
+
+async def fake_handler(profiler, delay):
+    sampled = profiler.begin()
+    try:
+        sum(i * i for i in range(1000))
+        await asyncio.sleep(delay)
+    finally:
+        profiler.end(sampled)
+
+def test_sampling_off_by_default():
+    """Без окна и без доли выборки обновления не профилируются"""
+    print("🧪 ПРОВЕРКА ВЫКЛЮЧЕННОГО ПРОФИЛИРОВАНИЯ")
+    profiler = UpdateProfiler(sample_rate=0)
+
+    asyncio.run(fake_handler(profiler, 0))
+    assert profiler.dump() is None
+    assert profiler.snapshot()['profiled_updates'] == 0
+    print("✅ Профилирование выключено без окна")
+
+def test_window_collects_concurrent_updates():
+    """В окне профилируются все обновления, включая конкурентные, в одну статистику"""
+    print("🧪 ПРОВЕРКА ОКНА ПРОФИЛИРОВАНИЯ")
+    profiler = UpdateProfiler(sample_rate=0)
+    profiler.start_window(60)
+
+    async def run_batch():
+        await asyncio.gather(*(fake_handler(profiler, 0.01) for _ in range(5)))
+
+    asyncio.run(run_batch())
+    asyncio.run(fake_handler(profiler, 0))
+    assert profiler.snapshot()['profiled_updates'] == 6
+
+    stats = marshal.loads(profiler.dump())
+    assert any(function == 'fake_handler' for (_, _, function) in stats)
+    assert 'fake_handler' in profiler.report(limit=10)
+
+    profiler.reset()
+    assert profiler.dump() is None
+    print("✅ Окно профилирования собирает статистику")
+
+def test_sort_keys_match_pstats():
+    """Список допустимых сортировок отчета совпадает с ключами pstats"""
+    print("🧪 ПРОВЕРКА КЛЮЧЕЙ СОРТИРОВКИ")
+    assert set(PROFILE_SORT_KEYS) == set(pstats.Stats.sort_arg_dict_default)
+    print("✅ Ключи сортировки совпадают")
+
+if __name__ == "__main__":
+    try:
+        test_sampling_off_by_default()
+        test_window_collects_concurrent_updates()
+        test_sort_keys_match_pstats()
+        print("\n✅ ВСЕ ТЕСТЫ ПРОЙДЕНЫ УСПЕШНО!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n❌ ОШИБКА ПРИ ТЕСТИРОВАНИИ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
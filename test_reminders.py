@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Тест планировщика напоминаний о парах
+"""
+
+import sys
+import os
+import asyncio
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+from schedule_model import compile_schedule, build_calendar
+from state_backend import MemoryBackend, set_backend
+from delivery import RateLimitedSender
+from reminders import ReminderScheduler, build_reminder_events
+
+MOSCOW_TZ = ZoneInfo("Europe/Moscow")
+
+def make_model(physics_time='10:00-11:30'):
+    data = {'schedule': [
+        {'week': 1, 'days': []},
+        {'week': 2, 'days': [
+            {'day': 'Понедельник', 'classes': [
+                {'subject': 'Физика', 'time': physics_time, 'room': '2202', 'address': 'Ломоносова, 9'},
+                {'subject': 'Химия', 'time': '11:40-13:10', 'room': '1404', 'address': 'Кронверкский пр., 49'}
+            ]}
+        ]}
+    ]}
+    model = compile_schedule(data)
+    model['calendar'] = build_calendar(date(2025, 10, 6), date(2025, 10, 19))
+    return model
+
+def moscow_ts(hour, minute):
+    # 6 октября 2025 - понедельник четной недели
+    return datetime(2025, 10, 6, hour, minute, tzinfo=MOSCOW_TZ).timestamp()
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+def test_events_per_class_not_per_user():
+    """Событие одно на пару и интервал напоминания, независимо от числа подписчиков"""
+    print("🧪 ПРОВЕРКА СОБЫТИЙ НАПОМИНАНИЙ")
+    events = build_reminder_events(make_model(), 'itmo', date(2025, 10, 6), days=1, offsets=(10, 30))
+
+    assert len(events) == 4
+    fire_at, text = events[('itmo', moscow_ts(10, 0), 10)]
+    assert fire_at == moscow_ts(9, 50)
+    assert text.startswith('⏰ Через 10 мин пара:\n📚 Физика')
+    print("✅ События строятся по парам")
+
+def test_incremental_rebuild_and_pop():
+    """Перезагрузка расписания меняет только затронутые события"""
+    print("🧪 ПРОВЕРКА ИНКРЕМЕНТАЛЬНОЙ ПЕРЕСБОРКИ")
+    model = make_model()
+    scheduler = ReminderScheduler(lambda: model, offsets=(10,), horizon_days=1)
+
+    assert scheduler.rebuild(now=moscow_ts(8, 0)) == (2, 0)
+    assert scheduler.rebuild(now=moscow_ts(8, 0)) == (0, 0)
+
+    # Физику перенесли на 10:30: одно событие удалено, одно добавлено
+    assert scheduler.rebuild(make_model('10:30-12:00'), now=moscow_ts(8, 0)) == (1, 1)
+
+    due, next_at = scheduler.pop_due(moscow_ts(9, 55))
+    assert due == [] and next_at == moscow_ts(10, 20)
+    due, _ = scheduler.pop_due(moscow_ts(10, 20))
+    assert [key[1] for key, _, _ in due] == [moscow_ts(10, 30)]
+    print("✅ Пересборка инкрементальная")
+
+def test_fire_sends_to_matching_subscribers():
+    """Напоминание получают только подписчики с тем же интервалом, один раз на событие"""
+    print("🧪 ПРОВЕРКА РАССЫЛКИ НАПОМИНАНИЯ")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backend = MemoryBackend(os.path.join(tmp_dir, "bot_users.pkl"))
+        set_backend(backend)
+        try:
+            for user_id in (1, 2, 3):
+                backend.add_user(user_id)
+            backend.set_reminder(1, 10)
+            backend.set_reminder(2, 30)
+            backend.set_reminder(3, 10)
+
+            bot = FakeBot()
+            scheduler = ReminderScheduler(make_model, offsets=(10, 30), horizon_days=1)
+            scheduler.rebuild(now=moscow_ts(8, 0))
+            key = (scheduler.group, moscow_ts(10, 0), 10)
+
+            async def scenario():
+                sender = RateLimitedSender(bot, rate=0)
+                await scheduler.fire(sender, key, 'text')
+                # Второй воркер не дублирует рассылку
+                await scheduler.fire(sender, key, 'text')
+
+            asyncio.run(scenario())
+            assert sorted(chat_id for chat_id, _ in bot.sent) == [1, 3]
+        finally:
+            set_backend(None)
+    print("✅ Напоминание отправлено подписчикам")
+
+if __name__ == "__main__":
+    try:
+        test_events_per_class_not_per_user()
+        test_incremental_rebuild_and_pop()
+        test_fire_sends_to_matching_subscribers()
+        print("\n✅ ВСЕ ТЕСТЫ ПРОЙДЕНЫ УСПЕШНО!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n❌ ОШИБКА ПРИ ТЕСТИРОВАНИИ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
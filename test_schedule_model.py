@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Тест скомпилированной модели расписания и бинарного снимка
+"""
+
+import sys
+import os
+import json
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import date
+
+from schedule_model import (
+    ScheduleError, compile_schedule, diff_schedules, dump_snapshot, find_next_class, hash_source,
+    current_semester, load_snapshot, next_class_dates, parse_time_range, search_classes, upcoming_changes,
+    validate_schedule, week_type_for_date
+)
+
+SAMPLE_SCHEDULE = {
+    'schedule': [
+        {
+            'week': 1,
+            'days': [
+                {'day': 'Понедельник', 'classes': [
+                    {'subject': 'Математический анализ', 'time': '08:20-09:50', 'room': '1404', 'address': 'Кронверкский пр., 49'},
+                    {'window': 2, 'duration': '1ч 30м'}
+                ]},
+                {'day': 'Вторник', 'classes': [], 'note': 'День самостоятельной работы'}
+            ]
+        },
+        {
+            'week': 2,
+            'days': [
+                {'day': 'Понедельник', 'classes': [
+                    {'subject': 'Физика', 'time': '10:00-11:30', 'room': '2202', 'address': 'Ломоносова, 9'}
+                ]}
+            ]
+        }
+    ]
+}
+
+def test_validate_schedule():
+    """Проверка структуры расписания"""
+    print("🧪 ПРОВЕРКА ВАЛИДАЦИИ РАСПИСАНИЯ")
+
+    errors, warnings = validate_schedule(SAMPLE_SCHEDULE)
+    assert errors == [], errors
+    assert warnings == [], warnings
+
+    broken = {'schedule': [{'week': 3, 'days': [{'day': 'Понедельник', 'classes': [{'subject': 'X'}]}]}]}
+    errors, _ = validate_schedule(broken)
+    assert len(errors) == 2, errors
+
+    try:
+        compile_schedule(broken)
+        assert False, "Ожидалась ошибка компиляции"
+    except ScheduleError:
+        pass
+    print("✅ Валидация работает")
+
+def test_compile_and_snapshot():
+    """Компиляция модели и загрузка снимка"""
+    print("🧪 ПРОВЕРКА КОМПИЛЯЦИИ И СНИМКА")
+
+    source_hash = hash_source(json.dumps(SAMPLE_SCHEDULE))
+    model = compile_schedule(SAMPLE_SCHEDULE, source_hash)
+
+    assert model['rendered_days'][(1, 1)] == 'День самостоятельной работы'
+    assert model['rendered_days'][(1, 0)].startswith('📚 Математический анализ\n⏰ 08:20-09:50')
+    assert model['rendered_weeks'][2].startswith('📅 Понедельник:\n   📚 Физика')
+
+    payload = dump_snapshot(model)
+    assert load_snapshot(payload, source_hash) == model
+
+    try:
+        load_snapshot(payload, hash_source('{}'))
+        assert False, "Снимок от другого JSON не должен загружаться"
+    except ScheduleError:
+        pass
+    print("✅ Снимок загружается и проверяет версию исходного JSON")
+
+def test_calendar_and_time_ranges():
+    """Календарь четности недель и разбор времени занятий"""
+    print("🧪 ПРОВЕРКА КАЛЕНДАРЯ И ВРЕМЕНИ")
+
+    assert week_type_for_date(date(2025, 10, 6)) == 2
+    assert week_type_for_date(date(2025, 10, 12)) == 2
+    assert week_type_for_date(date(2025, 10, 13)) == 1
+    assert week_type_for_date(date(2025, 9, 29)) == 1
+
+    assert parse_time_range('08:20-09:50') == (500, 590)
+    assert parse_time_range('8.20 – 9.50') == (500, 590)
+    assert parse_time_range('10:00') is None
+    assert parse_time_range('11:00-10:00') is None
+    print("✅ Календарь и время разбираются корректно")
+
+def test_week_pages():
+    """Страницы всех недель семестра для навигации по неделям"""
+    print("🧪 ПРОВЕРКА СТРАНИЦ НЕДЕЛЬ")
+    model = compile_schedule(SAMPLE_SCHEDULE, semester=(date(2025, 9, 1), date(2026, 1, 31)))
+    pages = model['week_pages']
+
+    mondays = sorted(date.fromordinal(ordinal) for ordinal in pages)
+    assert all(monday.weekday() == 0 for monday in mondays)
+    assert all((later - earlier).days == 7 for earlier, later in zip(mondays, mondays[1:]))
+    assert min(model['calendar']) <= mondays[0].toordinal() + 6
+    assert max(model['calendar']) >= mondays[-1].toordinal()
+
+    even_week = pages[date(2025, 10, 6).toordinal()]
+    assert even_week.startswith('📅 Расписание на неделю (06.10 - 12.10.2025)')
+    assert even_week.endswith(model['rendered_weeks'][2])
+    assert pages[date(2025, 10, 13).toordinal()].endswith(model['rendered_weeks'][1])
+    print("✅ Страницы недель построены")
+
+def test_current_semester():
+    """Без SEMESTER_START/SEMESTER_END семестр определяется по текущей дате"""
+    print("🧪 ПРОВЕРКА ГРАНИЦ СЕМЕСТРА")
+    assert current_semester(date(2026, 10, 19)) == (date(2026, 9, 1), date(2027, 1, 31))
+    assert current_semester(date(2027, 1, 20)) == (date(2026, 9, 1), date(2027, 1, 31))
+    assert current_semester(date(2027, 3, 10)) == (date(2027, 2, 1), date(2027, 8, 31))
+
+    # Страницы по умолчанию покрывают текущую неделю
+    model = compile_schedule(SAMPLE_SCHEDULE)
+    today = date.today()
+    assert today.toordinal() - today.weekday() in model['week_pages']
+    print("✅ Семестр определяется по дате")
+
+def test_find_next_class():
+    """Текущая и следующая пара находятся по предрасчитанным интервалам"""
+    print("🧪 ПРОВЕРКА ПОИСКА СЛЕДУЮЩЕЙ ПАРЫ")
+    model = compile_schedule(SAMPLE_SCHEDULE)
+
+    # Окно пропускается, в интервалах только занятие с распознанным временем
+    assert model['intervals'][(1, 0)] == ((500,), (590,), (0,))
+
+    # 13 октября 2025 - понедельник нечетной недели
+    monday = date(2025, 10, 13)
+    class_date, class_item, start, end, is_current = find_next_class(model, monday, 8 * 60)
+    assert (class_date, class_item['subject'], start, is_current) == (monday, 'Математический анализ', 500, False)
+
+    _, class_item, _, end, is_current = find_next_class(model, monday, 9 * 60)
+    assert (class_item['subject'], end, is_current) == ('Математический анализ', 590, True)
+
+    # После последней пары ищется следующий учебный день: понедельник четной недели
+    class_date, class_item, start, _, is_current = find_next_class(model, monday, 590)
+    assert (class_date, class_item['subject'], start, is_current) == (date(2025, 10, 20), 'Физика', 600, False)
+
+    assert find_next_class(model, monday, 590, lookahead_days=3) is None
+    print("✅ Следующая пара находится")
+
+def test_search_index():
+    """Поиск по предмету, аудитории и адресу с префиксами и ближайшими датами"""
+    print("🧪 ПРОВЕРКА ПОИСКА")
+    model = load_snapshot(dump_snapshot(compile_schedule(SAMPLE_SCHEDULE)))
+
+    assert search_classes(model, 'Физика') == {(2, 0, 0)}
+    assert search_classes(model, 'мат ана') == {(1, 0, 0)}
+    assert search_classes(model, '2202') == {(2, 0, 0)}
+    assert search_classes(model, 'кронв') == {(1, 0, 0)}
+    assert search_classes(model, 'физика 1404') == set()
+    assert search_classes(model, '   ') == set()
+
+    # 06.10.2025 - понедельник четной недели, 13.10.2025 - нечетной
+    matches = search_classes(model, 'математический')
+    dates = next_class_dates(model, matches, date(2025, 10, 6), limit=2)
+    assert [(found_date, start) for found_date, _, start, _ in dates] == [(date(2025, 10, 13), 500), (date(2025, 10, 27), 500)]
+
+    # Сегодняшняя пара, которая уже закончилась, пропускается
+    dates = next_class_dates(model, {(2, 0, 0)}, date(2025, 10, 6), minute=11 * 60 + 30, limit=1)
+    assert dates[0][0] == date(2025, 10, 20)
+    print("✅ Поиск работает")
+
+def test_diff_schedules():
+    """Разница моделей находит изменения по дням и только на ближайшие даты"""
+    print("🧪 ПРОВЕРКА РАЗНИЦЫ РАСПИСАНИЙ")
+    old_model = compile_schedule(SAMPLE_SCHEDULE)
+    assert diff_schedules(old_model, compile_schedule(json.loads(json.dumps(SAMPLE_SCHEDULE)))) == {}
+
+    changed = json.loads(json.dumps(SAMPLE_SCHEDULE))
+    changed['schedule'][1]['days'][0]['classes'][0]['room'] = '2210'
+    changed['schedule'][0]['days'][1]['classes'].append(
+        {'subject': 'Химия', 'time': '11:40-13:10', 'room': '1404', 'address': 'Кронверкский пр., 49'}
+    )
+    diff = diff_schedules(old_model, compile_schedule(changed))
+
+    assert set(diff) == {(2, 0), (1, 1)}
+    kind, old_item, new_item = diff[(2, 0)][0]
+    assert (kind, old_item['room'], new_item['room']) == ('changed', '2202', '2210')
+    assert diff[(1, 1)][0][0] == 'added'
+
+    # С понедельника 6 октября (четная неделя) на 3 дня затронут только сам понедельник
+    affected = upcoming_changes(diff, old_model, date(2025, 10, 6), 3)
+    assert [changed_date for changed_date, _ in affected] == [date(2025, 10, 6)]
+    print("✅ Разница расписаний вычисляется")
+
+if __name__ == "__main__":
+    try:
+        test_validate_schedule()
+        test_compile_and_snapshot()
+        test_calendar_and_time_ranges()
+        test_week_pages()
+        test_current_semester()
+        test_find_next_class()
+        test_search_index()
+        test_diff_schedules()
+        print("\n✅ ВСЕ ТЕСТЫ ПРОЙДЕНЫ УСПЕШНО!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n❌ ОШИБКА ПРИ ТЕСТИРОВАНИИ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Тест перезагрузки расписания через /admin/schedule в режиме нескольких воркеров
+"""
+
+import sys
+import os
+import json
+import tempfile
+from unittest import mock
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import main
+from schedule_model import compile_schedule, hash_source
+from state_backend import SQLiteBackend, set_backend
+
+def make_schedule(subject):
+    return {'schedule': [
+        {'week': week, 'days': [
+            {'day': 'Понедельник', 'classes': [
+                {'subject': subject, 'time': '08:20-09:50', 'room': '1404', 'address': 'Кронверкский пр., 49'}
+            ]}
+        ]} for week in (1, 2)
+    ]}
+
+def test_reload_reaches_other_workers():
+    """Перезагрузка публикуется в общем хранилище, другой воркер применяет ее без уведомлений"""
+    print("🧪 ПРОВЕРКА СИНХРОНИЗАЦИИ РАСПИСАНИЯ МЕЖДУ ВОРКЕРАМИ")
+    env_json = json.dumps(make_schedule('Физика'))
+    new_data = make_schedule('Химия')
+    new_hash = hash_source(json.dumps(new_data))
+    calls = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            mock.patch.dict(os.environ, {'SCHEDULE_JSON': env_json}), \
+            mock.patch.object(main, 'schedule_listeners', []), \
+            mock.patch.object(main, 'COMPILED_SCHEDULE', compile_schedule(json.loads(env_json), hash_source(env_json))):
+        set_backend(SQLiteBackend(os.path.join(tmp_dir, "bot_state.db")))
+        try:
+            main.add_schedule_listener(lambda old, new: calls.append('reminders'))
+            main.add_schedule_listener(lambda old, new: calls.append('notify'), origin_only=True)
+            old_model = main.COMPILED_SCHEDULE
+
+            # Воркер, получивший /admin/schedule
+            assert main.reload_schedule(new_data, new_hash) == (True, "Расписание перезагружено")
+            assert calls == ['reminders', 'notify']
+            assert main.sync_schedule() is False
+
+            # Другой воркер все еще со старой моделью
+            main.COMPILED_SCHEDULE = old_model
+            calls.clear()
+            assert main.sync_schedule() is True
+            assert main.COMPILED_SCHEDULE['source_hash'] == new_hash
+            assert main.COMPILED_SCHEDULE['days'][(1, 0)]['classes'][0]['subject'] == 'Химия'
+            # Уведомления пользователям отправляет только исходный воркер
+            assert calls == ['reminders']
+
+            # После смены SCHEDULE_JSON старая перезагрузка не применяется
+            main.COMPILED_SCHEDULE = old_model
+            with mock.patch.dict(os.environ, {'SCHEDULE_JSON': json.dumps(make_schedule('Биология'))}):
+                assert main.sync_schedule() is False
+            assert main.COMPILED_SCHEDULE is old_model
+        finally:
+            set_backend(None)
+    print("✅ Перезагрузка доходит до всех воркеров")
+
+if __name__ == "__main__":
+    try:
+        test_reload_reaches_other_workers()
+        print("\n✅ ВСЕ ТЕСТЫ ПРОЙДЕНЫ УСПЕШНО!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n❌ ОШИБКА ПРИ ТЕСТИРОВАНИИ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Тест холодного старта: необязательные зависимости не импортируются вместе с main
+"""
+
+import sys
+import os
+import json
+import subprocess
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Модули, нужные только при включенном профилировании, бэкенде sqlite или запросе ленты
+DEFERRED_MODULES = ('cProfile', 'pstats', 'sqlite3', 'gzip')
+
+def test_optional_modules_are_deferred():
+    """import main не тянет профилировщик, sqlite3 и gzip; фаза импортов попадает во временную шкалу"""
+    print("🧪 ПРОВЕРКА ОТЛОЖЕННЫХ ИМПОРТОВ")
+    script = (
+        "import sys, json, main, web_server; "
+        f"print(json.dumps({{'loaded': [m for m in {DEFERRED_MODULES!r} if m in sys.modules], "
+        "'phases': web_server.startup_timeline['phases']}))"
+    )
+    env = dict(os.environ, STATE_BACKEND='memory', PROFILE_SAMPLE_RATE='0')
+    result = subprocess.run(
+        [sys.executable, '-c', script], capture_output=True, text=True, env=env,
+        cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert report['loaded'] == [], report['loaded']
+    assert report['phases']['imports'] > 0
+    print(f"✅ Импорт main занял {report['phases']['imports']:.3f} с без необязательных модулей")
+
+if __name__ == "__main__":
+    try:
+        test_optional_modules_are_deferred()
+        print("\n✅ ВСЕ ТЕСТЫ ПРОЙДЕНЫ УСПЕШНО!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n❌ ОШИБКА ПРИ ТЕСТИРОВАНИИ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
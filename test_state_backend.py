@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Тест бэкендов общего состояния (memory и sqlite)
+"""
+
+import sys
+import os
+import pickle
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from state_backend import CLAIMS_PRUNE_MIN, MemoryBackend, SQLiteBackend, migrate_pickled_users
+
+def check_backend(backend):
+    """Общие проверки контракта бэкенда"""
+    assert backend.add_user(1) is True
+    assert backend.add_user(1) is False
+    backend.add_user(2)
+    assert backend.get_users() == {1, 2}
+    assert backend.count_users() == 2
+
+    backend.set_users({5, 6, 7})
+    assert backend.get_users() == {5, 6, 7}
+
+    assert backend.mark_update_seen(100) is True
+    assert backend.mark_update_seen(100) is False
+    assert backend.mark_update_seen(101) is True
+
+    assert backend.get_state(5, 'waiting_for_date') is None
+    backend.set_state(5, 'waiting_for_date', True)
+    assert backend.get_state(5, 'waiting_for_date') is True
+    backend.delete_state(5, 'waiting_for_date')
+    assert backend.get_state(5, 'waiting_for_date', False) is False
+    backend.set_state(5, 'waiting_for_date', True)
+    backend.clear_state(5)
+    assert backend.get_state(5, 'waiting_for_date') is None
+
+    backend.mark_user_inactive(6, 'forbidden')
+    assert backend.get_active_users() == {5, 7}
+    assert backend.get_inactive_users() == {6: 'forbidden'}
+    backend.record_delivery(6, 'sent')
+    backend.record_delivery(6, 'forbidden')
+    stats = backend.get_delivery_stats(6)
+    assert stats['sent'] == 1 and stats['forbidden'] == 1 and stats['last_outcome'] == 'forbidden'
+    assert backend.add_user(6) is True
+    assert backend.get_active_users() == {5, 6, 7}
+
+    backend.set_reminder(5, 10)
+    backend.set_reminder(7, 30)
+    backend.set_reminder(7, 15)
+    backend.set_reminder(5, None)
+    assert backend.get_reminders() == {7: 15}
+
+    assert backend.claim_job('reminder:1', ttl=60) is True
+    assert backend.claim_job('reminder:1', ttl=60) is False
+    # Истекшее задание можно занять снова
+    assert backend.claim_job('reminder:1', ttl=0) is True
+
+    backend.publish_status('host:1', {'queue_size': 3})
+    statuses = backend.get_statuses()
+    assert statuses['host:1']['queue_size'] == 3
+    assert 'updated_at' in statuses['host:1']
+
+def test_memory_backend():
+    """Бэкенд в памяти сохраняет пользователей в pickle"""
+    print("🧪 ПРОВЕРКА MEMORY BACKEND")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        users_file = os.path.join(tmp_dir, "bot_users.pkl")
+        check_backend(MemoryBackend(users_file))
+        assert MemoryBackend(users_file).get_users() == {5, 6, 7}
+
+        # Отметки недоступных переживают перезапуск
+        MemoryBackend(users_file).mark_user_inactive(7, 'forbidden')
+        restarted = MemoryBackend(users_file)
+        assert restarted.get_inactive_users() == {7: 'forbidden'}
+        assert restarted.get_active_users() == {5, 6}
+
+        # Подписки на напоминания тоже
+        restarted.set_reminder(5, 10)
+        assert MemoryBackend(users_file).get_reminders() == {7: 15, 5: 10}
+
+        # Состояния (курсор рассылки и т.п.) пишутся отдельно, файл пользователей не трогается
+        users_mtime = os.stat(users_file).st_mtime_ns
+        restarted.set_state('broadcast', 'job', {'cursor': 5})
+        assert os.stat(users_file).st_mtime_ns == users_mtime
+        assert MemoryBackend(users_file).get_state('broadcast', 'job') == {'cursor': 5}
+
+        # Истекшие занятия заданий не копятся в памяти, действующие сохраняются
+        restarted.claim_job('daily', ttl=3600)
+        for event in range(3 * CLAIMS_PRUNE_MIN):
+            assert restarted.claim_job(f'reminder:{event}', ttl=0) is True
+        assert len(restarted._claims) <= CLAIMS_PRUNE_MIN
+        assert restarted.claim_job('daily', ttl=3600) is False
+
+        # Файл старого формата (только множество пользователей) читается
+        with open(users_file, 'wb') as f:
+            pickle.dump({1, 2}, f)
+        assert MemoryBackend(users_file).get_users() == {1, 2}
+    print("✅ Memory backend работает")
+
+def test_sqlite_backend():
+    """SQLite бэкенд общий для нескольких экземпляров (воркеров)"""
+    print("🧪 ПРОВЕРКА SQLITE BACKEND")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bot_state.db")
+        check_backend(SQLiteBackend(db_path))
+
+        # Второй воркер видит то же состояние
+        other_worker = SQLiteBackend(db_path)
+        assert other_worker.get_users() == {5, 6, 7}
+        assert other_worker.mark_update_seen(100) is False
+    print("✅ SQLite backend работает")
+
+def test_migrate_pickled_users():
+    """Пользователи из старого pickle-файла переносятся в пустое хранилище"""
+    print("🧪 ПРОВЕРКА ПЕРЕНОСА ПОЛЬЗОВАТЕЛЕЙ")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        users_file = os.path.join(tmp_dir, "bot_users.pkl")
+        with open(users_file, 'wb') as f:
+            pickle.dump({10, 20}, f)
+
+        backend = SQLiteBackend(os.path.join(tmp_dir, "bot_state.db"))
+        assert migrate_pickled_users(backend, users_file) == 2
+        assert backend.get_users() == {10, 20}
+        assert migrate_pickled_users(backend, users_file) == 0
+    print("✅ Перенос пользователей работает")
+
+if __name__ == "__main__":
+    try:
+        test_memory_backend()
+        test_sqlite_backend()
+        test_migrate_pickled_users()
+        print("\n✅ ВСЕ ТЕСТЫ ПРОЙДЕНЫ УСПЕШНО!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n❌ ОШИБКА ПРИ ТЕСТИРОВАНИИ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
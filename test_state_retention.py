@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Тест вытеснения состояния неактивных пользователей и чатов
+"""
+
+import sys
+import os
+import asyncio
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+from state_backend import MemoryBackend, set_backend
+from state_retention import StateRetention, USER, CHAT
+
+def make_update(update_id, user_id):
+    """Сообщение от пользователя user_id в его личном чате"""
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': 0, 'text': 'привет',
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Студент'}
+        }
+    }
+
+def build_application():
+    """Настоящий Application, обработчик которого пишет в user_data и chat_data"""
+    application = Application.builder().token('123456:TEST').build()
+    # initialize() обращается к Telegram (getMe), для process_update он не нужен
+    application._initialized = True
+
+    async def remember(update, context):
+        context.user_data['seen'] = True
+        context.chat_data['seen'] = True
+
+    application.add_handler(TypeHandler(Update, remember))
+    return application
+
+def test_idle_state_is_evicted():
+    """Истекают только записи без активности дольше TTL"""
+    print("🧪 ПРОВЕРКА ВЫТЕСНЕНИЯ ПО TTL")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backend = MemoryBackend(os.path.join(tmp_dir, "bot_users.pkl"))
+        set_backend(backend)
+        try:
+            asyncio.run(check_eviction(backend))
+        finally:
+            set_backend(None)
+    print("✅ Неактивные удалены, активные сохранены")
+
+async def check_eviction(backend):
+    application = build_application()
+    retention = StateRetention(ttl=100)
+
+    for user_id in (1, 2):
+        await application.process_update(Update.de_json(make_update(user_id, user_id), application.bot))
+        backend.set_state(user_id, 'dialog', True)
+        retention.touch(USER, user_id, now=0)
+        retention.touch(CHAT, user_id, now=0)
+    # Пользователь 3 активен, но обработчики не создавали для него user_data
+    retention.touch(USER, 3, now=0)
+    assert set(application.user_data) == {1, 2} and set(application.chat_data) == {1, 2}
+
+    # Пользователь 2 активен позже: его старая запись в куче пропускается
+    retention.touch(USER, 2, now=50)
+    retention.touch(CHAT, 2, now=50)
+
+    assert retention.evict(application, now=99) == 0
+    assert retention.evict(application, now=100) == 3
+    assert set(application.user_data) == {2} and set(application.chat_data) == {2}
+    assert backend.get_state(1, 'dialog') is None
+    assert backend.get_state(2, 'dialog') is True
+    # Без persistence drop_user_data копит id навсегда, поэтому для 3 он не вызывался
+    assert 3 not in application._user_ids_to_be_deleted_in_persistence
+
+    assert retention.evict(application, now=150) == 2
+    assert not application.user_data and not application.chat_data
+    snapshot = retention.snapshot()
+    assert snapshot['tracked'] == 0 and snapshot['heap_size'] == 0, snapshot
+
+def test_heap_stays_bounded():
+    """Частая активность одних и тех же пользователей не раздувает кучу"""
+    print("🧪 ПРОВЕРКА РАЗМЕРА КУЧИ")
+    retention = StateRetention(ttl=100)
+    for step in range(10000):
+        retention.touch(USER, step % 10, now=step)
+    snapshot = retention.snapshot()
+    assert snapshot['tracked'] == 10
+    assert snapshot['heap_size'] <= 2 * 10 + 65, snapshot
+    print("✅ Куча сжимается")
+
+if __name__ == "__main__":
+    try:
+        test_idle_state_is_evicted()
+        test_heap_stays_bounded()
+        print("\n✅ ВСЕ ТЕСТЫ ПРОЙДЕНЫ УСПЕШНО!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n❌ ОШИБКА ПРИ ТЕСТИРОВАНИИ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Тест трассировки задержек обновлений
+"""
+
+import sys
+import os
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from tracing import UpdateTrace, current_trace, finish_trace, get_latency_stats, traced_handler
+
+def test_parallel_api_calls_are_not_summed():
+    """Параллельные вызовы Bot API учитываются по объединению интервалов"""
+    print("🧪 ПРОВЕРКА ВРЕМЕНИ ПАРАЛЛЕЛЬНЫХ ВЫЗОВОВ")
+    trace = UpdateTrace(update_id=1, received=0.0)
+    trace.started = 0.0
+    trace.finished = 0.5
+    # answerCallbackQuery и editMessageText перекрываются, sendMessage идет после них
+    trace.add_api_call('answerCallbackQuery', 0.0, 0.1)
+    trace.add_api_call('editMessageText', 0.02, 0.15)
+    trace.add_api_call('sendMessage', 0.3, 0.4)
+
+    summary = trace.summary()
+    assert summary['api_ms'] == 250.0, summary
+    assert summary['handler_ms'] == 250.0, summary
+    assert [method for method, _ in summary['api_calls']] == ['answerCallbackQuery', 'editMessageText', 'sendMessage']
+    print("✅ Время API не превышает время обработчика")
+
+def test_handler_stats():
+    """traced_handler относит вызовы Bot API к обработчику"""
+    print("🧪 ПРОВЕРКА СТАТИСТИКИ ПО ОБРАБОТЧИКАМ")
+
+    async def fake_api_call(trace, method):
+        started = asyncio.get_running_loop().time()
+        await asyncio.sleep(0.01)
+        trace.add_api_call(method, started, asyncio.get_running_loop().time())
+
+    @traced_handler
+    async def pressed_button(update, context):
+        trace = current_trace.get()
+        await asyncio.gather(fake_api_call(trace, 'answerCallbackQuery'), fake_api_call(trace, 'editMessageText'))
+
+    async def scenario():
+        trace = UpdateTrace(update_id=2)
+        trace.mark('started')
+        current_trace.set(trace)
+        await pressed_button(None, None)
+        return finish_trace(trace)
+
+    summary = asyncio.run(scenario())
+    assert summary['handler'] == 'pressed_button'
+    assert pressed_button.__name__ == 'pressed_button'
+
+    handler_stats = get_latency_stats()['handlers']['pressed_button']
+    assert handler_stats['count'] == 1
+    assert handler_stats['api_calls_avg'] == 2
+    # Два вызова по 10 мс параллельно занимают около 10 мс, а не 20
+    assert handler_stats['api_ms']['p50'] < 18, handler_stats
+    print("✅ Статистика по обработчикам собрана")
+
+if __name__ == "__main__":
+    try:
+        test_parallel_api_calls_are_not_summed()
+        test_handler_stats()
+        print("\n✅ ВСЕ ТЕСТЫ ПРОЙДЕНЫ УСПЕШНО!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n❌ ОШИБКА ПРИ ТЕСТИРОВАНИИ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
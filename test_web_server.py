@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Тест веб-сервера: проверки входящих запросов, админских эндпоинтов, установка webhook,
+кэш getWebhookInfo и диспетчер обновлений (webhook и polling)
+"""
+
+import sys
+import os
+import asyncio
+import tempfile
+import threading
+import concurrent.futures
+from types import SimpleNamespace
+from unittest import mock
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from telegram import Update
+
+import web_server
+from state_backend import MemoryBackend, SQLiteBackend, set_backend
+from tracing import UpdateTrace
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+def test_webhook_rejects_bad_requests():
+    """Неверный секрет, отсутствие длины, большое тело и плохой JSON отсекаются до обработки"""
+    print("🧪 ПРОВЕРКА ОТКЛОНЕНИЯ ЗАПРОСОВ WEBHOOK")
+    previous = web_server.WEBHOOK_SECRET, web_server.WEBHOOK_MAX_BODY
+    web_server.WEBHOOK_SECRET = 's3cret'
+    web_server.WEBHOOK_MAX_BODY = 16
+    client = web_server.app.test_client()
+    try:
+        assert client.post('/webhook', data=b'{}').status_code == 403
+        assert client.post('/webhook', data=b'{}', headers={SECRET_HEADER: 'wrong'}).status_code == 403
+        # Не-ASCII в заголовке - тоже 403, а не 500
+        assert client.post('/webhook', data=b'{}', headers={SECRET_HEADER: 'секрет'}).status_code == 403
+        assert client.post('/webhook', data=b'{}', headers={SECRET_HEADER: 's3cret\xe9'}).status_code == 403
+
+        assert client.post('/webhook', headers={SECRET_HEADER: 's3cret'}).status_code == 411
+        assert client.post('/webhook', data=b'{"update_id": 123456789}', headers={SECRET_HEADER: 's3cret'}).status_code == 413
+        assert client.post('/webhook', data=b'{bad', headers={SECRET_HEADER: 's3cret'}).status_code == 400
+    finally:
+        web_server.WEBHOOK_SECRET, web_server.WEBHOOK_MAX_BODY = previous
+    print("✅ Некорректные запросы отклонены")
+
+def test_admin_token_check():
+    """Неверный или не-ASCII токен администратора дает 403"""
+    print("🧪 ПРОВЕРКА ТОКЕНА АДМИНИСТРАТОРА")
+    previous = web_server.ADMIN_TOKEN
+    web_server.ADMIN_TOKEN = 'admin-token'
+    client = web_server.app.test_client()
+    try:
+        assert client.get('/admin/profile').status_code == 403
+        assert client.get('/admin/profile', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+        assert client.get('/admin/profile', headers={'X-Admin-Token': 'токен'}).status_code == 403
+        with web_server.app.test_request_context(headers={'X-Admin-Token': 'admin-token'}):
+            assert web_server.is_admin_request()
+    finally:
+        web_server.ADMIN_TOKEN = previous
+    print("✅ Токен администратора проверяется")
+
+def test_admin_profile_sort():
+    """Неизвестный ключ сортировки профиля дает 400 со списком допустимых"""
+    print("🧪 ПРОВЕРКА СОРТИРОВКИ ПРОФИЛЯ")
+    previous = web_server.ADMIN_TOKEN
+    web_server.ADMIN_TOKEN = 'admin-token'
+    client = web_server.app.test_client()
+    admin = {'X-Admin-Token': 'admin-token'}
+    try:
+        response = client.get('/admin/profile?sort=foo', headers=admin)
+        assert response.status_code == 400 and 'cumulative' in response.get_json()['error']
+        assert client.get('/admin/profile?sort=tottime', headers=admin).status_code == 200
+    finally:
+        web_server.ADMIN_TOKEN = previous
+    print("✅ Ключ сортировки проверяется")
+
+class FakeWebhookBot:
+    """Bot с getWebhookInfo, возвращающим заданные настройки, и счетчиком setWebhook"""
+
+    def __init__(self, url):
+        self.info = SimpleNamespace(
+            url=url,
+            allowed_updates=list(web_server.ALLOWED_UPDATES),
+            max_connections=web_server.WEBHOOK_MAX_CONNECTIONS,
+            pending_update_count=0
+        )
+        self.set_calls = 0
+
+    async def get_webhook_info(self):
+        return self.info
+
+    async def set_webhook(self, **kwargs):
+        self.set_calls += 1
+        return True
+
+def set_webhook_calls(url):
+    """Сколько раз set_webhook_async вызвал setWebhook при совпадающих в Telegram настройках"""
+    bot = FakeWebhookBot(url)
+    assert asyncio.run(web_server.set_webhook_async(bot)) is True
+    return bot.set_calls
+
+def test_webhook_skip_or_register():
+    """Установка пропускается, только если известно, что в Telegram применены те же настройки и секрет"""
+    print("🧪 ПРОВЕРКА ПОВТОРНОЙ УСТАНОВКИ WEBHOOK")
+    url = 'https://example.onrender.com/webhook'
+    env = {'TELEGRAM_BOT_TOKEN': '123456:TEST', 'WEBHOOK_URL': url}
+    with tempfile.TemporaryDirectory() as tmp_dir, mock.patch.dict(os.environ, env), \
+            mock.patch.object(web_server, 'WEBHOOK_SECRET', 'explicit-secret'):
+        os.environ.pop('RENDER_APP_NAME', None)
+        state_db = os.path.join(tmp_dir, "bot_state.db")
+        try:
+            # Пустое хранилище: примененный секрет неизвестен, webhook ставится один раз
+            set_backend(SQLiteBackend(state_db))
+            assert set_webhook_calls(url) == 1
+            assert set_webhook_calls(url) == 0
+
+            # Отпечаток переживает перезапуск на постоянном диске
+            set_backend(SQLiteBackend(state_db))
+            assert set_webhook_calls(url) == 0
+
+            # Явный секрет убран, а хранилище пропало вместе с эфемерным диском:
+            # Telegram все еще шлет старый секрет, поэтому webhook ставится заново
+            with mock.patch.object(web_server, 'WEBHOOK_SECRET', 'derived-secret'):
+                set_backend(SQLiteBackend(os.path.join(tmp_dir, "fresh_state.db")))
+                assert set_webhook_calls(url) == 1
+                assert set_webhook_calls(url) == 0
+
+            # Другой URL - всегда новая установка
+            assert set_webhook_calls('https://old.onrender.com/webhook') == 1
+        finally:
+            set_backend(None)
+    print("✅ Webhook переустанавливается только при изменении настроек")
+
+class FakeWebhookInfo:
+    def __init__(self, url):
+        self.url = url
+
+    def to_dict(self):
+        return {'url': self.url, 'pending_update_count': 0}
+
+class SlowInfoBot:
+    """getWebhookInfo, отвечающий с задержкой; считает вызовы"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def get_webhook_info(self):
+        self.calls += 1
+        await asyncio.sleep(0.2)
+        return FakeWebhookInfo(f'https://example.onrender.com/webhook#{self.calls}')
+
+def reset_webhook_info_cache():
+    web_server._webhook_info_cache.update(info=None, fetched_at=0.0)
+    web_server._webhook_info_inflight = None
+
+def test_webhook_info_single_flight():
+    """Параллельные запросы при пустом кэше ждут один вызов getWebhookInfo"""
+    print("🧪 ПРОВЕРКА ЕДИНСТВЕННОГО ЗАПРОСА getWebhookInfo")
+    loop = asyncio.new_event_loop()
+    loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+    loop_thread.start()
+    bot = SlowInfoBot()
+    reset_webhook_info_cache()
+    try:
+        with mock.patch.object(web_server, 'processor_loop', loop), \
+                mock.patch.object(web_server, 'telegram_application', SimpleNamespace(bot=bot)):
+            with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+                results = list(pool.map(lambda _: web_server.get_webhook_info_cached(), range(8)))
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        loop_thread.join(timeout=5)
+        loop.close()
+        reset_webhook_info_cache()
+
+    assert bot.calls == 1, bot.calls
+    assert all(info == {'url': 'https://example.onrender.com/webhook#1', 'pending_update_count': 0}
+               for info, _ in results), results
+    print("✅ Один запрос на всех")
+
+def test_webhook_info_completed_future():
+    """Уже завершенный к регистрации колбэка запрос не блокирует вызывающего"""
+    print("🧪 ПРОВЕРКА ЗАВЕРШЕННОГО ЗАПРОСА getWebhookInfo")
+
+    def submit_done(coro):
+        coro.close()
+        future = concurrent.futures.Future()
+        future.set_result(FakeWebhookInfo('https://example.onrender.com/webhook'))
+        return future
+
+    results = []
+    reset_webhook_info_cache()
+    try:
+        with mock.patch.object(web_server, 'submit_to_processor', submit_done), \
+                mock.patch.object(web_server, 'telegram_application', SimpleNamespace(bot=SlowInfoBot())):
+            caller = threading.Thread(target=lambda: results.append(web_server.get_webhook_info_cached()), daemon=True)
+            caller.start()
+            caller.join(timeout=5)
+            assert not caller.is_alive(), "get_webhook_info_cached заблокирован"
+    finally:
+        reset_webhook_info_cache()
+
+    assert results[0][0]['url'] == 'https://example.onrender.com/webhook'
+    print("✅ Завершенный запрос не блокирует")
+
+def make_update(update_id, chat_id):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': 0, 'text': 'привет',
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Студент'}
+        }
+    }
+
+class RecordingProcessor:
+    """Замена process_update_data: отмечает начало и конец обработки каждого обновления"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.events = []
+
+    async def __call__(self, update_data):
+        update_id = update_data.update_id if isinstance(update_data, Update) else update_data['update_id']
+        self.events.append(('start', update_id))
+        await asyncio.sleep(self.delay)
+        self.events.append(('end', update_id))
+
+    def position(self, kind, update_id):
+        return self.events.index((kind, update_id))
+
+def check_chat_order(processor, chats):
+    """Внутри чата обновление начинается только после конца предыдущего, разные чаты перекрываются"""
+    for update_ids in chats:
+        for earlier, later in zip(update_ids, update_ids[1:]):
+            assert processor.position('end', earlier) < processor.position('start', later), processor.events
+    first_a, first_b = chats[0][0], chats[1][0]
+    assert processor.position('start', first_b) < processor.position('end', first_a), processor.events
+
+def test_dispatch_batch_orders_per_chat():
+    """Обновления одного чата идут по порядку, разных чатов - параллельно"""
+    print("🧪 ПРОВЕРКА ДИСПЕТЧЕРА ОБНОВЛЕНИЙ")
+    processor = RecordingProcessor()
+
+    async def run_batch():
+        web_server._dispatch_semaphore = asyncio.Semaphore(8)
+        batch = [(make_update(update_id, chat_id), UpdateTrace(update_id))
+                 for update_id, chat_id in ((1, 10), (2, 20), (3, 10), (4, 10), (5, 20))]
+        await asyncio.gather(*web_server.dispatch_batch(batch))
+
+    try:
+        with mock.patch.object(web_server, 'process_update_data', processor):
+            asyncio.run(run_batch())
+    finally:
+        web_server._dispatch_semaphore = None
+
+    assert len(processor.events) == 10
+    check_chat_order(processor, [(1, 3, 4), (2, 5)])
+    # Блокировки чатов и задачи не копятся
+    assert not web_server._chat_locks and not web_server._inflight_tasks
+    print("✅ Порядок внутри чата сохранен, чаты обрабатываются параллельно")
+
+class PollingBot:
+    """getUpdates отдает одну пачку, на следующем вызове останавливает polling"""
+
+    def __init__(self, updates, processor):
+        self.updates = updates
+        self.processor = processor
+        self.offsets = []
+        self.events_before_next = None
+
+    async def delete_webhook(self):
+        return True
+
+    async def get_updates(self, offset=None, **kwargs):
+        self.offsets.append(offset)
+        if len(self.offsets) == 1:
+            return self.updates
+        self.events_before_next = list(self.processor.events)
+        web_server.shutdown_event.set()
+        return []
+
+def test_polling_dispatches_batches():
+    """Polling передает пачку тому же диспетчеру и подтверждает ее следующим offset"""
+    print("🧪 ПРОВЕРКА POLLING")
+    processor = RecordingProcessor()
+    updates = [Update.de_json(make_update(update_id, chat_id), None)
+               for update_id, chat_id in ((11, 10), (12, 20), (13, 10))]
+    bot = PollingBot(updates, processor)
+
+    async def run_polling():
+        web_server._dispatch_semaphore = asyncio.Semaphore(8)
+        await web_server.poll_updates()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        set_backend(MemoryBackend(os.path.join(tmp_dir, "bot_users.pkl")))
+        try:
+            with mock.patch.object(web_server, 'process_update_data', processor), \
+                    mock.patch.object(web_server, 'telegram_application', SimpleNamespace(bot=bot)):
+                asyncio.run(run_polling())
+        finally:
+            web_server.shutdown_event.clear()
+            web_server._dispatch_semaphore = None
+            set_backend(None)
+
+    # Следующий getUpdates вызван только после обработки всей пачки
+    assert bot.offsets == [None, 14]
+    assert bot.events_before_next == processor.events and len(processor.events) == 6
+    check_chat_order(processor, [(11, 13), (12,)])
+    print("✅ Polling обрабатывает пачки через диспетчер")
+
+if __name__ == "__main__":
+    try:
+        test_webhook_rejects_bad_requests()
+        test_admin_token_check()
+        test_admin_profile_sort()
+        test_webhook_skip_or_register()
+        test_webhook_info_single_flight()
+        test_webhook_info_completed_future()
+        test_dispatch_batch_orders_per_chat()
+        test_polling_dispatches_batches()
+        print("\n✅ ВСЕ ТЕСТЫ ПРОЙДЕНЫ УСПЕШНО!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n❌ ОШИБКА ПРИ ТЕСТИРОВАНИИ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -8,6 +8,10 @@ import json
 import requests
 import sys
 from main import create_application
+from web_server import WEBHOOK_SECRET
+
+# Без секрета сервер отклоняет запросы к /webhook
+WEBHOOK_HEADERS = {'X-Telegram-Bot-Api-Secret-Token': WEBHOOK_SECRET} if WEBHOOK_SECRET else {}
 
 def check_environment():
     """Проверяет переменные окружения"""
@@ -180,6 +184,7 @@ def test_webhook_delivery():
         webhook_url = f"https://{app_name}.onrender.com/webhook"
         test_response = requests.post(f"{webhook_url}?test=1",
                                     json={"test": "webhook_test"},
+                                    headers=WEBHOOK_HEADERS,
                                     timeout=10)
 
         if test_response.status_code == 200:
@@ -301,7 +306,7 @@ def test_webhook_response():
             }
         }
 
-        response = requests.post(webhook_url, json=test_data, timeout=10)
+        response = requests.post(webhook_url, json=test_data, headers=WEBHOOK_HEADERS, timeout=10)
 
         print(f"📊 Статус ответа: {response.status_code}")
         print(f"📝 Ответ сервера: {response.text}")
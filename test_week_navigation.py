@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Тест листания расписания по неделям
+"""
+
+import sys
+import os
+from datetime import date
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import main
+from main import WEEK_NAVIGATION_LIMIT, get_week_monday, get_week_navigation, get_week_schedule
+from schedule_model import compile_schedule
+
+SAMPLE_SCHEDULE = {
+    'schedule': [
+        {'week': 1, 'days': [
+            {'day': 'Понедельник', 'classes': [
+                {'subject': 'Математический анализ', 'time': '08:20-09:50', 'room': '1404', 'address': 'Кронверкский пр., 49'}
+            ]}
+        ]},
+        {'week': 2, 'days': [
+            {'day': 'Понедельник', 'classes': [
+                {'subject': 'Физика', 'time': '10:00-11:30', 'room': '2202', 'address': 'Ломоносова, 9'}
+            ]}
+        ]}
+    ]
+}
+
+def navigation_callbacks(offset):
+    rows = get_week_navigation(offset).inline_keyboard
+    return [button.callback_data for button in rows[0] if button.callback_data.startswith('week:')]
+
+def test_navigation_outside_semester():
+    """Вне предрасчитанного семестра листание работает, недели собираются из текста типа"""
+    print("🧪 ПРОВЕРКА ЛИСТАНИЯ ВНЕ СЕМЕСТРА")
+    previous_model = main.COMPILED_SCHEDULE
+    # Семестр давно закончился: страниц для текущей недели нет
+    main.COMPILED_SCHEDULE = compile_schedule(SAMPLE_SCHEDULE, semester=(date(2020, 9, 1), date(2021, 1, 31)))
+    try:
+        assert navigation_callbacks(0) == ['week:-1', 'week:1']
+        assert navigation_callbacks(3) == ['week:2', 'week:4']
+        assert navigation_callbacks(WEEK_NAVIGATION_LIMIT) == [f'week:{WEEK_NAVIGATION_LIMIT - 1}']
+        assert navigation_callbacks(-WEEK_NAVIGATION_LIMIT) == [f'week:{1 - WEEK_NAVIGATION_LIMIT}']
+
+        monday = get_week_monday(3)
+        page = get_week_schedule(3)
+        assert page.startswith(f"📅 Расписание на неделю ({monday.strftime('%d.%m')} - ")
+        assert ('Физика' in page) != ('Математический анализ' in page)
+    finally:
+        main.COMPILED_SCHEDULE = previous_model
+    print("✅ Кнопки ◀/▶ есть и вне семестра")
+
+def test_navigation_inside_semester():
+    """В семестре страницы берутся из предрасчитанного кэша"""
+    print("🧪 ПРОВЕРКА ЛИСТАНИЯ В СЕМЕСТРЕ")
+    previous_model = main.COMPILED_SCHEDULE
+    main.COMPILED_SCHEDULE = compile_schedule(SAMPLE_SCHEDULE)
+    try:
+        page = get_week_schedule(0)
+        assert page is main.COMPILED_SCHEDULE['week_pages'][get_week_monday(0).toordinal()]
+        assert navigation_callbacks(0) == ['week:-1', 'week:1']
+    finally:
+        main.COMPILED_SCHEDULE = previous_model
+    print("✅ Текущая неделя из кэша страниц")
+
+if __name__ == "__main__":
+    try:
+        test_navigation_outside_semester()
+        test_navigation_inside_semester()
+        print("\n✅ ВСЕ ТЕСТЫ ПРОЙДЕНЫ УСПЕШНО!")
+        sys.exit(0)
+    except AssertionError as e:
+        print(f"\n❌ ОШИБКА ПРИ ТЕСТИРОВАНИИ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
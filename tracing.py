@@ -0,0 +1,180 @@
+"""
+Трассировка задержек обновлений: от получения webhook до ответа Telegram
+
+Для каждого обновления фиксируются отметки времени этапов:
+    received   - webhook получил POST (или getUpdates вернул пачку)
+    enqueued   - обновление поставлено в очередь
+    dequeued   - процессор забрал обновление из очереди
+    started    - получены блокировка чата и слот диспетчера, начат process_update
+    finished   - обработчики завершены
+Исходящие вызовы Bot API (edit_message_text, reply_text и т.д.) замеряются
+через TracingRequest и относятся к текущему обновлению через contextvars.
+Обработчики могут выполнять независимые вызовы параллельно, поэтому время
+Telegram API считается как объединение интервалов вызовов, а не их сумма.
+Обработчики, обернутые traced_handler, получают отдельную статистику вызовов.
+
+Завершенные трассы хранятся в кольцевом буфере, по которому /status считает
+скользящие перцентили; обновления дольше порога пишутся в лог медленных.
+"""
+
+import os
+import time
+import functools
+import logging
+import threading
+import contextvars
+from collections import deque
+
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# Размер кольцевого буфера трасс
+TRACE_BUFFER_SIZE = int(os.getenv('TRACE_BUFFER_SIZE', '1000'))
+# Порог медленного обновления в миллисекундах
+SLOW_UPDATE_MS = float(os.getenv('SLOW_UPDATE_MS', '2000'))
+
+PERCENTILES = (50, 90, 99)
+
+current_trace = contextvars.ContextVar('current_trace', default=None)
+
+_traces = deque(maxlen=TRACE_BUFFER_SIZE)
+_traces_lock = threading.Lock()
+
+class UpdateTrace:
+    """Отметки времени этапов обработки одного обновления"""
+
+    __slots__ = ('update_id', 'received', 'enqueued', 'dequeued', 'started', 'finished', 'api_calls', 'handler')
+
+    def __init__(self, update_id=None, received=None):
+        self.update_id = update_id
+        self.received = time.perf_counter() if received is None else received
+        self.enqueued = None
+        self.dequeued = None
+        self.started = None
+        self.finished = None
+        self.api_calls = []
+        self.handler = None
+
+    def mark(self, stage):
+        """Отмечает момент достижения этапа"""
+        setattr(self, stage, time.perf_counter())
+
+    def add_api_call(self, method, started, finished):
+        self.api_calls.append((method, started, finished))
+
+    def api_wall_time(self):
+        """Время ожидания Telegram API: объединение интервалов вызовов, параллельные не суммируются"""
+        total = 0.0
+        covered_until = None
+        for _, started, finished in sorted(self.api_calls, key=lambda call: call[1]):
+            if covered_until is None or started >= covered_until:
+                total += finished - started
+                covered_until = finished
+            elif finished > covered_until:
+                total += finished - covered_until
+                covered_until = finished
+        return total
+
+    def summary(self):
+        """Длительности этапов в миллисекундах"""
+        def span(start, end):
+            if start is None or end is None:
+                return None
+            return round((end - start) * 1000, 3)
+
+        enqueued = self.enqueued or self.received
+        dequeued = self.dequeued or enqueued
+        api_ms = round(self.api_wall_time() * 1000, 3)
+        handler_ms = span(self.started, self.finished)
+
+        return {
+            'update_id': self.update_id,
+            'handler': self.handler,
+            'ingress_ms': span(self.received, enqueued),
+            'queue_ms': span(enqueued, dequeued),
+            'dispatch_wait_ms': span(dequeued, self.started),
+            'handler_ms': round(handler_ms - api_ms, 3) if handler_ms is not None else None,
+            'api_ms': api_ms,
+            'total_ms': span(self.received, self.finished),
+            'api_calls': [(method, round((finished - started) * 1000, 3)) for method, started, finished in self.api_calls]
+        }
+
+def finish_trace(trace):
+    """Завершает трассу: кладет в кольцевой буфер и пишет в лог, если обновление медленное"""
+    trace.mark('finished')
+    summary = trace.summary()
+    with _traces_lock:
+        _traces.append(summary)
+
+    if summary['total_ms'] is not None and summary['total_ms'] >= SLOW_UPDATE_MS:
+        calls = ', '.join(f"{method} {duration:.0f} мс" for method, duration in summary['api_calls'])
+        logger.warning(
+            f"🐢 Медленное обновление {summary['update_id']}: {summary['total_ms']:.0f} мс "
+            f"(очередь {summary['queue_ms']:.0f}, ожидание {summary['dispatch_wait_ms'] or 0:.0f}, "
+            f"обработчик {summary['handler_ms'] or 0:.0f}, Telegram API {summary['api_ms']:.0f} мс: {calls or 'нет вызовов'})"
+        )
+    return summary
+
+def _percentile(sorted_values, percent):
+    """Перцентиль по методу ближайшего ранга"""
+    index = max(0, min(len(sorted_values) - 1, round(percent / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+def get_latency_stats():
+    """Скользящие перцентили по этапам для /status"""
+    with _traces_lock:
+        traces = list(_traces)
+
+    stats = {'count': len(traces), 'slow_threshold_ms': SLOW_UPDATE_MS}
+    for field in ('queue_ms', 'dispatch_wait_ms', 'handler_ms', 'api_ms', 'total_ms'):
+        values = sorted(trace[field] for trace in traces if trace[field] is not None)
+        if values:
+            stats[field] = {f"p{percent}": _percentile(values, percent) for percent in PERCENTILES}
+
+    # Вызовы Bot API в разрезе обработчиков
+    by_handler = {}
+    for trace in traces:
+        if trace['handler']:
+            by_handler.setdefault(trace['handler'], []).append(trace)
+    stats['handlers'] = {
+        name: {
+            'count': len(handler_traces),
+            'api_calls_avg': round(sum(len(trace['api_calls']) for trace in handler_traces) / len(handler_traces), 2),
+            'api_ms': {
+                f"p{percent}": _percentile(sorted(trace['api_ms'] for trace in handler_traces), percent)
+                for percent in PERCENTILES
+            }
+        }
+        for name, handler_traces in by_handler.items()
+    }
+    return stats
+
+def get_recent_traces(limit=20):
+    """Последние завершенные трассы"""
+    with _traces_lock:
+        return list(_traces)[-limit:]
+
+def traced_handler(callback):
+    """Относит трассу обновления к обработчику для статистики вызовов Bot API по обработчикам"""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        trace = current_trace.get()
+        if trace is not None:
+            trace.handler = callback.__name__
+        return await callback(update, context)
+    return wrapper
+
+class TracingRequest(HTTPXRequest):
+    """HTTPXRequest, который относит время каждого вызова Bot API к текущему обновлению"""
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        trace = current_trace.get()
+        if trace is None:
+            return await super().do_request(url, method, request_data, *args, **kwargs)
+
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, request_data, *args, **kwargs)
+        finally:
+            trace.add_api_call(url.rsplit('/', 1)[-1], started, time.perf_counter())
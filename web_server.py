@@ -5,17 +5,34 @@
 
 Использует асинхронную обработку обновлений через очередь
 для избежания блокировки Flask сервера при обработке сообщений.
+В режиме BOT_MODE=polling обновления получаются через getUpdates,
+а сервер остается только для health-эндпоинтов.
 """
 
 import os
+import hmac
 import json
+import hashlib
 import logging
 import time
+import socket
 import asyncio
 import threading
-from flask import Flask, request, jsonify
-from telegram import Bot
-from telegram.error import TelegramError
+from flask import Flask, Response, request, jsonify
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from state_backend import get_backend
+from flood_control import FloodLimiter
+from tracing import UpdateTrace, current_trace, finish_trace, get_latency_stats
+from profiling import PROFILE_SORT_KEYS, UpdateProfiler
+from loop_monitor import LoopMonitor
+from analytics import usage_analytics
+from calendar_feed import get_calendar_feed, get_schedule_group
+from schedule_model import hash_source
 
 # Настройка логирования
 logging.basicConfig(
@@ -34,15 +51,369 @@ bot_status = {
     'is_running': False,
     'start_time': None,
     'webhook_set': False,
-    'last_update': None
+    'last_update': None,
+    'last_warmup': None
+}
+
+# Как часто (в секундах) публиковать статус воркера в общее хранилище
+STATUS_PUBLISH_INTERVAL = float(os.getenv('STATUS_PUBLISH_INTERVAL', '5'))
+_last_status_publish = 0.0
+
+# Временная шкала холодного старта: длительность каждой фазы в секундах
+startup_timeline = {
+    'phases': {},
+    'process_started': None,
+    'time_to_ready': None
 }
 
 # Глобальные переменные для межпоточного взаимодействия
+# Элементы очереди: (JSON обновления, UpdateTrace)
 update_queue = []
 queue_lock = threading.Lock()
 processing_thread = None
+# Event loop потока процессора: в нем работают Bot API и фоновые задачи
+processor_loop = None
 shutdown_event = threading.Event()
 
+# Режим получения обновлений: webhook (по умолчанию) или polling через getUpdates
+BOT_MODE = os.getenv('BOT_MODE', 'webhook').lower()
+POLLING_LIMIT = 100
+POLLING_TIMEOUT = int(os.getenv('POLLING_TIMEOUT', '50'))
+# Типы обновлений, которые обрабатывает бот (для webhook и polling)
+ALLOWED_UPDATES = [kind.strip() for kind in os.getenv('ALLOWED_UPDATES', 'message,callback_query').split(',') if kind.strip()]
+
+# Конкурентный диспетчер: общий для webhook и polling
+PROCESSOR_CONCURRENCY = int(os.getenv('PROCESSOR_CONCURRENCY', '8'))
+_dispatch_semaphore = None
+_chat_locks = {}
+_inflight_tasks = set()
+
+# Сколько одновременных соединений Telegram открывает к webhook: по умолчанию
+# столько, сколько обновлений одновременно обрабатывают все воркеры (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv(
+    'WEBHOOK_MAX_CONNECTIONS',
+    str(max(1, min(100, PROCESSOR_CONCURRENCY * int(os.getenv('WEB_CONCURRENCY', '1')))))
+))
+# Политика накопившихся обновлений при установке webhook:
+# never - обработать все, always - отбросить, число N - отбросить, если их больше N
+WEBHOOK_DROP_PENDING = os.getenv('WEBHOOK_DROP_PENDING', 'never').lower()
+# Ключ хранилища состояния для настроек webhook, которые нельзя прочитать через getWebhookInfo
+WEBHOOK_STATE_KEY = 'webhook'
+
+# Секрет из заголовка X-Telegram-Bot-Api-Secret-Token: задается явно или выводится из токена,
+# чтобы все воркеры знали его без дополнительной настройки
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or (
+    hashlib.sha256(f"webhook:{os.environ['TELEGRAM_BOT_TOKEN']}".encode()).hexdigest()
+    if os.getenv('TELEGRAM_BOT_TOKEN') else None
+)
+# Максимальный размер тела webhook-запроса в байтах
+WEBHOOK_MAX_BODY = int(os.getenv('WEBHOOK_MAX_BODY', str(256 * 1024)))
+# Быстрый разбор JSON, если установлен orjson
+parse_json = orjson.loads if orjson else json.loads
+
+# Ограничение частоты обновлений от одного пользователя на входе webhook
+flood_limiter = FloodLimiter()
+
+# Профилирование обработчиков по требованию
+update_profiler = UpdateProfiler()
+# Задержка event loop процессора и поиск блокирующих его вызовов
+loop_monitor = LoopMonitor()
+# Источник скомпилированного расписания для ленты /calendar/<group>.ics (регистрирует main.py)
+schedule_provider = None
+# Кэш getWebhookInfo для /check-webhook и /metrics
+WEBHOOK_INFO_TTL = float(os.getenv('WEBHOOK_INFO_TTL', '30'))
+WEBHOOK_INFO_TIMEOUT = 10
+_webhook_info_cache = {'info': None, 'fetched_at': 0.0}
+_webhook_info_lock = threading.Lock()
+_webhook_info_inflight = None
+# Функция перезагрузки расписания для /admin/schedule (регистрирует main.py)
+schedule_reloader = None
+# Фоновые корутины (планировщик напоминаний и т.п.), запускаемые в цикле процессора
+background_tasks = []
+# Дополнительные разделы /status: имя -> функция, возвращающая словарь
+status_providers = {}
+# Токен для админских эндпоинтов (заголовок X-Admin-Token); без него эндпоинты выключены
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+# Прогрев соединений: сервер начинает принимать запросы после первого прогрева
+processor_ready = threading.Event()
+warmup_hooks = []
+WARMUP_TIMEOUT = float(os.getenv('WARMUP_TIMEOUT', '15'))
+# Интервал фонового поддержания соединений в секундах (0 - выключено)
+KEEP_WARM_INTERVAL = float(os.getenv('KEEP_WARM_INTERVAL', '0'))
+
+def get_worker_id():
+    """Идентификатор воркера: хост и PID процесса"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def publish_worker_status(force=False):
+    """Публикует статус воркера в общее хранилище, чтобы /status видел все воркеры"""
+    global _last_status_publish
+    now = time.time()
+    if not force and now - _last_status_publish < STATUS_PUBLISH_INTERVAL:
+        return
+
+    _last_status_publish = now
+    try:
+        get_backend().publish_status(get_worker_id(), {
+            'is_running': bot_status['is_running'],
+            'start_time': bot_status['start_time'],
+            'webhook_set': bot_status['webhook_set'],
+            'last_update': bot_status['last_update'],
+            'queue_size': len(update_queue)
+        })
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось опубликовать статус воркера: {e}")
+
+def get_oldest_queued_age():
+    """Сколько секунд ждет в очереди самое старое обновление"""
+    with queue_lock:
+        if not update_queue:
+            return 0.0
+        trace = update_queue[0][1]
+    return time.perf_counter() - (trace.enqueued or trace.received)
+
+def record_startup_phase(name, started, finished=None):
+    """Записывает длительность фазы запуска (отметки времени из time.perf_counter())"""
+    if finished is None:
+        finished = time.perf_counter()
+
+    # Первая записанная фаза задает момент старта процесса
+    if startup_timeline['process_started'] is None:
+        startup_timeline['process_started'] = started
+
+    startup_timeline['phases'][name] = round(finished - started, 4)
+    logger.info(f"⏱️ Фаза запуска '{name}': {finished - started:.3f} с")
+
+def mark_startup_ready():
+    """Фиксирует полное время от старта процесса до готовности принимать запросы"""
+    if startup_timeline['process_started'] is None:
+        return
+    startup_timeline['time_to_ready'] = round(time.perf_counter() - startup_timeline['process_started'], 4)
+    logger.info(f"⏱️ Время до готовности: {startup_timeline['time_to_ready']:.3f} с")
+
+def register_warmup_hook(hook):
+    """Регистрирует синхронную функцию прогрева кэшей, вызываемую при прогреве"""
+    warmup_hooks.append(hook)
+
+def register_schedule_provider(provider):
+    """Регистрирует функцию, возвращающую текущую скомпилированную модель расписания"""
+    global schedule_provider
+    schedule_provider = provider
+
+def register_schedule_reloader(reloader):
+    """Регистрирует функцию reloader(data, source_hash) -> (успех, сообщение)"""
+    global schedule_reloader
+    schedule_reloader = reloader
+
+def register_background_task(factory):
+    """Регистрирует фабрику корутины, которая работает в цикле процессора до остановки"""
+    background_tasks.append(factory)
+
+def register_status_provider(name, provider):
+    """Добавляет раздел name в ответ /status"""
+    status_providers[name] = provider
+
+async def warm_up():
+    """Открывает соединения с api.telegram.org и прогревает кэши в цикле процессора"""
+    started = time.perf_counter()
+
+    # DNS, TLS-рукопожатие и первый запрос PTB выполняются здесь, а не на первом обновлении
+    if telegram_application:
+        try:
+            await telegram_application.bot.get_me()
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось прогреть соединение с Telegram API: {e}")
+
+    for hook in warmup_hooks:
+        try:
+            hook()
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка прогрева кэша {getattr(hook, '__name__', hook)}: {e}")
+
+    bot_status['last_warmup'] = time.time()
+    return started
+
+async def keep_warm():
+    """Периодически прогревает соединения и кэши, пока бот простаивает"""
+    logger.info(f"🔥 Поддержание соединений включено, интервал {KEEP_WARM_INTERVAL:.0f} с")
+    while not shutdown_event.is_set():
+        await asyncio.sleep(KEEP_WARM_INTERVAL)
+
+        # Если обновления приходили недавно, соединения и так горячие
+        last_activity = max(bot_status['last_update'] or 0, bot_status['last_warmup'] or 0)
+        if time.time() - last_activity < KEEP_WARM_INTERVAL:
+            continue
+
+        await warm_up()
+        logger.info("🔥 Соединения и кэши прогреты в простое")
+
+async def process_update_data(update_data):
+    """Обрабатывает одно обновление: JSON из webhook или готовый Update из getUpdates"""
+    try:
+        if not telegram_application:
+            logger.error("❌ Telegram Application не инициализирован")
+            return
+
+        # Проверяем, что приложение инициализировано
+        if not hasattr(telegram_application, '_initialized') or not telegram_application._initialized:
+            logger.error("❌ Попытка обработать обновление в неинициализированном приложении")
+            return
+
+        from telegram import Update
+        if isinstance(update_data, Update):
+            update = update_data
+        else:
+            # Создаем Update объект из JSON данных
+            update = Update.de_json(update_data, telegram_application.bot)
+
+        logger.info(f"Обработка обновления: {update.update_id}")
+
+        # Обрабатываем обновление асинхронно
+        await telegram_application.process_update(update)
+        logger.info(f"✅ Успешно обработан update: {update.update_id}")
+
+    except Exception as e:
+        logger.error(f"Ошибка обработки обновления: {e}")
+
+def get_update_user_id(update_data):
+    """Возвращает id отправителя обновления из JSON webhook"""
+    for key, payload in update_data.items():
+        if key != 'update_id' and isinstance(payload, dict):
+            return (payload.get('from') or {}).get('id')
+    return None
+
+def get_update_chat_key(update_data):
+    """Возвращает id чата (или пользователя), внутри которого важен порядок обновлений"""
+    if not isinstance(update_data, dict):
+        chat = update_data.effective_chat
+        user = update_data.effective_user
+        return chat.id if chat else (user.id if user else None)
+
+    for key, payload in update_data.items():
+        if key == 'update_id' or not isinstance(payload, dict):
+            continue
+        chat = payload.get('chat') or (payload.get('message') or {}).get('chat')
+        if chat:
+            return chat.get('id')
+        return (payload.get('from') or {}).get('id')
+    return None
+
+async def _dispatch_one(chat_key, update_data, trace):
+    """Обрабатывает обновление после всех предыдущих обновлений того же чата"""
+    entry = _chat_locks.get(chat_key) if chat_key is not None else None
+    try:
+        if entry:
+            await entry[0].acquire()
+        try:
+            async with _dispatch_semaphore:
+                # Вызовы Bot API внутри обработчиков относятся к трассе этого обновления
+                trace.mark('started')
+                current_trace.set(trace)
+                sampled = update_profiler.begin()
+                try:
+                    await process_update_data(update_data)
+                finally:
+                    update_profiler.end(sampled)
+                    finish_trace(trace)
+        finally:
+            if entry:
+                entry[0].release()
+    finally:
+        # Блокировка чата удаляется, когда в нем не осталось обновлений
+        if entry:
+            entry[1] -= 1
+            if entry[1] == 0:
+                _chat_locks.pop(chat_key, None)
+
+def dispatch_batch(batch):
+    """Запускает конкурентную обработку пачки обновлений, сохраняя порядок внутри чата
+
+    batch - список пар (обновление, UpdateTrace).
+    Возвращает список задач; webhook-режим их не ждет, polling-режим ждет всю пачку.
+    """
+    tasks = []
+    for update_data, trace in batch:
+        trace.mark('dequeued')
+        chat_key = get_update_chat_key(update_data)
+        if chat_key is not None:
+            entry = _chat_locks.setdefault(chat_key, [asyncio.Lock(), 0])
+            entry[1] += 1
+
+        # Каждая задача получает свою копию контекста, поэтому трассы не смешиваются
+        task = asyncio.create_task(_dispatch_one(chat_key, update_data, trace))
+        _inflight_tasks.add(task)
+        task.add_done_callback(_inflight_tasks.discard)
+        tasks.append(task)
+    return tasks
+
+async def consume_update_queue():
+    """Забирает из очереди webhook все накопившиеся обновления и передает их диспетчеру"""
+    while not shutdown_event.is_set():
+        # Получаем все обновления из очереди разом (неблокирующе)
+        with queue_lock:
+            batch = update_queue[:]
+            update_queue.clear()
+
+        # Отложенные нажатия пользователей, у которых восстановился лимит
+        batch.extend(flood_limiter.release_ready())
+
+        if not batch:
+            await asyncio.sleep(0.1)  # Небольшая пауза
+            continue
+
+        logger.info(f"Извлечено обновлений из очереди: {len(batch)}")
+        dispatch_batch(batch)
+        # Даем запущенным задачам начать работу до следующей проверки очереди
+        await asyncio.sleep(0)
+
+async def poll_updates():
+    """Получает обновления через getUpdates пачками и передает их тому же диспетчеру"""
+    if not telegram_application:
+        logger.error("❌ Telegram Application не инициализирован, polling невозможен")
+        return
+
+    bot = telegram_application.bot
+
+    # getUpdates не работает, пока установлен webhook
+    try:
+        await bot.delete_webhook()
+        bot_status['webhook_set'] = False
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось удалить webhook перед polling: {e}")
+
+    logger.info(f"📥 Запуск polling: limit={POLLING_LIMIT}, timeout={POLLING_TIMEOUT} с")
+    offset = None
+    backoff = 1
+    while not shutdown_event.is_set():
+        try:
+            updates = await bot.get_updates(
+                offset=offset,
+                limit=POLLING_LIMIT,
+                timeout=POLLING_TIMEOUT,
+                allowed_updates=ALLOWED_UPDATES
+            )
+            backoff = 1
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка getUpdates, повтор через {backoff} с: {e}")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+            continue
+
+        if not updates:
+            continue
+
+        received = time.perf_counter()
+        offset = updates[-1].update_id + 1
+        bot_status['last_update'] = time.time()
+        publish_worker_status()
+        logger.info(f"📥 Получена пачка обновлений: {len(updates)}")
+
+        # Ждем всю пачку: следующий getUpdates подтверждает обработку текущей
+        await asyncio.gather(*dispatch_batch([
+            (update, UpdateTrace(update.update_id, received)) for update in updates
+        ]))
+
 def start_update_processor():
     """Запускает асинхронный процессор обновлений"""
     global processing_thread
@@ -53,40 +424,40 @@ def start_update_processor():
         asyncio.set_event_loop(loop)
 
         async def process_updates():
+            global _dispatch_semaphore, processor_loop
             logger.info("Запуск цикла обработки обновлений")
-            while not shutdown_event.is_set():
-                try:
-                    # Получаем обновление из очереди (неблокирующе)
-                    update_data = None
-                    with queue_lock:
-                        if update_queue:
-                            update_data = update_queue.pop(0)
-                            logger.info(f"Извлечено обновление из очереди, размер очереди: {len(update_queue)}")
-
-                    if update_data is None:
-                        await asyncio.sleep(0.1)  # Небольшая пауза
-                        continue
-
-                    logger.info(f"Обработка обновления: {update_data.get('update_id', 'unknown')}")
-
-                    if telegram_application:
-                        # Проверяем, что приложение инициализировано
-                        if not hasattr(telegram_application, '_initialized') or not telegram_application._initialized:
-                            logger.error("❌ Попытка обработать обновление в неинициализированном приложении")
-                            continue
-
-                        # Создаем Update объект из JSON данных
-                        from telegram import Update
-                        update = Update.de_json(update_data, telegram_application.bot)
-
-                        # Обрабатываем обновление асинхронно
-                        await telegram_application.process_update(update)
-                        logger.info(f"✅ Успешно обработан webhook update: {update.update_id}")
-                    else:
-                        logger.error("❌ Telegram Application не инициализирован")
-
-                except Exception as e:
-                    logger.error(f"Ошибка обработки обновления: {e}")
+            processor_loop = asyncio.get_running_loop()
+            _dispatch_semaphore = asyncio.Semaphore(PROCESSOR_CONCURRENCY)
+
+            # Прогреваем соединения в том же event loop, где будут обрабатываться обновления
+            record_startup_phase('warmup', await warm_up())
+            processor_ready.set()
+
+            monitor_task = asyncio.create_task(loop_monitor.run(shutdown_event))
+            analytics_task = asyncio.create_task(usage_analytics.run_flusher())
+            loop_monitor.start_watchdog(shutdown_event)
+
+            keep_warm_task = None
+            if KEEP_WARM_INTERVAL > 0:
+                keep_warm_task = asyncio.create_task(keep_warm())
+
+            extra_tasks = [asyncio.create_task(factory()) for factory in background_tasks]
+
+            if BOT_MODE == 'polling':
+                await poll_updates()
+            else:
+                await consume_update_queue()
+
+            if keep_warm_task:
+                keep_warm_task.cancel()
+            monitor_task.cancel()
+            analytics_task.cancel()
+            for task in extra_tasks:
+                task.cancel()
+
+            # Даем завершиться уже начатым обработкам
+            if _inflight_tasks:
+                await asyncio.wait(set(_inflight_tasks), timeout=3)
 
             logger.info("Цикл обработки обновлений завершен")
 
@@ -101,6 +472,13 @@ def start_update_processor():
     processing_thread.start()
     logger.info("✅ Асинхронный процессор обновлений запущен")
 
+def submit_to_processor(coro):
+    """Запускает корутину в event loop процессора из другого потока, возвращает concurrent.futures.Future"""
+    if processor_loop is None or processor_loop.is_closed():
+        coro.close()
+        raise RuntimeError("Процессор обновлений не запущен")
+    return asyncio.run_coroutine_threadsafe(coro, processor_loop)
+
 def stop_update_processor():
     """Останавливает асинхронный процессор обновлений"""
     global processing_thread
@@ -114,6 +492,18 @@ def stop_update_processor():
         if processing_thread.is_alive():
             logger.warning("Процессор обновлений не остановился корректно")
 
+def header_secret_matches(header_name, expected):
+    """Сравнивает секрет из заголовка с ожидаемым за постоянное время
+
+    compare_digest на строках с не-ASCII символами бросает TypeError, поэтому
+    сравниваются байты: заголовок WSGI - строка latin-1 с исходными байтами.
+    """
+    try:
+        provided = request.headers.get(header_name, '').encode('latin-1')
+    except UnicodeEncodeError:
+        return False
+    return hmac.compare_digest(provided, expected.encode('utf-8'))
+
 @app.route('/')
 def home():
     """Главная страница для проверки работы сервера"""
@@ -121,18 +511,56 @@ def home():
 
 @app.route('/webhook', methods=['POST'])
 def webhook():
-    """Обработчик webhook-запросов от Telegram"""
+    """Обработчик webhook-запросов от Telegram
+
+    Дешевые проверки идут первыми: секрет в заголовке, затем размер по Content-Length,
+    и только потом разбор JSON и логирование.
+    """
+    trace = UpdateTrace()
+
+    # Запросы не от Telegram отсекаются без чтения тела
+    if WEBHOOK_SECRET and not header_secret_matches('X-Telegram-Bot-Api-Secret-Token', WEBHOOK_SECRET):
+        return "Forbidden", 403
+
+    content_length = request.content_length
+    if content_length is None:
+        return "Length Required", 411
+    if content_length > WEBHOOK_MAX_BODY:
+        logger.warning(f"⚠️ Отклонен webhook запрос размером {content_length} байт")
+        return "Payload Too Large", 413
+
     try:
-        # Получаем JSON данные от Telegram
-        update_data = request.get_json()
+        update_data = parse_json(request.get_data(cache=False))
+    except ValueError:
+        logger.warning("⚠️ Получен webhook запрос с некорректным JSON")
+        return "Bad Request", 400
 
-        if not update_data:
+    try:
+        if not update_data or not isinstance(update_data, dict):
             logger.warning("Получен пустой webhook запрос")
             return "OK", 200
 
         update_id = update_data.get('update_id', 'unknown')
+        trace.update_id = update_id
         logger.info(f"📨 Получен webhook update: {update_id}")
 
+        # Повторная доставка того же обновления (в том числе другому воркеру) пропускается
+        if isinstance(update_id, int) and not get_backend().mark_update_seen(update_id):
+            logger.info(f"♻️ Обновление {update_id} уже получено, пропускаем")
+            return "OK", 200
+
+        # Флуд одного пользователя не должен занимать процессор: лишние сообщения отбрасываются,
+        # из лишних нажатий кнопок сохраняется только последнее
+        user_id = get_update_user_id(update_data)
+        if not flood_limiter.allow(user_id):
+            if 'callback_query' in update_data:
+                flood_limiter.defer(user_id, (update_data, trace))
+                logger.info(f"🚦 Нажатие пользователя {user_id} отложено: превышен лимит частоты")
+            else:
+                flood_limiter.drop()
+                logger.info(f"🚦 Обновление {update_id} от пользователя {user_id} отброшено: превышен лимит частоты")
+            return "OK", 200
+
         # Проверяем тип обновления
         if 'message' in update_data:
             message = update_data['message']
@@ -142,12 +570,14 @@ def webhook():
 
         # Обновляем статус последнего обновления
         bot_status['last_update'] = time.time()
+        publish_worker_status()
 
         # Добавляем обновление в очередь для обработки
         if processing_thread and processing_thread.is_alive():
             # Добавляем обновление в очередь синхронно
             with queue_lock:
-                update_queue.append(update_data)
+                trace.mark('enqueued')
+                update_queue.append((update_data, trace))
 
             logger.info(f"✅ Обновление {update_id} добавлено в очередь для асинхронной обработки")
         else:
@@ -160,61 +590,241 @@ def webhook():
         logger.error(f"❌ Ошибка обработки webhook: {e}")
         return "Error processing webhook", 500
 
+def get_webhook_info_cached():
+    """getWebhookInfo с кэшем на WEBHOOK_INFO_TTL секунд и единственным запросом на всех
+
+    Запрос выполняется общим клиентом бота в цикле процессора; параллельные
+    запросы во время обновления кэша ждут тот же вызов. Если обновить не удалось,
+    отдается устаревший результат. Возвращает (словарь информации, возраст в секундах).
+    """
+    global _webhook_info_inflight
+    with _webhook_info_lock:
+        cached = _webhook_info_cache['info']
+        if cached is not None and time.monotonic() - _webhook_info_cache['fetched_at'] < WEBHOOK_INFO_TTL:
+            return cached, time.monotonic() - _webhook_info_cache['fetched_at']
+
+        future = _webhook_info_inflight
+        started = future is None
+        if started:
+            if not telegram_application:
+                raise RuntimeError("Telegram Application не инициализирован")
+            future = submit_to_processor(telegram_application.bot.get_webhook_info())
+            _webhook_info_inflight = future
+
+    # Колбэк уже завершенного future вызывается сразу, а _store_webhook_info берет
+    # ту же блокировку, поэтому регистрация идет после ее освобождения
+    if started:
+        future.add_done_callback(_store_webhook_info)
+
+    try:
+        future.result(timeout=WEBHOOK_INFO_TIMEOUT)
+    except Exception as e:
+        if future.done():
+            _store_webhook_info(future)
+        if cached is None:
+            raise
+        logger.warning(f"⚠️ Не удалось обновить getWebhookInfo, отдаем кэш: {e}")
+    else:
+        # Ждущие могут проснуться раньше, чем колбэк сохранит результат
+        _store_webhook_info(future)
+
+    with _webhook_info_lock:
+        return _webhook_info_cache['info'], time.monotonic() - _webhook_info_cache['fetched_at']
+
+def _store_webhook_info(future):
+    """Сохраняет результат getWebhookInfo в кэш (вызывается по завершении запроса)
+
+    Вызывается и колбэком future, и ждущими его запросами: результат сохраняет первый.
+    """
+    global _webhook_info_inflight
+    with _webhook_info_lock:
+        if _webhook_info_inflight is not future:
+            return
+        _webhook_info_inflight = None
+        if future.cancelled() or future.exception() is not None:
+            return
+        _webhook_info_cache['info'] = future.result().to_dict()
+        _webhook_info_cache['fetched_at'] = time.monotonic()
+
 @app.route('/check-webhook')
 def check_webhook():
-    """Проверяет настройки webhook в Telegram"""
+    """Проверяет настройки webhook в Telegram (результат кэшируется на WEBHOOK_INFO_TTL секунд)"""
     try:
-        token = os.getenv('TELEGRAM_BOT_TOKEN')
-        if not token:
-            return jsonify({
-                "error": "TELEGRAM_BOT_TOKEN не установлен",
-                "status": "error"
-            }), 500
-
-        import requests
-
-        response = requests.get(f"https://api.telegram.org/bot{token}/getWebhookInfo", timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('ok'):
-                webhook_info = data.get('result', {})
-                return jsonify({
-                    "webhook_url": webhook_info.get('url', 'не установлен'),
-                    "pending_update_count": webhook_info.get('pending_update_count', 0),
-                    "last_error_date": webhook_info.get('last_error_date'),
-                    "last_error_message": webhook_info.get('last_error_message'),
-                    "max_connections": webhook_info.get('max_connections', 40),
-                    "ip_address": webhook_info.get('ip_address'),
-                    "status": "success"
-                })
-            else:
-                return jsonify({
-                    "error": f"Ошибка API Telegram: {data}",
-                    "status": "error"
-                }), 500
-        else:
-            return jsonify({
-                "error": f"Ошибка HTTP: {response.status_code}",
-                "status": "error"
-            }), 500
-
+        webhook_info, age = get_webhook_info_cached()
     except Exception as e:
         return jsonify({
             "error": f"Исключение: {e}",
             "status": "error"
         }), 500
 
+    return jsonify({
+        "webhook_url": webhook_info.get('url') or 'не установлен',
+        "pending_update_count": webhook_info.get('pending_update_count', 0),
+        "last_error_date": webhook_info.get('last_error_date'),
+        "last_error_message": webhook_info.get('last_error_message'),
+        "max_connections": webhook_info.get('max_connections', 40),
+        "ip_address": webhook_info.get('ip_address'),
+        "cache_age": round(age, 1),
+        "status": "success"
+    })
+
+@app.route('/metrics')
+def metrics():
+    """Метрики в текстовом формате Prometheus"""
+    lines = []
+
+    def gauge(name, value, help_text):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+
+    try:
+        webhook_info, age = get_webhook_info_cached()
+        gauge('telegram_webhook_pending_update_count', webhook_info.get('pending_update_count', 0),
+              'Обновления, ожидающие доставки на webhook (getWebhookInfo)')
+        gauge('telegram_webhook_info_age_seconds', round(age, 3), 'Возраст закэшированного getWebhookInfo')
+    except Exception as e:
+        logger.warning(f"⚠️ getWebhookInfo недоступен для метрик: {e}")
+
+    gauge('bot_update_queue_size', len(update_queue), 'Обновления в очереди процессора')
+    gauge('bot_inflight_updates', len(_inflight_tasks), 'Обновления в обработке')
+    gauge('bot_oldest_queued_seconds', round(get_oldest_queued_age(), 3), 'Возраст самого старого обновления в очереди')
+    gauge('bot_loop_lag_seconds', loop_monitor.snapshot()['lag_ms'] / 1000, 'Задержка event loop процессора')
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/stats')
+def stats():
+    """Статистика использования: действия по дням и оценка уникальных пользователей"""
+    days = request.args.get('days', 7, type=int)
+    return jsonify(usage_analytics.stats(days=max(1, days)))
+
+@app.route('/calendar/<group>.ics')
+def calendar_ics(group):
+    """Расписание в формате iCalendar с сильным ETag, ответом 304 и gzip"""
+    model = schedule_provider() if schedule_provider else None
+    if not model:
+        return jsonify({"error": "Расписание не загружено", "status": "error"}), 503
+    if group.lower() != get_schedule_group(model).lower():
+        return jsonify({"error": "Неизвестная группа", "status": "error"}), 404
+
+    feed = get_calendar_feed(model, get_schedule_group(model))
+    use_gzip = 'gzip' in request.accept_encodings
+    etag = feed['gzip_etag'] if use_gzip else feed['etag']
+    headers = {
+        'ETag': f'"{etag}"',
+        'Cache-Control': 'public, max-age=3600',
+        'Vary': 'Accept-Encoding'
+    }
+
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=headers)
+
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+    return Response(
+        feed['gzip_body'] if use_gzip else feed['body'],
+        mimetype='text/calendar',
+        content_type='text/calendar; charset=utf-8',
+        headers=headers
+    )
+
+def is_admin_request():
+    """Проверяет токен администратора в заголовке X-Admin-Token"""
+    if not ADMIN_TOKEN:
+        return False
+    return header_secret_matches('X-Admin-Token', ADMIN_TOKEN)
+
+def admin_forbidden():
+    """Ответ на запрос без корректного токена администратора"""
+    return jsonify({"error": "Требуется токен администратора", "status": "error"}), 403
+
+@app.route('/admin/schedule', methods=['POST'])
+def admin_schedule_reload():
+    """Перезагружает расписание из JSON в теле запроса без перезапуска бота"""
+    if not is_admin_request():
+        return admin_forbidden()
+    if not schedule_reloader:
+        return jsonify({"error": "Перезагрузка расписания недоступна", "status": "error"}), 503
+
+    raw = request.get_data(as_text=True)
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError as e:
+        return jsonify({"error": f"Некорректный JSON: {e}", "status": "error"}), 400
+
+    ok, message = schedule_reloader(data, hash_source(raw))
+    logger.info(f"🔄 Перезагрузка расписания: {message}")
+    if not ok:
+        return jsonify({"error": message, "status": "error"}), 400
+    return jsonify({"status": "success", "message": message})
+
+@app.route('/admin/profile', methods=['GET', 'POST'])
+def admin_profile():
+    """Запуск окна профилирования (POST ?seconds=N) и текстовый отчет (GET)"""
+    if not is_admin_request():
+        return admin_forbidden()
+
+    if request.method == 'POST':
+        seconds = request.args.get('seconds', '30')
+        try:
+            window_until = update_profiler.start_window(float(seconds))
+        except ValueError:
+            return jsonify({"error": "seconds должен быть числом", "status": "error"}), 400
+        if request.args.get('reset'):
+            update_profiler.reset()
+        logger.info(f"🔬 Запущено окно профилирования на {seconds} с")
+        return jsonify({"status": "success", "window_until": window_until, **update_profiler.snapshot()})
+
+    limit = request.args.get('limit', 30, type=int)
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in PROFILE_SORT_KEYS:
+        return jsonify({
+            "error": f"sort должен быть одним из: {', '.join(PROFILE_SORT_KEYS)}",
+            "status": "error"
+        }), 400
+    return Response(update_profiler.report(limit, sort), mimetype='text/plain; charset=utf-8')
+
+@app.route('/admin/profile/download')
+def admin_profile_download():
+    """Накопленная статистика в формате pstats (.prof)"""
+    if not is_admin_request():
+        return admin_forbidden()
+
+    payload = update_profiler.dump()
+    if payload is None:
+        return jsonify({"error": "Нет данных профилирования", "status": "error"}), 404
+
+    return Response(payload, mimetype='application/octet-stream', headers={
+        'Content-Disposition': f'attachment; filename="updates-{int(time.time())}.prof"'
+    })
+
+@app.route('/admin/profile/reset', methods=['POST'])
+def admin_profile_reset():
+    """Сбрасывает накопленную статистику профилирования"""
+    if not is_admin_request():
+        return admin_forbidden()
+
+    update_profiler.reset()
+    return jsonify({"status": "success"})
+
 @app.route('/health')
 def health_check():
-    """Health check endpoint для Render"""
+    """Health check endpoint для Render
+
+    Отвечает 503, если event loop процессора опаздывает больше LOOP_LAG_SLO_MS
+    """
+    healthy = loop_monitor.is_healthy()
     return jsonify({
-        'status': 'healthy',
+        'status': 'healthy' if healthy else 'degraded',
         'timestamp': time.time(),
         'bot_running': bot_status['is_running'],
         'webhook_set': bot_status['webhook_set'],
         'queue_size': len(update_queue),
-        'processor_alive': processing_thread.is_alive() if processing_thread else False
-    }), 200
+        'oldest_queued_ms': round(get_oldest_queued_age() * 1000, 1),
+        'loop': loop_monitor.snapshot(),
+        'processor_alive': processing_thread.is_alive() if processing_thread else False,
+        'warmed_up': processor_ready.is_set()
+    }), 200 if healthy else 503
 
 @app.route('/status')
 def status():
@@ -228,7 +838,25 @@ def status():
         'uptime': uptime,
         'last_update': bot_status['last_update'],
         'queue_size': len(update_queue),
+        'oldest_queued_ms': round(get_oldest_queued_age() * 1000, 1),
+        'inflight_updates': len(_inflight_tasks),
+        'loop': loop_monitor.snapshot(),
+        'flood_control': flood_limiter.snapshot(),
+        'latency': get_latency_stats(),
+        'profiler': update_profiler.snapshot(),
+        'mode': BOT_MODE,
         'processor_alive': processing_thread.is_alive() if processing_thread else False,
+        'warmed_up': processor_ready.is_set(),
+        'last_warmup': bot_status['last_warmup'],
+        'keep_warm_interval': KEEP_WARM_INTERVAL,
+        'startup': {
+            'phases': startup_timeline['phases'],
+            'time_to_ready': startup_timeline['time_to_ready']
+        },
+        **{name: provider() for name, provider in status_providers.items()},
+        'worker_id': get_worker_id(),
+        'state_backend': get_backend().name,
+        'workers': get_backend().get_statuses(),
         'environment': {
             'telegram_token': bool(os.getenv('TELEGRAM_BOT_TOKEN')),
             'schedule_json': bool(os.getenv('SCHEDULE_JSON')),
@@ -236,51 +864,94 @@ def status():
         }
     }), 200
 
-def set_webhook():
-    """Устанавливает webhook для Telegram бота асинхронно"""
+def get_webhook_url():
+    """Возвращает URL webhook из переменных окружения"""
+    # Получаем URL приложения из переменной окружения или используем Render URL
+    app_name = os.getenv('RENDER_APP_NAME')
+    if app_name:
+        return f"https://{app_name}.onrender.com/webhook"
+
+    # Если RENDER_APP_NAME не установлен, используем переменную WEBHOOK_URL
+    return os.getenv('WEBHOOK_URL')
+
+def should_drop_pending(pending_update_count):
+    """Решает по WEBHOOK_DROP_PENDING, отбрасывать ли накопившиеся обновления"""
+    if WEBHOOK_DROP_PENDING in ('always', 'true', '1', 'yes'):
+        return True
+    if WEBHOOK_DROP_PENDING.isdigit():
+        return pending_update_count > int(WEBHOOK_DROP_PENDING)
+    return False
+
+def get_secret_fingerprint():
+    """Отпечаток секрета webhook: getWebhookInfo секрет не возвращает, поэтому примененный хранится в хранилище"""
+    if not WEBHOOK_SECRET:
+        return None
+    return hashlib.sha256(WEBHOOK_SECRET.encode()).hexdigest()[:16]
+
+def webhook_matches(webhook_info, webhook_url):
+    """Совпадают ли текущие настройки webhook в Telegram с желаемыми"""
+    return (
+        webhook_info.url == webhook_url
+        # Без отпечатка (например, после потери хранилища) секрет считается не примененным:
+        # лишняя установка дешевле, чем 403 на все обновления со старым секретом
+        and get_backend().get_state(WEBHOOK_STATE_KEY, 'secret_fingerprint') == get_secret_fingerprint()
+        and set(webhook_info.allowed_updates or ()) == set(ALLOWED_UPDATES)
+        and webhook_info.max_connections == WEBHOOK_MAX_CONNECTIONS
+    )
+
+async def set_webhook_async(bot=None):
+    """Устанавливает webhook в текущем event loop
+
+    Если передан bot (например, application.bot), используется его пул соединений,
+    что позволяет выполнять установку параллельно с application.initialize().
+    Сначала запрашивается getWebhookInfo: если настройки уже совпадают и накопившиеся
+    обновления отбрасывать не нужно, повторная установка пропускается.
+    """
+    from telegram import Bot
+    from telegram.error import TelegramError
+
     try:
         token = os.getenv('TELEGRAM_BOT_TOKEN')
         if not token:
             logger.error("❌ Не найден токен бота в переменной окружения TELEGRAM_BOT_TOKEN")
             return False
 
-        # Получаем URL приложения из переменной окружения или используем Render URL
-        app_name = os.getenv('RENDER_APP_NAME')
-        if app_name:
-            webhook_url = f"https://{app_name}.onrender.com/webhook"
-        else:
-            # Если RENDER_APP_NAME не установлен, используем переменную WEBHOOK_URL
-            webhook_url = os.getenv('WEBHOOK_URL')
-            if not webhook_url:
-                logger.error("❌ Не установлены переменные окружения RENDER_APP_NAME или WEBHOOK_URL")
-                return False
-
-        logger.info(f"🔗 Установка webhook: {webhook_url}")
-
-        # Создаем event loop для асинхронного вызова
-        import asyncio
+        webhook_url = get_webhook_url()
+        if not webhook_url:
+            logger.error("❌ Не установлены переменные окружения RENDER_APP_NAME или WEBHOOK_URL")
+            return False
 
-        async def _set_webhook():
+        if bot is None:
             bot = Bot(token=token)
-            return await bot.set_webhook(url=webhook_url)
 
-        # Создаем новый event loop для асинхронного вызова
-        try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            result = loop.run_until_complete(_set_webhook())
-            loop.close()
+        webhook_info = await bot.get_webhook_info()
+        drop_pending = should_drop_pending(webhook_info.pending_update_count)
+        if webhook_matches(webhook_info, webhook_url) and not drop_pending:
+            logger.info(f"✅ Webhook уже установлен с нужными настройками, ожидает обновлений: {webhook_info.pending_update_count}")
+            bot_status['webhook_set'] = True
+            return True
 
-            if result:
-                logger.info("✅ Webhook успешно установлен")
-                bot_status['webhook_set'] = True
-                return True
-            else:
-                logger.error("❌ Не удалось установить webhook")
-                return False
+        logger.info(
+            f"🔗 Установка webhook: {webhook_url} (allowed_updates={ALLOWED_UPDATES}, "
+            f"max_connections={WEBHOOK_MAX_CONNECTIONS}, drop_pending_updates={drop_pending})"
+        )
+        if drop_pending:
+            logger.info(f"🗑️ Отбрасываем накопившиеся обновления: {webhook_info.pending_update_count}")
+        result = await bot.set_webhook(
+            url=webhook_url,
+            allowed_updates=ALLOWED_UPDATES,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            drop_pending_updates=drop_pending,
+            secret_token=WEBHOOK_SECRET
+        )
 
-        except Exception as e:
-            logger.error(f"❌ Ошибка при создании event loop: {e}")
+        if result:
+            get_backend().set_state(WEBHOOK_STATE_KEY, 'secret_fingerprint', get_secret_fingerprint())
+            logger.info("✅ Webhook успешно установлен")
+            bot_status['webhook_set'] = True
+            return True
+        else:
+            logger.error("❌ Не удалось установить webhook")
             return False
 
     except TelegramError as e:
@@ -290,6 +961,20 @@ def set_webhook():
         logger.error(f"❌ Неожиданная ошибка при установке webhook: {e}")
         return False
 
+def set_webhook():
+    """Устанавливает webhook для Telegram бота асинхронно"""
+    # Создаем новый event loop для асинхронного вызова
+    try:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        result = loop.run_until_complete(set_webhook_async())
+        loop.close()
+        return result
+
+    except Exception as e:
+        logger.error(f"❌ Ошибка при создании event loop: {e}")
+        return False
+
 def update_bot_status(running=False, last_update=None):
     """Обновляет статус бота"""
     bot_status['is_running'] = running
@@ -297,6 +982,7 @@ def update_bot_status(running=False, last_update=None):
         bot_status['start_time'] = time.time()
     if last_update:
         bot_status['last_update'] = last_update
+    publish_worker_status(force=True)
 
 def initialize_telegram_app(application):
     """Инициализирует Telegram Application для обработки webhook"""
@@ -315,19 +1001,37 @@ def initialize_telegram_app(application):
 
     logger.info("✅ Telegram Application инициализирован для webhook")
 
-def run_server():
-    """Запускает Flask сервер"""
-    port = int(os.getenv('PORT', 10000))
-    logger.info(f"🚀 Запуск веб-сервера на порту {port}")
-
-    # Устанавливаем webhook при запуске
-    if set_webhook():
+def prepare_server():
+    """Устанавливает webhook и дожидается прогрева перед приемом запросов"""
+    # Устанавливаем webhook при запуске, если он не был установлен параллельно с инициализацией
+    if BOT_MODE == 'polling':
+        logger.info("✅ Сервер health-эндпоинтов готов, обновления получаются через polling")
+    elif bot_status['webhook_set']:
         logger.info("✅ Сервер готов к работе с webhook")
     else:
-        logger.warning("⚠️ Webhook не установлен, но сервер запущен")
+        phase_started = time.perf_counter()
+        webhook_ok = set_webhook()
+        record_startup_phase('set_webhook', phase_started)
+        if webhook_ok:
+            logger.info("✅ Сервер готов к работе с webhook")
+        else:
+            logger.warning("⚠️ Webhook не установлен, но сервер запущен")
+
+    # Ждем прогрева соединений, чтобы первое обновление не платило за DNS и TLS
+    if processing_thread and processing_thread.is_alive():
+        if not processor_ready.wait(timeout=WARMUP_TIMEOUT):
+            logger.warning(f"⚠️ Прогрев не завершился за {WARMUP_TIMEOUT:.0f} с, сервер запускается без него")
 
     # Обновляем статус
     update_bot_status(running=True)
+    mark_startup_ready()
+
+def run_server():
+    """Запускает Flask сервер"""
+    port = int(os.getenv('PORT', 10000))
+    logger.info(f"🚀 Запуск веб-сервера на порту {port}")
+
+    prepare_server()
 
     try:
         # Запускаем сервер
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""
+WSGI-точка входа для запуска нескольких воркеров gunicorn
+
+Каждый воркер поднимает свой Telegram Application и процессор обновлений,
+а пользователи, дедупликация, состояние диалогов и статус хранятся в общем
+бэкенде (STATE_BACKEND=sqlite или redis).
+
+    gunicorn wsgi:app --workers 4 --threads 4 --bind 0.0.0.0:$PORT
+"""
+
+import os
+import logging
+
+from main import bootstrap
+from state_backend import get_backend
+from web_server import app
+
+logger = logging.getLogger(__name__)
+
+if int(os.getenv('WEB_CONCURRENCY', '1')) > 1 and get_backend().name == 'memory':
+    logger.warning("⚠️ Несколько воркеров с STATE_BACKEND=memory: состояние не будет общим, используйте sqlite или redis")
+
+bootstrap()